@@ -0,0 +1,15 @@
+from django.db.backends.sqlite3 import base
+from .schema import DatabaseSchemaEditor
+
+# SQLite with transactions that take the write lock up front (BEGIN IMMEDIATE),
+# so concurrent writers (e.g. two checkouts) wait for each other on the busy
+# timeout instead of failing with "database is locked" when a read lock can't
+# be upgraded. Django's OPTIONS['transaction_mode'] does the same from 5.1 on.
+# Its table rebuilds keep the triggers, see schema.py.
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    SchemaEditorClass = DatabaseSchemaEditor
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,21 @@
+from django.db.backends.sqlite3 import schema
+
+
+class DatabaseSchemaEditor(schema.DatabaseSchemaEditor):
+    def _remake_table(self, model, create_field=None, delete_field=None, alter_fields=None):
+        # SQLite alters most columns by copying the table, dropping it and
+        # renaming the copy: the triggers on the table go with it and the ones
+        # reading it (the menu search index's, see LittleLemonAPI/search.py)
+        # make the rename fail. Set them aside and put them back on the copy.
+        table = model._meta.db_table
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND (tbl_name = %s OR sql LIKE %s)",
+                [table, f'%{self.quote_name(table)}%'],
+            )
+            triggers = cursor.fetchall()
+        for name, _ in triggers:
+            self.execute(f'DROP TRIGGER {self.quote_name(name)}')
+        super()._remake_table(model, create_field, delete_field, alter_fields)
+        for _, sql in triggers:
+            self.execute(sql)
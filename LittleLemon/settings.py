@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'LittleLemonAPI.middleware.server_timing_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,8 +81,18 @@ WSGI_APPLICATION = 'LittleLemon.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # The sqlite3 backend with transactions that take the write lock up
+        # front so concurrent writers (e.g. two checkouts) wait for each other
+        # instead of failing, see LittleLemon/db/base.py
+        'ENGINE': 'LittleLemon.db',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        'TEST': {
+            # The in-memory test database can't be shared between threads
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -130,9 +141,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES' : [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-        'rest_framework_xml.renderers.XMLRenderer',
+        'LittleLemonAPI.renderers.JSONRenderer',
+        'LittleLemonAPI.renderers.BrowsableAPIRenderer',
+        'LittleLemonAPI.renderers.XMLRenderer',
     ],
     'DEFAULT_FILTER_BACKENDS' : [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -140,17 +151,122 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES' : [
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
+        'LittleLemonAPI.authentication.CachedTokenAuthentication',
+        'LittleLemonAPI.authentication.SessionAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS' : 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE' : 3,
     'DEFAULT_THROTTLE_RATES' : {
         'anon' : '2/minute',
         'user' : '5/minute',
+        # Add '<throttle_scope>' : '<rate>' here for views using ScopedTokenBucketThrottle
     }
 }
 
+# SQLite file holding the throttle buckets, shared by all the worker processes
+THROTTLE_DATABASE = BASE_DIR / 'throttle.sqlite3'
+
 DJOSER = {
     'USER_ID_FIELD' : 'username'
-}
\ No newline at end of file
+}
+
+# Largest ?page_size a client can ask for on the keyset paginated lists (menu items, orders)
+MAX_PAGE_SIZE = 100
+
+# Largest list accepted by the bulk endpoints
+BULK_MAX_ITEMS = 500
+
+# Pending orders assigned per transaction by the automatic dispatch (LittleLemonAPI/dispatch.py)
+DISPATCH_BATCH_SIZE = 500
+
+# Delivered orders older than this many days are moved to the archive tables by
+# the archive_orders command, ORDER_ARCHIVE_BATCH_SIZE orders per transaction
+# (LittleLemonAPI/archive.py)
+ORDER_ARCHIVE_AFTER_DAYS = 90
+ORDER_ARCHIVE_BATCH_SIZE = 1000
+
+# Where the carts are kept (LittleLemonAPI/carts.py): 'LittleLemonAPI.carts.DatabaseCart',
+# the Cart table, or 'LittleLemonAPI.carts.CacheCart', an entry of the CART_CACHE_ALIAS
+# cache per customer that expires CART_TIMEOUT seconds after the last change and
+# is written to the Cart table at checkout. CacheCart needs a cache shared by all
+# the workers (Redis, Memcached), LocMemCache is per process.
+CART_BACKEND = 'LittleLemonAPI.carts.DatabaseCart'
+CART_CACHE_ALIAS = 'default'
+CART_TIMEOUT = 60 * 60 * 24
+
+# POST /api/orders/ enqueues a checkout job and answers 202, the process_checkouts
+# command creates the orders in batches of CHECKOUT_BATCH_SIZE jobs, one
+# transaction per batch (LittleLemonAPI/checkout.py). Off, the order is created
+# within the request.
+QUEUED_CHECKOUT = False
+CHECKOUT_BATCH_SIZE = 100
+
+# Where the prerendered menu of /api/menu/ is written (LittleLemonAPI/snapshot.py),
+# and how long (seconds) a process serves it before rendering the menu again to
+# check it, should it have missed a catalog version bump
+MENU_SNAPSHOT_DIR = BASE_DIR / 'menu_snapshot'
+MENU_SNAPSHOT_MAX_AGE = 60
+
+# GET on the menu, cart and order lists reads values() rows instead of model
+# instances and skips the serializers, with the same output (LittleLemonAPI/fastpath.py)
+FAST_LIST_SERIALIZATION = True
+
+# Size of the per-process token -> user cache and how long (seconds) an entry lives,
+# see LittleLemonAPI/authentication.py. Logout, token deletion and deactivation
+# revoke the entries of every process through a per-user generation kept in the
+# AUTH_CACHE_ALIAS cache, which has to be shared by the worker processes (not
+# LocMemCache, `manage.py check --deploy` warns about it). Otherwise the other
+# processes accept the token until their entry expires, TOKEN_CACHE_TIMEOUT later.
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TIMEOUT = 60
+AUTH_CACHE_ALIAS = 'default'
+
+# Seconds a user's group names stay cached in the 'default' cache, see LittleLemonAPI/roles.py.
+# A group change clears the entry in that cache only: with several worker processes
+# it has to be shared (not LocMemCache), else a demoted manager keeps the role in
+# the other processes for up to this long. `manage.py check --deploy` warns about it.
+ROLE_CACHE_TIMEOUT = 300
+
+# Read routes served by the async views (LittleLemonAPI/async_views.py), any of
+# 'menu-items', 'menu-item', 'cart', 'orders', 'order'. Meant for ASGI (LittleLemon/asgi.py),
+# under WSGI every request to an async view runs its own event loop.
+ASYNC_ROUTES = []
+
+# Order change stream (/api/orders/events/, LittleLemonAPI/events.py): the broker
+# class, the seconds between keepalive comments and how long a stream stays open
+# before the client is made to reconnect. LocalBroker only reaches the streams of
+# its own process, several ASGI workers need a shared broker. The stream needs an
+# ASGI server (uvicorn or daphne serving LittleLemon.asgi:application), under WSGI
+# (runserver, wsgi.py) it is cut down to a long poll of at most ORDER_EVENTS_WSGI_MAX_AGE
+# seconds that ends at the first event, each one holding a worker meanwhile.
+ORDER_EVENTS_BROKER = 'LittleLemonAPI.events.LocalBroker'
+ORDER_EVENTS_KEEPALIVE = 15
+ORDER_EVENTS_MAX_AGE = 300
+ORDER_EVENTS_WSGI_MAX_AGE = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Cache alias and timeout (seconds) used for the menu pages, see LittleLemonAPI/catalog.py.
+# The catalog version is kept in that cache too and a menu write bumps it there:
+# with several worker processes the alias has to be a shared cache (not
+# LocMemCache), else the other processes serve their pages, 304s and menu
+# snapshot of before the write (`manage.py check --deploy` warns about it).
+MENU_CACHE_ALIAS = 'default'
+MENU_CACHE_TIMEOUT = 60 * 60
+
+# Per-request instrumentation, see LittleLemonAPI/timing.py. SERVER_TIMING adds the
+# Server-Timing header (query count, DB, auth, roles, throttle, serialization and
+# render time), which any client can read. Every request is also logged as a JSON
+# line on the 'LittleLemonAPI.requests' logger at INFO (give it a handler in LOGGING
+# to keep them), and with REQUEST_METRICS aggregated into per-view histograms
+# served to managers at /api/metrics/.
+SERVER_TIMING = DEBUG
+REQUEST_METRICS = True
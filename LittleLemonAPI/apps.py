@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class LittlelemonapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'LittleLemonAPI'
+
+    def ready(self):
+        # Register the signal handlers and the system checks
+        from django.db.models.signals import post_migrate
+        from . import checks, signals
+        post_migrate.connect(signals.restore_search_index, sender=self)
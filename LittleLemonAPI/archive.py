@@ -0,0 +1,97 @@
+from datetime import timedelta
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import ArchivedOrder, ArchivedOrderItem, CheckoutJob, Order, OrderItem
+
+# Delivered orders older than settings.ORDER_ARCHIVE_AFTER_DAYS move from
+# Order/OrderItem to ArchivedOrder/ArchivedOrderItem, so the order lists, their
+# filters and sorts only go through the recent orders. A batch is one
+# transaction of INSERT ... SELECT and DELETE statements, the rows never travel
+# through Python and no signal is sent: the sales rollups keep counting the
+# archived orders (sales.rebuild reads both tables) and no order event is
+# published, nothing changed for the clients. The history endpoint reads both
+# tables (KeysetPagination.paginate_querysets) and an archived order can still
+# be fetched by its customer (SingleOrderView).
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _columns(model, names):
+    return ', '.join(_quote(model._meta.get_field(name).column) for name in names)
+
+
+ORDER_FIELDS = ['id', 'user', 'delivery_crew', 'status', 'total', 'date', 'updated_at']
+ORDER_ITEM_FIELDS = ['id', 'order', 'menuitem', 'quantity', 'unit_price', 'price']
+
+
+def get_cutoff(days):
+    return timezone.localdate() - timedelta(days=days)
+
+
+def archivable(cutoff):
+    # The orders the next run would archive, the oldest first
+    return Order.objects.filter(status=True, date__lt=cutoff).order_by('pk')
+
+
+def _copy(source, target, fields, where, ids, extra=None):
+    columns = _columns(target, fields)
+    values = _columns(source, fields)
+    params = []
+    if extra is not None:
+        name, value = extra
+        columns += f', {_quote(target._meta.get_field(name).column)}'
+        values += ', %s'
+        params.append(value)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {_quote(target._meta.db_table)} ({columns}) '
+            f'SELECT {values} FROM {_quote(source._meta.db_table)} '
+            f'WHERE {_quote(source._meta.get_field(where).column)} IN ({placeholders})',
+            [*params, *ids],
+        )
+        return cursor.rowcount
+
+
+def _delete(model, where, ids):
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {_quote(model._meta.db_table)} '
+            f'WHERE {_quote(model._meta.get_field(where).column)} IN ({placeholders})',
+            ids,
+        )
+        return cursor.rowcount
+
+
+def archive_batch(cutoff, batch_size):
+    # Moves up to batch_size orders, returns how many
+    with transaction.atomic():
+        # Read within the transaction, an order reopened meanwhile stays where it is
+        ids = list(archivable(cutoff).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        _copy(Order, ArchivedOrder, ORDER_FIELDS, 'id', ids, extra=('archived_at', now))
+        _copy(OrderItem, ArchivedOrderItem, ORDER_ITEM_FIELDS, 'order', ids)
+        # A finished checkout of an archived order has nothing left to report
+        CheckoutJob.objects.filter(order__in=ids).delete()
+        _delete(OrderItem, 'order', ids)
+        _delete(Order, 'id', ids)
+    return len(ids)
+
+
+def archive(days, batch_size=1000, limit=None):
+    # Archives the delivered orders older than days days, batch by batch.
+    # Returns the number of orders archived.
+    cutoff = get_cutoff(days)
+    count = 0
+    while limit is None or count < limit:
+        size = batch_size if limit is None else min(batch_size, limit - count)
+        archived = archive_batch(cutoff, size)
+        count += archived
+        if archived < size:
+            break
+    return count
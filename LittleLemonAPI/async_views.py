@@ -0,0 +1,265 @@
+import asyncio
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from django.utils.functional import classproperty
+from rest_framework import exceptions, generics
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from . import carts, catalog, events, search, views
+from .conditional import make_etag, timestamp, check_preconditions, set_validators
+from .models import ArchivedOrder, Order
+from .pagination import AsyncPageNumberPagination
+from .renderers import EventStreamRenderer
+from .roles import aget_roles, is_customer
+from .serializers import OrderSerializer
+from .timing import timed
+
+# Async versions of the read endpoints. Each view is the one from views.py with
+# an async GET: authentication, roles, cache and queries go through the async
+# cache and ORM, so under ASGI a request holds no thread while it waits on them
+# or on a slow client. Every other method (and OPTIONS) runs the sync view
+# unchanged in a thread. urls.py picks them per route with settings.ASYNC_ROUTES.
+
+
+class AsyncReadMixin:
+    # Handlers are a mix of async (GET) and sync (writes), the view itself is async
+    @classproperty
+    def view_is_async(cls):
+        return True
+
+    async def dispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        handler = getattr(self, method, None) if method in self.http_method_names else None
+        if not iscoroutinefunction(handler):
+            return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+        # APIView.dispatch
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        # APIView.initial
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        # The authenticators run in a thread here are counted once
+        with timed('auth'):
+            await self.aperform_authentication(request)
+        # Resolved now, the permission checks and get_queryset() then don't query
+        await aget_roles(request.user)
+        self.check_permissions(request)
+        if self.throttle_classes:
+            # The buckets are in a local SQLite file, kept off the event loop
+            await sync_to_async(self.check_throttles, thread_sensitive=False)(request)
+
+    async def aperform_authentication(self, request):
+        # Request._authenticate, the authenticators without an async variant run in a thread
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, 'aauthenticate'):
+                    user_auth_tuple = await authenticator.aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+
+        request._not_authenticated()
+
+    async def aget_object(self):
+        # GenericAPIView.get_object
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = await aget_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def afilter_queryset(self, queryset):
+        return self.filter_queryset(queryset)
+
+    async def alist(self, request):
+        # ListModelMixin.list
+        queryset = await self.afilter_queryset(self.get_queryset())
+        if self.use_values():
+            # ValuesListMixin.list
+            queryset = self.values_serializer.get_rows(queryset)
+            serialize = self.values_serializer.to_representation
+        else:
+            serialize = lambda rows: self.get_serializer(rows, many=True).data
+
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            if page is not None:
+                return self.get_paginated_response(serialize(page))
+
+        return Response(serialize([row async for row in queryset]))
+
+
+class MenuItemView(AsyncReadMixin, views.MenuItemView):
+    async def get(self, request, *args, **kwargs):
+        # views.MenuItemView.list
+        key = await catalog.apage_key(request)
+        etag = make_etag(key, request.accepted_media_type)
+        last_modified = await catalog.aget_last_modified()
+        not_modified = check_preconditions(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        data = await catalog.aget_page(key)
+        if data is not None:
+            response = Response(data, headers={'X-Cache': 'HIT'})
+        else:
+            response = await self.alist(request)
+            await catalog.aset_page(key, response.data)
+            response['X-Cache'] = 'MISS'
+        return set_validators(response, etag, last_modified)
+
+    async def afilter_queryset(self, queryset):
+        # FullTextSearchFilter needs to know whether the index exists, checked once per process
+        await search.ais_available(queryset.db)
+        return self.filter_queryset(queryset)
+
+
+class SingleMenuItem(AsyncReadMixin, views.SingleMenuItem):
+    async def get(self, request, *args, **kwargs):
+        # views.SingleMenuItem.retrieve
+        menu_item = await self.aget_object()
+        etag, last_modified = self.get_validators(menu_item)
+        not_modified = check_preconditions(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        serialized_item = self.get_serializer(menu_item)
+        return set_validators(Response(serialized_item.data), etag, last_modified)
+
+
+class CartView(AsyncReadMixin, views.CartView):
+    pagination_class = AsyncPageNumberPagination
+
+    async def get(self, request, *args, **kwargs):
+        cart = carts.get_backend()
+        if cart.in_database:
+            return await self.alist(request)
+
+        # views.CartView.list with the lines from the cache
+        if not is_customer(request.user):
+            raise PermissionDenied("You don't have permission to access this resource.")
+        return self.list_lines(await cart.aget_lines(request.user))
+
+
+class OrderView(AsyncReadMixin, views.OrderView):
+    async def get(self, request, *args, **kwargs):
+        return await self.alist(request)
+
+    async def afilter_queryset(self, queryset):
+        # django-filter checks ?user= against the users table
+        if 'user' in self.request.query_params:
+            return await sync_to_async(self.filter_queryset)(queryset)
+        return self.filter_queryset(queryset)
+
+
+class SingleOrderView(AsyncReadMixin, views.SingleOrderView):
+    async def get(self, request, *args, **kwargs):
+        # views.SingleOrderView.retrieve
+        order = await Order.objects.filter(id=self.kwargs.get('pk')).afirst()
+        order = self._order = order or await aget_object_or_404(ArchivedOrder, id=self.kwargs.get('pk'))
+        if order.user_id != request.user.pk:
+            raise PermissionDenied("You don't have permission to access this resource.")
+
+        etag = make_etag('order', order.pk, order.updated_at.isoformat(), request.accepted_media_type)
+        last_modified = timestamp(order.updated_at)
+        not_modified = check_preconditions(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        if not await views.get_order_items(order).aexists():
+            raise PermissionDenied("No OrderItem matches the given query.")
+        serialized_order = OrderSerializer(order)
+        return set_validators(Response(serialized_order.data), etag, last_modified)
+
+
+class OrderEventsView(AsyncReadMixin, generics.GenericAPIView):
+    # Server-Sent Events of the changes to the orders the user sees in OrderView
+    # and of the user's queued checkouts (see events.py), ?order= keeps the
+    # events of one order. An idle stream is a
+    # subscription and a suspended coroutine, no thread and no database
+    # connection. Only served as an async view, and meant for an ASGI server:
+    # under WSGI Django reads the whole stream before sending any of it and the
+    # worker is held meanwhile, so there the stream is a long poll that ends
+    # after its first event or ORDER_EVENTS_WSGI_MAX_AGE seconds, and the client
+    # reconnects at once.
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [EventStreamRenderer]
+    pagination_class = None
+    # Milliseconds a client waits before reconnecting
+    retry = 3000
+
+    async def get(self, request, *args, **kwargs):
+        order_id = request.query_params.get('order')
+        if order_id is not None:
+            try:
+                order_id = int(order_id)
+            except ValueError:
+                raise ValidationError({'order': 'A whole number is required.'})
+
+        long_poll = not isinstance(request._request, ASGIRequest)
+        response = StreamingHttpResponse(
+            self.stream(events.get_topics(request.user), order_id, long_poll),
+            content_type=f'{EventStreamRenderer.media_type}; charset={EventStreamRenderer.charset}',
+        )
+        response['Cache-Control'] = 'no-cache'
+        # nginx would otherwise hold the events back in its buffer
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, topics, order_id, long_poll=False):
+        broker = events.get_broker()
+        subscription = broker.subscribe(topics)
+        keepalive = getattr(settings, 'ORDER_EVENTS_KEEPALIVE', 15)
+        # Streams end now and then and the clients reconnect, which spreads them
+        # over the workers again
+        loop = asyncio.get_running_loop()
+        max_age = getattr(settings, 'ORDER_EVENTS_MAX_AGE', 300)
+        if long_poll:
+            max_age = min(max_age, getattr(settings, 'ORDER_EVENTS_WSGI_MAX_AGE', 5))
+        deadline = loop.time() + max_age
+        try:
+            yield f'retry: {0 if long_poll else self.retry}\n\n'
+            while (remaining := deadline - loop.time()) > 0:
+                event = await subscription.get(min(keepalive, remaining))
+                if event is None:
+                    # A long poll sends nothing before it ends anyway
+                    if not long_poll:
+                        yield ': keepalive\n\n'
+                    continue
+                name, data = event
+                if order_id is None or (name == 'order' and data['id'] == order_id):
+                    yield events.format_event(name, data)
+                    if long_poll:
+                        break
+        finally:
+            broker.unsubscribe(subscription)
@@ -0,0 +1,190 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import authentication, exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from .timing import timed
+
+# Drop-in replacement for TokenAuthentication that keeps the tokens (with their
+# user) in a bounded, per-process LRU with a TTL, so a warm request doesn't
+# query the Token/User tables. Every user has an auth generation in the AUTH_CACHE_ALIAS
+# cache, logging out, deleting a token or saving the user (deactivation,
+# password change) bumps it and the cached entries of that user are dropped on
+# their next use. Every process sees the bump only if that cache is shared by
+# the workers, with a per-process LocMemCache the other processes keep their
+# entries until TOKEN_CACHE_TIMEOUT. The roles come from roles.get_roles,
+# cached as well.
+
+
+class TokenCache:
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires'] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, token, generation):
+        with self.lock:
+            self.entries[key] = {'token': token, 'generation': generation, 'expires': time.monotonic() + self.timeout}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(
+    getattr(settings, 'TOKEN_CACHE_SIZE', 10_000),
+    getattr(settings, 'TOKEN_CACHE_TIMEOUT', 60),
+)
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_CACHE_ALIAS', 'default')]
+
+
+def _generation_key(user_id):
+    return f'littlelemon:auth:{user_id}'
+
+
+def get_generation(user_id):
+    cache = get_cache()
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the clock, a generation evicted by the cache never comes
+        # back with a value the stale entries carry
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_generation(user_id):
+    cache = get_cache()
+    key = _generation_key(user_id)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, time.time_ns(), None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def _bump_generation(user_id):
+    cache = get_cache()
+    key = _generation_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def invalidate_user_tokens(user_id):
+    # Again once committed: until then the other requests still find the token
+    # (or the active user) and would cache it under the bumped generation
+    _bump_generation(user_id)
+    transaction.on_commit(lambda: _bump_generation(user_id))
+
+
+def _copy(token):
+    # A copy per request, the views may set attributes on request.user
+    token = copy.copy(token)
+    token.user = copy.copy(token.user)
+    return token
+
+
+class TimedAuthenticationMixin:
+    # Counted as 'auth' in the Server-Timing header, see timing.py
+    def authenticate(self, request):
+        with timed('auth'):
+            return super().authenticate(request)
+
+
+class SessionAuthentication(TimedAuthenticationMixin, authentication.SessionAuthentication):
+    pass
+
+
+class CachedTokenAuthentication(TimedAuthenticationMixin, TokenAuthentication):
+    # The generation is read before the token: a revocation landing after it
+    # bumps it past the one stored with the entry, whatever the lookup found
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is not None:
+            user_id = entry['token'].user_id
+        else:
+            user_id = self.get_model().objects.filter(key=key).values_list('user_id', flat=True).first()
+            if user_id is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        generation = get_generation(user_id)
+        if entry is not None and entry['generation'] == generation:
+            token = _copy(entry['token'])
+            return (token.user, token)
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, _copy(token), generation)
+        return (user, token)
+
+    async def aauthenticate(self, request):
+        # authenticate() for the async views, same header checks and errors as TokenAuthentication
+        auth = get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) == 1:
+            msg = _('Invalid token header. No credentials provided.')
+            raise exceptions.AuthenticationFailed(msg)
+        elif len(auth) > 2:
+            msg = _('Invalid token header. Token string should not contain spaces.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            msg = _('Invalid token header. Token string should not contain invalid characters.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        model = self.get_model()
+        entry = token_cache.get(key)
+        if entry is not None:
+            user_id = entry['token'].user_id
+        else:
+            user_id = await model.objects.filter(key=key).values_list('user_id', flat=True).afirst()
+            if user_id is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        generation = await aget_generation(user_id)
+        if entry is not None and entry['generation'] == generation:
+            token = _copy(entry['token'])
+            return (token.user, token)
+
+        try:
+            token = await model.objects.select_related('user').aget(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        token_cache.set(key, _copy(token), generation)
+        return (token.user, token)
@@ -0,0 +1,34 @@
+import math
+import statistics
+from unittest import mock
+from rest_framework.throttling import SimpleRateThrottle
+
+# Helpers shared by the benchmark and load-test management commands
+
+WORDS = [
+    'lemon', 'pasta', 'grilled', 'chicken', 'salad', 'greek', 'bruschetta', 'tomato', 'basil', 'garlic',
+    'olive', 'feta', 'lamb', 'souvlaki', 'baklava', 'honey', 'pistachio', 'cake', 'sorbet', 'espresso',
+]
+
+
+def unthrottled():
+    # The token buckets are still consulted on every request, they just never run out
+    return mock.patch.dict(SimpleRateThrottle.THROTTLE_RATES, {
+        scope: '1000000/s' for scope in SimpleRateThrottle.THROTTLE_RATES
+    })
+
+
+def percentile(timings, fraction):
+    # Nearest rank on sorted timings
+    return timings[max(0, math.ceil(len(timings) * fraction) - 1)]
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        'p50': round(percentile(timings, 0.5), 3),
+        'p95': round(percentile(timings, 0.95), 3),
+        'p99': round(percentile(timings, 0.99), 3),
+        'max': round(timings[-1], 3),
+        'mean': round(statistics.fmean(timings), 3),
+    }
@@ -0,0 +1,261 @@
+import time
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import ValidationError
+from .models import Cart, MenuItem
+
+# Where the customers' carts live, settings.CART_BACKEND. DatabaseCart is the
+# Cart table, every change to a cart is a write. CacheCart keeps a cart as one
+# cache entry per customer that expires CART_TIMEOUT seconds after its last
+# change, so adding to the cart doesn't write to the database and abandoned
+# carts go away by themselves. Its lines reach the Cart table only at checkout
+# (see checkout()), where checkout.place_order picks them up like any cart,
+# and come back to the cache when a queued checkout fails (restore()).
+# Both hand out Cart instances, CartSerializer renders them the same way.
+
+
+class DatabaseCart:
+    in_database = True
+
+    def get_lines(self, user):
+        return Cart.objects.filter(user=user).select_related('menuitem__category')
+
+    async def aget_lines(self, user):
+        return self.get_lines(user)
+
+    def add(self, user, menuitem_id, quantity):
+        # At the menu price, like the batch endpoint and CacheCart
+        item = get_menu_item(menuitem_id)
+        try:
+            with transaction.atomic():
+                return Cart.objects.create(
+                    user=user, menuitem=item, quantity=quantity, unit_price=item.price, price=item.price * quantity
+                )
+        except IntegrityError:
+            raise_already_in_cart()
+
+    def set_quantities(self, user, lines, prices):
+        # {menu item id: quantity}, inserted or overwriting the line of the same menu item
+        carts = [
+            Cart(user=user, menuitem_id=pk, quantity=quantity, unit_price=prices[pk], price=prices[pk] * quantity)
+            for pk, quantity in lines.items()
+        ]
+        with transaction.atomic():
+            # unique_together
+            Cart.objects.bulk_create(
+                carts,
+                update_conflicts=True,
+                unique_fields=['menuitem', 'user'],
+                update_fields=['quantity', 'unit_price', 'price'],
+            )
+
+    def update_quantities(self, user, lines):
+        # Only the lines already in the cart, the unit price stays the one the item was added with
+        with transaction.atomic():
+            carts = {
+                cart.menuitem_id: cart
+                for cart in Cart.objects.select_for_update().filter(user=user, menuitem_id__in=lines)
+            }
+            check_in_cart(lines, carts)
+            for pk, quantity in lines.items():
+                carts[pk].quantity = quantity
+                carts[pk].price = carts[pk].unit_price * quantity
+            Cart.objects.bulk_update(carts.values(), ['quantity', 'price'])
+
+    def remove(self, user, menuitem_ids):
+        Cart.objects.filter(user=user, menuitem_id__in=menuitem_ids).delete()
+
+    def clear(self, user):
+        # False when the cart was already empty
+        carts = Cart.objects.filter(user=user)
+        if not carts.exists():
+            return False
+        carts.delete()
+        return True
+
+    def checkout(self, user, place):
+        # place(user) with the cart in the Cart table, it already is
+        return place(user)
+
+    def restore(self, user):
+        # The cart of a failed queued checkout is still in the Cart table
+        pass
+
+
+class CacheCart:
+    in_database = False
+
+    # The entry is {'next_id': int, 'lines': {menu item id: (line id, quantity, unit price)}},
+    # the line ids stand in for the Cart primary keys in the API. A change reads
+    # the entry, changes it and writes it back, so the changes of a customer take
+    # turns (see locked).
+
+    # Seconds a lock lives should its holder never release it
+    lock_timeout = 5
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'CART_CACHE_ALIAS', 'default')]
+        self.timeout = getattr(settings, 'CART_TIMEOUT', 60 * 60 * 24)
+
+    @contextmanager
+    def locked(self, user):
+        # cache.add only succeeds for one caller until the key is deleted or expires
+        key = f'{self.get_key(user.pk)}:lock'
+        token = uuid.uuid4().hex
+        while not self.cache.add(key, token, self.lock_timeout):
+            time.sleep(0.005)
+        try:
+            yield
+        finally:
+            # Not the lock of the next holder, should this one have outlived the timeout
+            if self.cache.get(key) == token:
+                self.cache.delete(key)
+
+    def get_key(self, user_id):
+        return f'cart:{user_id}'
+
+    def get_entry(self, user):
+        return self.cache.get(self.get_key(user.pk)) or {'next_id': 1, 'lines': {}}
+
+    def set_entry(self, user, entry):
+        if entry['lines']:
+            self.cache.set(self.get_key(user.pk), entry, self.timeout)
+        else:
+            self.cache.delete(self.get_key(user.pk))
+
+    def build(self, user, lines, items):
+        # Lines of menu items deleted since are left out, like the Cart rows they cascade to
+        return [
+            Cart(id=line_id, user=user, menuitem=items[pk], quantity=quantity, unit_price=unit_price,
+                 price=unit_price * quantity)
+            for pk, (line_id, quantity, unit_price) in lines.items()
+            if pk in items
+        ]
+
+    def get_lines(self, user):
+        lines = self.get_entry(user)['lines']
+        if not lines:
+            return []
+        return self.build(user, lines, MenuItem.objects.select_related('category').in_bulk(list(lines)))
+
+    async def aget_lines(self, user):
+        entry = await self.cache.aget(self.get_key(user.pk))
+        if not entry:
+            return []
+        lines = entry['lines']
+        return self.build(user, lines, await MenuItem.objects.select_related('category').ain_bulk(list(lines)))
+
+    def add(self, user, menuitem_id, quantity):
+        item = get_menu_item(menuitem_id)
+        with self.locked(user):
+            entry = self.get_entry(user)
+            if menuitem_id in entry['lines']:
+                raise_already_in_cart()
+
+            line_id = entry['next_id']
+            entry['next_id'] += 1
+            entry['lines'][menuitem_id] = (line_id, quantity, item.price)
+            self.set_entry(user, entry)
+        return self.build(user, {menuitem_id: entry['lines'][menuitem_id]}, {menuitem_id: item})[0]
+
+    def set_quantities(self, user, lines, prices):
+        with self.locked(user):
+            entry = self.get_entry(user)
+            for pk, quantity in lines.items():
+                line_id = entry['lines'][pk][0] if pk in entry['lines'] else None
+                if line_id is None:
+                    line_id = entry['next_id']
+                    entry['next_id'] += 1
+                entry['lines'][pk] = (line_id, quantity, prices[pk])
+            self.set_entry(user, entry)
+
+    def update_quantities(self, user, lines):
+        with self.locked(user):
+            entry = self.get_entry(user)
+            check_in_cart(lines, entry['lines'])
+            for pk, quantity in lines.items():
+                line_id, _, unit_price = entry['lines'][pk]
+                entry['lines'][pk] = (line_id, quantity, unit_price)
+            self.set_entry(user, entry)
+
+    def remove(self, user, menuitem_ids):
+        with self.locked(user):
+            entry = self.get_entry(user)
+            for pk in menuitem_ids:
+                entry['lines'].pop(pk, None)
+            self.set_entry(user, entry)
+
+    def clear(self, user):
+        with self.locked(user):
+            return self.cache.delete(self.get_key(user.pk))
+
+    def checkout(self, user, place):
+        # The lines are written to the Cart table in the transaction of place(user)
+        # and leave the cache once it commits, a failed checkout keeps the cart.
+        # A line changed in the meantime stays in the cache.
+        lines = self.get_entry(user)['lines']
+        with transaction.atomic():
+            if lines:
+                existing = set(MenuItem.objects.filter(pk__in=list(lines)).values_list('pk', flat=True))
+                Cart.objects.bulk_create(
+                    [
+                        Cart(user=user, menuitem_id=pk, quantity=quantity, unit_price=unit_price,
+                             price=unit_price * quantity)
+                        for pk, (_, quantity, unit_price) in lines.items()
+                        if pk in existing
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['menuitem', 'user'],
+                    update_fields=['quantity', 'unit_price', 'price'],
+                )
+                transaction.on_commit(lambda: self.forget(user, lines))
+            return place(user)
+
+    def restore(self, user):
+        # The lines a failed queued checkout left in the Cart table come back to
+        # the cache, where the customer sees and edits the cart. A menu item
+        # added to the cache meanwhile keeps its cached line.
+        rows = Cart.objects.filter(user=user).values_list('menuitem_id', 'quantity', 'unit_price')
+        with self.locked(user):
+            entry = self.get_entry(user)
+            for pk, quantity, unit_price in rows:
+                if pk not in entry['lines']:
+                    entry['lines'][pk] = (entry['next_id'], quantity, unit_price)
+                    entry['next_id'] += 1
+            self.set_entry(user, entry)
+        # After the cache, should the job's transaction roll back the lines are
+        # in both and the next checkout writes the cached ones over the rows
+        Cart.objects.filter(user=user).delete()
+
+    def forget(self, user, flushed):
+        with self.locked(user):
+            entry = self.get_entry(user)
+            for pk, line in flushed.items():
+                if entry['lines'].get(pk) == line:
+                    del entry['lines'][pk]
+            self.set_entry(user, entry)
+
+
+def get_menu_item(pk):
+    item = MenuItem.objects.select_related('category').filter(pk=pk).first()
+    if item is None:
+        raise ValidationError({'menuitem_id': [f"Menu item {pk} does not exist."]})
+    return item
+
+
+def raise_already_in_cart():
+    raise ValidationError({'non_field_errors': ["The fields menuitem, user must make a unique set."]})
+
+
+def check_in_cart(lines, cart):
+    missing = [pk for pk in lines if pk not in cart]
+    if missing:
+        raise ValidationError({'menuitem_id': [f"Menu item {pk} is not in the cart." for pk in missing]})
+
+
+def get_backend():
+    return import_string(getattr(settings, 'CART_BACKEND', 'LittleLemonAPI.carts.DatabaseCart'))()
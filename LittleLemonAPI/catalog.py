@@ -0,0 +1,147 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import caches
+
+# The menu catalog is cached under a version number, any change to a MenuItem
+# or a Category bumps the version so every cached page is dropped at once
+# without having to know which keys exist. The version is only bumped in the
+# MENU_CACHE_ALIAS cache, the worker processes have to share it (see settings).
+VERSION_KEY = 'littlelemon:catalog:version'
+MODIFIED_KEY = 'littlelemon:catalog:modified'
+HITS_KEY = 'littlelemon:catalog:hits'
+MISSES_KEY = 'littlelemon:catalog:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'MENU_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'MENU_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock so an evicted version never comes back with stale pages
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def aget_version():
+    cache = get_cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, time.time_ns(), None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    cache = get_cache()
+    cache.set(MODIFIED_KEY, int(time.time()), None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(VERSION_KEY, version, None)
+        return version
+
+
+def get_last_modified():
+    # Unix timestamp of the last catalog change, if it was evicted assume it just changed
+    cache = get_cache()
+    modified = cache.get(MODIFIED_KEY)
+    if modified is None:
+        cache.add(MODIFIED_KEY, int(time.time()), None)
+        modified = cache.get(MODIFIED_KEY)
+    return modified
+
+
+async def aget_last_modified():
+    cache = get_cache()
+    modified = await cache.aget(MODIFIED_KEY)
+    if modified is None:
+        await cache.aadd(MODIFIED_KEY, int(time.time()), None)
+        modified = await cache.aget(MODIFIED_KEY)
+    return modified
+
+
+def normalize_query(query_params):
+    # ?b=2&a=1 and ?a=1&b=2 are the same page
+    items = []
+    for key, values in sorted(query_params.lists()):
+        for value in sorted(values):
+            items.append((key, value))
+    return urlencode(items)
+
+
+def page_digest(request):
+    # The host is part of the key because pagination links are absolute
+    raw = f'{request.get_host()}{request.path}?{normalize_query(request.query_params)}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def page_key(request):
+    return f'littlelemon:catalog:{get_version()}:{page_digest(request)}'
+
+
+async def apage_key(request):
+    return f'littlelemon:catalog:{await aget_version()}:{page_digest(request)}'
+
+
+def get_page(key):
+    cache = get_cache()
+    data = cache.get(key)
+    _count(HITS_KEY if data is not None else MISSES_KEY)
+    return data
+
+
+def set_page(key, data):
+    get_cache().set(key, data, get_timeout())
+
+
+async def aget_page(key):
+    cache = get_cache()
+    data = await cache.aget(key)
+    await _acount(HITS_KEY if data is not None else MISSES_KEY)
+    return data
+
+
+async def aset_page(key, data):
+    await get_cache().aset(key, data, get_timeout())
+
+
+def _count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+async def _acount(key):
+    cache = get_cache()
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, None):
+            await cache.aincr(key)
+
+
+def get_stats():
+    cache = get_cache()
+    return {
+        'version': get_version(),
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,110 @@
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from . import carts, events, sales
+from .models import Cart, CheckoutJob, Order, OrderItem
+
+
+def copy_cart_to_order(order, user):
+    # INSERT ... SELECT, the cart lines never travel through Python so the
+    # number of queries doesn't depend on the size of the cart
+    order_item_columns = ', '.join(
+        connection.ops.quote_name(OrderItem._meta.get_field(name).column)
+        for name in ('order', 'menuitem', 'quantity', 'unit_price', 'price')
+    )
+    cart_columns = ', '.join(
+        connection.ops.quote_name(Cart._meta.get_field(name).column)
+        for name in ('menuitem', 'quantity', 'unit_price', 'price')
+    )
+    sql = (
+        f'INSERT INTO {connection.ops.quote_name(OrderItem._meta.db_table)} ({order_item_columns}) '
+        f'SELECT %s, {cart_columns} FROM {connection.ops.quote_name(Cart._meta.db_table)} '
+        f'WHERE {connection.ops.quote_name(Cart._meta.get_field("user").column)} = %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [order.pk, user.pk])
+        return cursor.rowcount
+
+
+def place_order(user):
+    # Turns the user's cart into an order, returns None when the cart is empty.
+    # The cart rows are locked first, a concurrent checkout of the same cart
+    # waits for this one and then finds the cart empty.
+    with transaction.atomic():
+        locked = list(Cart.objects.select_for_update().filter(user=user).values_list('pk', flat=True))
+        if not locked:
+            return None
+
+        total = Cart.objects.filter(user=user).aggregate(total=Sum('price'))['total']
+        order = Order.objects.create(user=user, total=total, in_sales=True)
+        copy_cart_to_order(order, user)
+        sales.record_order(order)
+        Cart.objects.filter(user=user).delete()
+    return order
+
+
+# Queued checkout (settings.QUEUED_CHECKOUT): POST /api/orders/ only inserts a
+# CheckoutJob, one small write whatever the cart, and answers 202. The
+# process_checkouts command drains the queue, a batch of jobs is one
+# transaction with a savepoint per job, so at peak the orders are created by a
+# few writers holding the database lock once per batch instead of every
+# request waiting for it. The cart stays where it is until its job runs, a
+# customer editing it meanwhile gets the edited cart ordered.
+
+
+def enqueue(user):
+    # The user's pending job, a new one unless a checkout is already waiting.
+    # None when the cart is empty.
+    if not Cart.objects.filter(user=user).exists():
+        return None
+    try:
+        with transaction.atomic():
+            return CheckoutJob.objects.create(user=user)
+    except IntegrityError:
+        # checkout_job_one_pending, a second click on the checkout button
+        job = CheckoutJob.objects.filter(user=user, status=CheckoutJob.PENDING).first()
+        return job if job is not None else CheckoutJob.objects.create(user=user)
+
+
+def process_batch(batch_size=100):
+    # Runs the oldest pending jobs, returns how many were processed. Several
+    # workers can run it at once: PostgreSQL hands each one other jobs (SKIP
+    # LOCKED), SQLite runs the batches one after the other (the IMMEDIATE
+    # transactions take the write lock before the jobs are read).
+    # An idle worker only reads, the write lock is taken when there is work
+    if not CheckoutJob.objects.filter(status=CheckoutJob.PENDING).exists():
+        return 0
+
+    with transaction.atomic():
+        jobs = CheckoutJob.objects.filter(status=CheckoutJob.PENDING).select_related('user').order_by('pk')
+        if connection.features.has_select_for_update_skip_locked:
+            # Not the users' rows, a customer's other requests don't wait for the worker
+            of = ('self',) if connection.features.has_select_for_update_of else ()
+            jobs = jobs.select_for_update(skip_locked=True, of=of)
+        jobs = list(jobs[:batch_size])
+        if not jobs:
+            return 0
+
+        now = timezone.now()
+        failed = []
+        for job in jobs:
+            try:
+                # place_order's own atomic block is the job's savepoint
+                job.order = place_order(job.user)
+            except Exception as error:
+                # Rolled back to the savepoint, the other jobs of the batch go on
+                job.status, job.error = CheckoutJob.FAILED, str(error)[:255]
+                failed.append(job.user)
+            else:
+                if job.order is None:
+                    job.status, job.error = CheckoutJob.FAILED, 'No items in the Cart'
+                else:
+                    job.status = CheckoutJob.DONE
+            job.processed_at = now
+            events.checkout_processed(job)
+        CheckoutJob.objects.bulk_update(jobs, ['status', 'order', 'error', 'processed_at'])
+        # Their carts go back where the cart backend keeps them
+        cart = carts.get_backend()
+        for user in failed:
+            cart.restore(user)
+    return len(jobs)
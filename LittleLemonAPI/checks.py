@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# State every worker process has to see the same way lives in the cache: when
+# one process drops it (a user leaves the Manager group...), the others have to
+# notice. LocMemCache is per process, with several workers each one keeps its
+# own copy until it expires. Checked by `manage.py check --deploy`.
+
+LOCMEM = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+def get_shared_caches():
+    # Cache alias -> what the workers share through it
+    shared = {'default': ['the roles (ROLE_CACHE_TIMEOUT)']}
+    shared.setdefault(getattr(settings, 'MENU_CACHE_ALIAS', 'default'), []).append(
+        'the menu catalog version (MENU_CACHE_ALIAS)'
+    )
+    shared.setdefault(getattr(settings, 'AUTH_CACHE_ALIAS', 'default'), []).append(
+        'the token revocations (AUTH_CACHE_ALIAS)'
+    )
+    return shared
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    warnings = []
+    for alias, uses in get_shared_caches().items():
+        if settings.CACHES.get(alias, {}).get('BACKEND') == LOCMEM:
+            warnings.append(Warning(
+                f"The '{alias}' cache is a LocMemCache, every worker process has its own: "
+                f"{', '.join(uses)} changed in one process stay stale in the others.",
+                hint='Point it at a cache shared by the workers (Redis, Memcached, database) when running several.',
+                id='LittleLemonAPI.W001',
+            ))
+    return warnings
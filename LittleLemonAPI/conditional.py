@@ -0,0 +1,32 @@
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    # Strong ETag built from whatever identifies the representation
+    digest = hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def timestamp(*values):
+    # Latest of the given datetimes as a Unix timestamp, None values are skipped
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return int(max(values).timestamp())
+
+
+def check_preconditions(request, etag, last_modified=None):
+    # Returns a 304/412 response when the request headers ask for one, None otherwise
+    response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,77 @@
+import heapq
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from . import events
+from .models import Order
+from .roles import DELIVERY_CREW
+
+# Automatic dispatch: the open orders without a delivery crew go, oldest first,
+# to the crew member with the fewest open orders at that point. The load of the
+# crew is one GROUP BY over the open orders (the order_open_crew_date_idx
+# partial index answers it and the backlog query), then kept in memory while the
+# backlog is assigned batch by batch, with one UPDATE per crew member and batch.
+
+
+def get_loads():
+    # {crew member id: open orders}, active crew members without any included
+    crew = User.objects.filter(groups__name=DELIVERY_CREW, is_active=True)
+    loads = dict.fromkeys(crew.values_list('pk', flat=True), 0)
+    counts = (
+        Order.objects.filter(status=False, delivery_crew__in=list(loads))
+        .values_list('delivery_crew').annotate(open_orders=Count('pk')).order_by()
+    )
+    loads.update(counts)
+    return loads
+
+
+def pending_orders():
+    return Order.objects.filter(status=False, delivery_crew__isnull=True).order_by('date', 'pk')
+
+
+def assign(order_ids, heap):
+    # Pops the least loaded crew member for every order, ties go to the lowest id
+    assignments = {}
+    for pk in order_ids:
+        load, crew_id = heap[0]
+        assignments.setdefault(crew_id, []).append(pk)
+        heapq.heapreplace(heap, (load + 1, crew_id))
+    return assignments
+
+
+def dispatch(batch_size=500, limit=None):
+    # Returns the loads before the dispatch and {crew member id: orders assigned}.
+    # An order assigned or closed by someone else in the meantime is skipped by
+    # the UPDATE, that crew member's count then stays a little high until the next run.
+    loads = get_loads()
+    assigned = dict.fromkeys(loads, 0)
+    if not loads:
+        return loads, assigned
+
+    heap = [(load, crew_id) for crew_id, load in loads.items()]
+    heapq.heapify(heap)
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        customers = dict(pending_orders().values_list('pk', 'user')[:size])
+        if not customers:
+            break
+
+        now = timezone.now()
+        count = 0
+        with transaction.atomic():
+            for crew_id, ids in assign(customers, heap).items():
+                updated = pending_orders().filter(pk__in=ids).update(delivery_crew=crew_id, updated_at=now)
+                if updated < len(ids):
+                    ids = Order.objects.filter(pk__in=ids, delivery_crew=crew_id).values_list('pk', flat=True)
+                for pk in ids:
+                    events.order_changed(pk, customers[pk], crew_id, False)
+                assigned[crew_id] += updated
+                count += updated
+        if remaining is not None:
+            remaining -= len(customers)
+        if not count:
+            # Everything in the batch was taken elsewhere, stop rather than spin
+            break
+    return loads, assigned
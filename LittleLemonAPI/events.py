@@ -0,0 +1,147 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from functools import partial
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+from .roles import is_manager, is_delivery_crew
+
+# Order status and assignment changes pushed to the clients of the Server-Sent
+# Events stream (async_views.OrderEventsView) instead of polling the orders.
+#
+# An order change goes to three topics: 'orders' (managers see every order),
+# 'crew.<id>' of its delivery crew and 'user.<id>' of its customer, and a
+# stream listens to the one topic matching what OrderView.get_queryset shows
+# its user. The broker is settings.ORDER_EVENTS_BROKER, by default LocalBroker:
+# subscribers of this process only, enough for one ASGI worker. A broker for
+# several workers (Redis pub/sub, PostgreSQL LISTEN/NOTIFY) implements the same
+# subscribe / unsubscribe / publish.
+
+
+class Subscription:
+    # What an idle stream holds: its topics, its event loop, the undelivered
+    # events (the oldest are dropped past the backlog, a client that fell that
+    # far behind reloads the orders anyway) and the future it waits on
+    __slots__ = ('topics', 'loop', 'events', 'waiter')
+
+    def __init__(self, topics, loop, backlog):
+        self.topics = topics
+        self.loop = loop
+        self.events = deque(maxlen=backlog)
+        self.waiter = None
+
+    def push(self, event):
+        # Runs on the subscriber's loop
+        self.events.append(event)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def get(self, timeout=None):
+        # The next event, None when nothing came within timeout seconds
+        if not self.events:
+            self.waiter = self.loop.create_future()
+            try:
+                await asyncio.wait_for(self.waiter, timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self.waiter = None
+        return self.events.popleft()
+
+
+def _deliver(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.push(event)
+
+
+class LocalBroker:
+    def __init__(self, backlog=100):
+        self.backlog = backlog
+        self.lock = threading.Lock()
+        self.topics = {}
+
+    def subscribe(self, topics):
+        # Called from the subscriber's event loop
+        subscription = Subscription(tuple(topics), asyncio.get_running_loop(), self.backlog)
+        with self.lock:
+            for topic in subscription.topics:
+                self.topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for topic in subscription.topics:
+                subscribers = self.topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.topics[topic]
+
+    def count(self):
+        with self.lock:
+            return len(set().union(*self.topics.values()))
+
+    def publish(self, topics, event):
+        # Callable from any thread: the sync views publish from the thread they
+        # run in, a subscriber gets the event once on its own loop
+        with self.lock:
+            subscriptions = set()
+            for topic in topics:
+                subscriptions.update(self.topics.get(topic, ()))
+        loops = {}
+        for subscription in subscriptions:
+            loops.setdefault(subscription.loop, []).append(subscription)
+        for loop, subscribers in loops.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, subscribers, event)
+            except RuntimeError:
+                # The loop is closed, its streams are gone with it
+                for subscription in subscribers:
+                    self.unsubscribe(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'ORDER_EVENTS_BROKER', 'LittleLemonAPI.events.LocalBroker'))()
+        return _broker
+
+
+def get_topics(user):
+    # The topic of the orders OrderView.get_queryset shows this user
+    if is_manager(user):
+        return ['orders']
+    if is_delivery_crew(user):
+        return [f'crew.{user.pk}']
+    return [f'user.{user.pk}']
+
+
+# Events are (name, data) pairs, the SSE event name and its JSON data
+
+def publish_order(pk, user_id, delivery_crew_id, status):
+    topics = ['orders', f'user.{user_id}']
+    if delivery_crew_id is not None:
+        topics.append(f'crew.{delivery_crew_id}')
+    get_broker().publish(topics, ('order', {'id': pk, 'user': user_id, 'delivery_crew': delivery_crew_id, 'status': status}))
+
+
+def order_changed(pk, user_id, delivery_crew_id, status):
+    # Published once the change is committed, a client reloading the order then sees it
+    transaction.on_commit(partial(publish_order, pk, user_id, delivery_crew_id, status))
+
+
+def checkout_processed(job):
+    # The outcome of a queued checkout, for its customer only
+    data = {'id': job.pk, 'status': job.status, 'order': job.order_id, 'error': job.error}
+    transaction.on_commit(partial(get_broker().publish, [f'user.{job.user_id}'], ('checkout', data)))
+
+
+def format_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
@@ -0,0 +1,64 @@
+from itertools import chain, islice
+from asgiref.sync import sync_to_async
+from .models import ArchivedOrderItem, OrderItem
+
+# The order export of OrderExportView: one row per order item with its order
+# and menu item, read with one query per table (the archived orders of
+# archive.py first) through a chunked iterator (a server-side cursor where the
+# database has them, fetchmany() on SQLite) and written a chunk at a time, so
+# the memory used doesn't depend on the number of rows.
+
+COLUMNS = [
+    'order_id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date',
+    'menuitem_id', 'menuitem', 'quantity', 'unit_price', 'price',
+]
+FIELDS = [
+    'order_id', 'order__user_id', 'order__delivery_crew_id', 'order__status', 'order__total', 'order__date',
+    'menuitem_id', 'menuitem__title', 'quantity', 'unit_price', 'price',
+]
+
+# Rows fetched and written at once
+CHUNK_SIZE = 2000
+
+
+def get_rows(orders, archived_orders=None):
+    # orders is the filtered Order queryset, archived_orders the filtered
+    # ArchivedOrder one, they become subqueries. A list of querysets.
+    rows = [
+        OrderItem.objects.filter(order__in=orders.values('pk'))
+        .order_by('order_id', 'pk')
+        .values_list(*FIELDS)
+    ]
+    if archived_orders is not None:
+        rows.insert(0, (
+            ArchivedOrderItem.objects.filter(order__in=archived_orders.values('pk'))
+            .order_by('order_id', 'pk')
+            .values_list(*FIELDS)
+        ))
+    return rows
+
+
+def iterate(rows, chunk_size):
+    return chain.from_iterable(queryset.iterator(chunk_size=chunk_size) for queryset in rows)
+
+
+def stream(renderer, rows, chunk_size=CHUNK_SIZE):
+    header = renderer.encode_rows(COLUMNS, [], header=True)
+    if header:
+        yield header
+    rows = iterate(rows, chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield renderer.encode_rows(COLUMNS, chunk)
+
+
+async def astream(renderer, rows, chunk_size=CHUNK_SIZE):
+    # stream() for ASGI, Django would read a sync iterator to the end before sending
+    # anything. Each chunk is fetched in a thread (values_list().aiterator() runs
+    # the query on the event loop).
+    header = renderer.encode_rows(COLUMNS, [], header=True)
+    if header:
+        yield header
+    rows = iterate(rows, chunk_size)
+    next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while chunk := await next_chunk():
+        yield renderer.encode_rows(COLUMNS, chunk)
@@ -0,0 +1,133 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import DecimalField, ExpressionWrapper, F
+from rest_framework import fields as drf_fields, relations
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer, SerializerMethodField
+from .serializers import CartSerializer, MenuItemSerializer, OrderSerializer
+from .timing import timed
+
+# Read-only fast path for the list endpoints. A ModelSerializer builds a model
+# instance per row and walks every field of it (nested serializers, method
+# fields) on every row. Here a serializer is compiled once into a list of
+# columns: the queryset is read with values_list(named=True), so the paginators
+# still get attribute access for their cursors, and every row is turned into
+# the same dict the serializer would return. Values go through the serializer's
+# own field.to_representation (skipped for fields that return the value as is)
+# and SerializerMethodFields are computed by the database, so the rendered
+# output is the same bytes.
+
+# Fields whose to_representation returns a value from the database unchanged
+_PASSTHROUGH = (
+    drf_fields.ReadOnlyField, drf_fields.IntegerField, drf_fields.BooleanField, drf_fields.CharField,
+    relations.PrimaryKeyRelatedField,
+)
+
+
+class ValuesSerializer:
+    def __init__(self, serializer_class, computed=None):
+        # computed maps the SerializerMethodFields to an expression (with an
+        # output_field) giving the value the method returns
+        self.serializer_class = serializer_class
+        self.computed = computed or {}
+        self.lookups = []
+        self.annotations = {}
+        self.columns = self.compile(serializer_class(), '')
+
+    def compile(self, serializer, prefix):
+        columns = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            lookup = prefix + field.source.replace('.', '__')
+            if isinstance(field, BaseSerializer):
+                # Nested serializer, None when the relation is empty
+                nested = self.compile(field, f'{lookup}__')
+                columns.append((name, self.add_lookup(f'{lookup}__pk'), None, nested))
+            elif isinstance(field, SerializerMethodField):
+                alias = f'{prefix}{name}_value'
+                expression = self.annotations[alias] = self.computed[prefix + name]
+                columns.append((name, self.add_lookup(alias), self.get_converter(expression), None))
+            else:
+                convert = None if isinstance(field, _PASSTHROUGH) else field.to_representation
+                columns.append((name, self.add_lookup(lookup), convert, None))
+        return columns
+
+    def get_converter(self, expression):
+        # SQLite returns computed decimals as they come out of the float
+        # arithmetic, the model fields come back with their decimal places
+        if isinstance(expression.output_field, DecimalField):
+            quantum = Decimal(1).scaleb(-expression.output_field.decimal_places)
+            return lambda value: value.quantize(quantum)
+        return None
+
+    def add_lookup(self, lookup):
+        if lookup not in self.lookups:
+            self.lookups.append(lookup)
+        return self.lookups.index(lookup)
+
+    def get_rows(self, queryset):
+        # Keyset pagination reads the ordering columns of the last row for its
+        # cursor, the primary key and the annotations (the search relevance) included
+        meta = queryset.model._meta
+        extra = [meta.pk.attname, *queryset.query.annotations]
+        for name in queryset.query.order_by:
+            if isinstance(name, str) and name != '?':
+                name = name.lstrip('-')
+                extra.append(meta.pk.attname if name == 'pk' else name)
+        extra = [name for name in dict.fromkeys(extra) if name not in self.lookups and name not in self.annotations]
+        return queryset.annotate(**self.annotations).values_list(*self.lookups, *extra, named=True)
+
+    def to_representation(self, rows):
+        # Converted values are kept for the call: the same category (its
+        # updated_at), prices and dates repeat across a page, and DRF's
+        # DateTimeField looks the timezone up on every value
+        memo = {}
+        with timed('serialize'):
+            return [self.build(row, self.columns, memo) for row in rows]
+
+    def build(self, row, columns, memo):
+        data = {}
+        for name, index, convert, nested in columns:
+            value = row[index]
+            if value is None:
+                data[name] = None
+            elif nested is not None:
+                data[name] = self.build(row, nested, memo)
+            elif convert is not None:
+                key = (index, value)
+                if key not in memo:
+                    memo[key] = convert(value)
+                data[name] = memo[key]
+            else:
+                data[name] = value
+        return data
+
+
+class ValuesListMixin:
+    # GET list through a ValuesSerializer, for views whose serializer_class has one
+    values_serializer = None
+
+    def use_values(self):
+        return self.values_serializer is not None and getattr(settings, 'FAST_LIST_SERIALIZATION', True)
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_values():
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.values_serializer.get_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.values_serializer.to_representation(page))
+        return Response(self.values_serializer.to_representation(queryset))
+
+
+MENU_ITEMS = ValuesSerializer(MenuItemSerializer)
+
+# get_unit_price returns the stored unit price, get_price unit price * quantity
+CART = ValuesSerializer(CartSerializer, computed={
+    'unit_price': ExpressionWrapper(F('unit_price'), output_field=DecimalField(max_digits=6, decimal_places=2)),
+    'price': ExpressionWrapper(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=20, decimal_places=2)),
+})
+
+ORDERS = ValuesSerializer(OrderSerializer)
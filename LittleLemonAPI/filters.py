@@ -0,0 +1,52 @@
+import django_filters
+from django.db.models import F
+from rest_framework.filters import SearchFilter
+from . import search
+from .models import ArchivedOrder, Order
+
+
+class FullTextSearchFilter(SearchFilter):
+    # ?q= searches the menu through the FTS5 index: every term is a prefix match
+    # on the item or category title and the best matches come first (unless the
+    # client asked for an ?ordering). Without the index it falls back to the
+    # same LIKE lookups as SearchFilter on the view's search_fields.
+    search_param = 'q'
+    search_title = 'Full-text search'
+    search_description = 'Prefix search on the menu item and category titles, best matches first.'
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        if not search.is_available(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+
+        ordered = bool(queryset.query.order_by)
+        queryset = queryset.filter(search_index__document__match=search.build_query(terms))
+        queryset = queryset.annotate(relevance=F('search_index__rank'))
+        if not ordered:
+            # bm25 scores are negative, the lower the better
+            queryset = queryset.order_by('relevance', 'pk')
+        return queryset
+
+
+class OrderExportFilter(django_filters.FilterSet):
+    # ?date_after= and ?date_before= (both inclusive), ?status=, ?user=, ?delivery_crew=
+    date = django_filters.DateFromToRangeFilter()
+
+    class Meta:
+        model = Order
+        fields = ['date', 'status', 'user', 'delivery_crew']
+
+
+class ArchivedOrderExportFilter(OrderExportFilter):
+    # The same filters for the archived orders of the export
+    class Meta(OrderExportFilter.Meta):
+        model = ArchivedOrder
+
+
+class SalesFilter(django_filters.FilterSet):
+    # ?date_after= and ?date_before= (both inclusive). No model, the analytics
+    # endpoint filters both rollup tables with it
+    date = django_filters.DateFromToRangeFilter()
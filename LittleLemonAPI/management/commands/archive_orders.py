@@ -0,0 +1,33 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from LittleLemonAPI import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves the delivered orders older than --days days (settings.ORDER_ARCHIVE_AFTER_DAYS) and their items '
+        'to the archive tables, a batch per transaction (see LittleLemonAPI/archive.py).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 90),
+                            help='Archive the delivered orders older than this many days.')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'ORDER_ARCHIVE_BATCH_SIZE', 1000),
+                            help='Orders archived per transaction.')
+        parser.add_argument('--limit', type=int, help='Archive at most this many orders.')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days must not be negative.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        if options['limit'] is not None and options['limit'] < 1:
+            raise CommandError('--limit must be positive.')
+
+        start = time.perf_counter()
+        count = archive.archive(options['days'], options['batch_size'], options['limit'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Archived {count} orders delivered before {archive.get_cutoff(options["days"])} in {elapsed:.2f} s'
+        )
@@ -0,0 +1,131 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from LittleLemonAPI import archive
+from LittleLemonAPI.benchmarks import percentile, unthrottled
+from LittleLemonAPI.models import Category, MenuItem, Order, OrderItem
+from LittleLemonAPI.roles import MANAGER
+
+# The manager's order lists on a large order history, before and after the
+# delivered orders older than --days moved to the archive tables. Runs on a
+# throwaway test database.
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds an order history spread over two years, times the manager's order lists, archives the delivered "
+        'orders older than --days and times them again. Runs on a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 90))
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'ORDER_ARCHIVE_BATCH_SIZE', 1000))
+        parser.add_argument('--requests', type=int, default=50, help='Requests per list.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['orders'] < 1 or options['customers'] < 1:
+            raise CommandError('--orders and --customers must be positive.')
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), unthrottled():
+                self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        start = time.perf_counter()
+        customers, token = self.seed(rng, options)
+        self.stdout.write(f'Seeded {options["orders"]} orders in {time.perf_counter() - start:.1f} s')
+
+        customer = rng.choice(customers)
+        lists = [
+            ('orders', '/api/orders/'),
+            ('orders by total', '/api/orders/?ordering=-total'),
+            ('open orders', '/api/orders/?status=false'),
+            ('orders of a customer', f'/api/orders/?user={customer}'),
+            ('history', '/api/orders/history/'),
+            ('history of a customer', f'/api/orders/history/?user={customer}'),
+        ]
+        client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+
+        before = self.time_lists(client, lists, options['requests'])
+        start = time.perf_counter()
+        count = archive.archive(options['days'], batch_size=options['batch_size'])
+        self.stdout.write(
+            f'Archived {count} orders older than {options["days"]} days in {time.perf_counter() - start:.1f} s, '
+            f'{Order.objects.count()} left'
+        )
+        after = self.time_lists(client, lists, options['requests'])
+
+        self.stdout.write(f'{"list":<24} {"before p50":>11} {"p95":>9} {"after p50":>11} {"p95":>9}')
+        for name, _ in lists:
+            self.stdout.write(
+                f'{name:<24} {statistics.median(before[name]):>9.1f}ms {percentile(before[name], 0.95):>7.1f}ms '
+                f'{statistics.median(after[name]):>9.1f}ms {percentile(after[name], 0.95):>7.1f}ms'
+            )
+
+    def seed(self, rng, options):
+        with transaction.atomic():
+            manager = User.objects.create_user(username='benchmark-manager')
+            manager.groups.add(Group.objects.create(name=MANAGER))
+            token = Token.objects.create(user=manager).key
+            User.objects.bulk_create([User(username=f'benchmark-{i}') for i in range(options['customers'])])
+            customers = list(User.objects.filter(username__startswith='benchmark-', groups=None).values_list('pk', flat=True))
+            category = Category.objects.create(slug='benchmark', title='Benchmark')
+            menu = MenuItem.objects.bulk_create([
+                MenuItem(title=f'Benchmark {i}', price=2 + i % 38, featured=False, category=category) for i in range(100)
+            ])
+
+        # Two years of orders, the last few days still open now and then
+        today = timezone.localdate()
+        now = timezone.now()
+        done = 0
+        # Order.date is auto_now_add, bulk_create would date them all today
+        with mock.patch.object(Order._meta.get_field('date'), 'auto_now_add', False):
+            while done < options['orders']:
+                done += self.seed_orders(rng, customers, menu, today, now, min(10_000, options['orders'] - done))
+        return customers, token
+
+    def seed_orders(self, rng, customers, menu, today, now, size):
+        with transaction.atomic():
+            orders = []
+            for _ in range(size):
+                age = rng.randrange(730)
+                orders.append(Order(
+                    user_id=rng.choice(customers), status=age > 7 or rng.random() < 0.5,
+                    total=rng.randint(2, 200), date=today - timedelta(days=age), updated_at=now,
+                ))
+            Order.objects.bulk_create(orders)
+            items = []
+            for order in orders:
+                item = rng.choice(menu)
+                items.append(OrderItem(order=order, menuitem=item, quantity=1, unit_price=item.price, price=item.price))
+            OrderItem.objects.bulk_create(items)
+        return size
+
+    def time_lists(self, client, lists, requests):
+        timings = {}
+        for name, url in lists:
+            timings[name] = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = client.get(url)
+                timings[name].append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f'{url} answered {response.status_code}')
+            timings[name].sort()
+        return timings
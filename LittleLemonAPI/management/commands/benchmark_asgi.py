@@ -0,0 +1,190 @@
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from LittleLemonAPI.authentication import token_cache
+from LittleLemonAPI.benchmarks import percentile, unthrottled
+from LittleLemonAPI.models import Category, MenuItem, Cart, Order, OrderItem
+from LittleLemonAPI.urls import ASYNC_ROUTES, get_api_urlconf
+
+# (name, server, async routes): the sync views behind a threaded WSGI server,
+# the same views behind ASGI (each request runs in its own thread), and the
+# async views behind ASGI. A WSGI worker thread is held until the client has
+# read the whole response, so with slow clients it tops out at threads/delay
+# requests per second; under ASGI only the CPU time counts. Django's async ORM
+# and caches still run every call in a thread, so with fast clients WSGI wins.
+MODES = [
+    ('wsgi', 'wsgi', []),
+    ('asgi-sync-views', 'asgi', []),
+    ('asgi', 'asgi', ASYNC_ROUTES),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the read endpoints served by the sync views under WSGI with the async views under ASGI, '
+        'in process, with slow clients. The generated data is deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--clients', type=int, default=200, help='Concurrent clients.')
+        parser.add_argument('--threads', type=int, default=8, help='Worker threads of the WSGI server.')
+        parser.add_argument('--client-delay', type=float, default=200, help='Milliseconds a client takes to read a response.')
+        parser.add_argument('--items', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=50)
+        parser.add_argument('--modes', nargs='+', choices=[name for name, _, _ in MODES], default=[name for name, _, _ in MODES])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # The other servers run in other threads, the data has to be committed
+        user, category = self.seed(rng, options['items'], options['orders'])
+        try:
+            urls = self.get_urls(rng, user, options['requests'])
+            headers = [('authorization', f'Token {Token.objects.get(user=user).key}')]
+            # Measure the views, not the throttles
+            with unthrottled():
+                for name, server, async_routes in MODES:
+                    if name not in options['modes']:
+                        continue
+                    token_cache.clear()
+                    with override_settings(ROOT_URLCONF=get_api_urlconf(async_routes)):
+                        run = self.run_wsgi if server == 'wsgi' else self.run_asgi
+                        self.report(name, options, *asyncio.run(run(urls, headers, options)))
+        finally:
+            user.delete()
+            MenuItem.objects.filter(category=category).delete()
+            category.delete()
+
+    def seed(self, rng, items, orders):
+        user = User.objects.create_user(username=f'benchmark-{time.time_ns()}')
+        Token.objects.create(user=user)
+        with transaction.atomic():
+            category = Category.objects.create(slug=f'benchmark-{time.time_ns()}', title=f'Benchmark {time.time_ns()}')
+            menu = MenuItem.objects.bulk_create([
+                MenuItem(title=f'Benchmark {category.pk} {i}', price=rng.randint(2, 40), featured=i % 7 == 0, category=category)
+                for i in range(items)
+            ])
+            Cart.objects.bulk_create([
+                Cart(user=user, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+                for item in rng.sample(menu, 3)
+            ])
+            for _ in range(orders):
+                lines = rng.sample(menu, 3)
+                order = Order.objects.create(user=user, total=sum(item.price for item in lines))
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+                    for item in lines
+                ])
+        return user, category
+
+    def get_urls(self, rng, user, count):
+        items = list(MenuItem.objects.filter(category__title__startswith='Benchmark').values_list('pk', flat=True))
+        orders = list(Order.objects.filter(user=user).values_list('pk', flat=True))
+        choices = [
+            lambda: f'/api/menu-items/?page_size={rng.randint(5, 20)}',
+            lambda: f'/api/menu-items/{rng.choice(items)}',
+            lambda: '/api/cart/menu-items/',
+            lambda: '/api/orders/',
+            lambda: f'/api/orders/{rng.choice(orders)}',
+        ]
+        return [rng.choice(choices)() for _ in range(count)]
+
+    async def run_wsgi(self, urls, headers, options):
+        handler = WSGIHandler()
+        delay = options['client_delay'] / 1000
+
+        def request(url):
+            path, _, query = url.partition('?')
+            environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'REQUEST_METHOD': 'GET'}
+            for name, value in headers:
+                environ[f'HTTP_{name.upper()}'] = value
+            setup_testing_defaults(environ)
+            statuses = []
+            body = handler(environ, lambda status, response_headers: statuses.append(int(status[:3])))
+            try:
+                for _ in body:
+                    # The worker thread is busy writing to the slow client
+                    time.sleep(delay)
+            finally:
+                body.close()
+            return statuses[0]
+
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(options['threads']) as pool:
+            return await self.load(urls, options['clients'], lambda url: loop.run_in_executor(pool, request, url))
+
+    async def run_asgi(self, urls, headers, options):
+        application = ASGIHandler()
+        delay = options['client_delay'] / 1000
+        encoded = [(name.encode(), value.encode()) for name, value in headers]
+
+        async def request(url):
+            path, _, query = url.partition('?')
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'headers': [(b'host', b'127.0.0.1'), *encoded],
+                'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 80),
+            }
+            done = asyncio.Event()
+            statuses = []
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await done.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+                elif message['type'] == 'http.response.body':
+                    # Only this request waits on the slow client
+                    await asyncio.sleep(delay)
+                    if not message.get('more_body'):
+                        done.set()
+
+            await application(scope, receive, send)
+            done.set()
+            return statuses[0]
+
+        return await self.load(urls, options['clients'], request)
+
+    async def load(self, urls, clients, request):
+        # Every client sends its share of the requests one after the other
+        timings = []
+        errors = 0
+
+        async def client(share):
+            nonlocal errors
+            for url in share:
+                start = time.perf_counter()
+                status = await request(url)
+                timings.append((time.perf_counter() - start) * 1000)
+                errors += status >= 400
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(urls[i::clients]) for i in range(clients)))
+        return time.perf_counter() - start, sorted(timings), errors
+
+    def report(self, name, options, elapsed, timings, errors):
+        self.stdout.write(
+            f'{name}: {len(timings)} requests from {options["clients"]} clients in {elapsed:.2f} s, '
+            f'{len(timings) / elapsed:.0f} req/s, '
+            f'p50 {statistics.median(timings):.1f} ms, '
+            f'p95 {percentile(timings, 0.95):.1f} ms, '
+            f'max {timings[-1]:.1f} ms, '
+            f'{errors} errors'
+        )
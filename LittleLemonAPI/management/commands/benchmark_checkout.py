@@ -0,0 +1,157 @@
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from LittleLemonAPI.authentication import token_cache
+from LittleLemonAPI.benchmarks import percentile, unthrottled
+from LittleLemonAPI.models import Category, MenuItem, Cart, CheckoutJob
+from LittleLemonAPI.urls import get_api_urlconf
+
+# Checkout bursts: every client checks its cart out at the same moment, round
+# after round, against a threaded WSGI server on the real database. 'sync' creates
+# the order within the request, 'queued' enqueues a job (settings.QUEUED_CHECKOUT)
+# and the process_checkouts command, in another process, creates the orders in
+# batches. A round of 'queued' lasts until the orders exist, the time from the
+# 202 to the order is reported as well.
+MODES = ['sync', 'queued']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the synchronous checkout with the queued checkout under bursts of concurrent clients, '
+        'in process. The generated customers, menu and orders are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200, help='Concurrent clients, each one a customer.')
+        parser.add_argument('--rounds', type=int, default=5, help='Checkouts per client.')
+        parser.add_argument('--threads', type=int, default=64, help='Worker threads of the WSGI server.')
+        parser.add_argument('--workers', type=int, default=1, help='Worker threads of process_checkouts.')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--lines', type=int, default=5, help='Lines in every cart.')
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # The server and the workers run in other threads, the data has to be committed
+        users, menu, category = self.seed(options['clients'])
+        try:
+            tokens = dict(Token.objects.filter(user__in=users).values_list('user', 'key'))
+            with unthrottled(), override_settings(ROOT_URLCONF=get_api_urlconf([])):
+                for name in MODES:
+                    if name not in options['modes']:
+                        continue
+                    token_cache.clear()
+                    timings, errors, elapsed = [], 0, 0
+                    workers = self.start_workers(options) if name == 'queued' else None
+                    try:
+                        for _ in range(options['rounds']):
+                            self.fill_carts(rng, users, menu, options['lines'])
+                            with override_settings(QUEUED_CHECKOUT=name == 'queued'):
+                                result = self.run(name, users, tokens, options)
+                            timings += result[0]
+                            errors += result[1]
+                            elapsed += result[2]
+                    finally:
+                        if workers is not None:
+                            workers.send_signal(signal.SIGINT)
+                            workers.wait()
+                    self.report(name, options, elapsed, sorted(timings), errors, self.get_completion(users))
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+            MenuItem.objects.filter(category=category).delete()
+            category.delete()
+
+    def seed(self, clients):
+        prefix = f'benchmark-{time.time_ns()}'
+        with transaction.atomic():
+            User.objects.bulk_create([User(username=f'{prefix}-{i}') for i in range(clients)])
+            users = list(User.objects.filter(username__startswith=prefix))
+            Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in users])
+            category = Category.objects.create(slug=prefix, title=f'Benchmark {prefix}')
+            menu = MenuItem.objects.bulk_create([
+                MenuItem(title=f'Benchmark {category.pk} {i}', price=2 + i % 38, featured=False, category=category) for i in range(100)
+            ])
+        return users, menu, category
+
+    def start_workers(self, options):
+        # The process_checkouts command in its own process, like in production
+        return subprocess.Popen(
+            [
+                sys.executable, 'manage.py', 'process_checkouts', '--workers', str(options['workers']),
+                '--batch-size', str(options['batch_size']), '--poll', '0.01',
+            ],
+            cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL,
+        )
+
+    def fill_carts(self, rng, users, menu, lines):
+        Cart.objects.filter(user__in=users).delete()
+        Cart.objects.bulk_create([
+            Cart(user=user, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+            for user in users for item in rng.sample(menu, lines)
+        ])
+
+    def run(self, name, users, tokens, options):
+        handler = WSGIHandler()
+
+        def request(user):
+            environ = {
+                'PATH_INFO': '/api/orders/', 'REQUEST_METHOD': 'POST', 'CONTENT_LENGTH': '0',
+                'HTTP_AUTHORIZATION': f'Token {tokens[user.pk]}',
+            }
+            setup_testing_defaults(environ)
+            statuses = []
+            start = time.perf_counter()
+            body = handler(environ, lambda status, response_headers: statuses.append(int(status[:3])))
+            try:
+                b''.join(body)
+            finally:
+                body.close()
+            return (time.perf_counter() - start) * 1000, statuses[0]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as pool:
+            results = list(pool.map(request, users))
+        elapsed = time.perf_counter() - start
+        if name == 'queued':
+            # Until the workers have created the orders
+            while CheckoutJob.objects.filter(user__in=users, status=CheckoutJob.PENDING).exists():
+                time.sleep(0.005)
+            elapsed = time.perf_counter() - start
+
+        timings = [timing for timing, _ in results]
+        errors = sum(status >= 400 for _, status in results)
+        return timings, errors, elapsed
+
+    def get_completion(self, users):
+        # From the 202 to the order, per job, only the queued mode has jobs
+        jobs = CheckoutJob.objects.filter(user__in=users, processed_at__isnull=False)
+        return sorted(
+            (processed_at - created_at).total_seconds() * 1000
+            for created_at, processed_at in jobs.values_list('created_at', 'processed_at')
+        )
+
+    def report(self, name, options, elapsed, timings, errors, completion):
+        line = (
+            f'{name}: {len(timings)} checkouts from {options["clients"]} clients in {elapsed:.2f} s, '
+            f'{len(timings) / elapsed:.0f} orders/s, '
+            f'response p50 {statistics.median(timings):.1f} ms, '
+            f'p95 {percentile(timings, 0.95):.1f} ms, '
+            f'max {timings[-1]:.1f} ms, '
+            f'{errors} errors'
+        )
+        if completion:
+            line += f', order ready p50 {statistics.median(completion):.1f} ms, p95 {percentile(completion, 0.95):.1f} ms'
+        self.stdout.write(line)
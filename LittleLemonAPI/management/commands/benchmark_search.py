@@ -0,0 +1,79 @@
+import random
+import statistics
+import time
+from itertools import product
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from LittleLemonAPI import search
+from LittleLemonAPI.benchmarks import WORDS, percentile
+from LittleLemonAPI.models import Category, MenuItem
+
+
+class Command(BaseCommand):
+    help = 'Compares the FTS5 menu search with the LIKE based search on a generated menu (rolled back afterwards).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            self.stderr.write('The full-text index is not available on this database, run migrate on SQLite first.')
+            return
+
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            self.seed(rng, options['items'])
+            # Common terms match a large part of the menu, rare ones (an item number) a single row
+            term_sets = {
+                'common': [rng.choice(WORDS)[:rng.randint(3, 6)] for _ in range(options['queries'])],
+                'rare': [str(rng.randrange(options['items'])) for _ in range(options['queries'])],
+            }
+            page_size = options['page_size']
+
+            def fulltext(term):
+                return list(
+                    MenuItem.objects.filter(search_index__document__match=search.build_query([term]))
+                    .annotate(relevance=F('search_index__rank'))
+                    .order_by('relevance', 'pk')[:page_size]
+                )
+
+            def contains(term):
+                return list(
+                    MenuItem.objects.filter(Q(title__icontains=term) | Q(category__title__icontains=term))
+                    .order_by('pk')[:page_size]
+                )
+
+            for (kind, terms), (name, run) in product(term_sets.items(), (('fts5', fulltext), ('like', contains))):
+                timings = []
+                for term in terms:
+                    start = time.perf_counter()
+                    run(term)
+                    timings.append((time.perf_counter() - start) * 1000)
+                timings.sort()
+                self.stdout.write(
+                    f'{name} {kind}: {len(timings)} queries on {options["items"]} items, '
+                    f'p50 {statistics.median(timings):.2f} ms, '
+                    f'p95 {percentile(timings, 0.95):.2f} ms, '
+                    f'max {timings[-1]:.2f} ms'
+                )
+
+            # Nothing generated here is kept
+            transaction.set_rollback(True)
+
+    def seed(self, rng, count):
+        categories = [
+            Category.objects.create(slug=f'benchmark-{i}', title=f'Benchmark {rng.choice(WORDS)} {i}')
+            for i in range(20)
+        ]
+        batch = []
+        for i in range(count):
+            title = ' '.join(rng.sample(WORDS, 3)) + f' {i}'
+            batch.append(MenuItem(title=title, price=rng.randint(2, 40), featured=False, category=rng.choice(categories)))
+            if len(batch) == 5000:
+                MenuItem.objects.bulk_create(batch)
+                batch = []
+        MenuItem.objects.bulk_create(batch)
@@ -0,0 +1,84 @@
+import random
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from LittleLemonAPI import fastpath
+from LittleLemonAPI.benchmarks import WORDS
+from LittleLemonAPI.models import Category, MenuItem, Cart, Order
+from LittleLemonAPI.renderers import JSONRenderer
+from LittleLemonAPI.serializers import MenuItemSerializer, CartSerializer, OrderSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the serializers with the values() fast path of the list endpoints (fastpath.py) '
+        'on generated rows, checks both render the same JSON (rolled back afterwards).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            user = self.seed(rng, options['rows'])
+            cases = [
+                ('menu items', MenuItemSerializer, fastpath.MENU_ITEMS, MenuItem.objects.select_related('category').order_by('pk')),
+                ('cart', CartSerializer, fastpath.CART, Cart.objects.filter(user=user).select_related('menuitem__category').order_by('pk')),
+                ('orders', OrderSerializer, fastpath.ORDERS, Order.objects.filter(user=user).order_by('pk')),
+            ]
+            renderer = JSONRenderer()
+            for name, serializer_class, values, queryset in cases:
+                def serializers():
+                    return serializer_class(list(queryset), many=True).data
+
+                def fast():
+                    return values.to_representation(values.get_rows(queryset))
+
+                if renderer.render(serializers()) != renderer.render(fast()):
+                    raise CommandError(f'{name}: the fast path renders different JSON.')
+
+                self.stdout.write(f'{name}: {queryset.count()} rows, same JSON')
+                for label, run in (('serializers', serializers), ('fast path', fast)):
+                    read, render = self.measure(run, renderer, options['repeat'])
+                    self.stdout.write(f'  {label:<12} query + serialization {read:7.1f} ms, JSON rendering {render:7.1f} ms')
+
+            # Nothing generated here is kept
+            transaction.set_rollback(True)
+
+    def measure(self, run, renderer, repeat):
+        # Medians of the runs
+        reads, renders = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = run()
+            middle = time.perf_counter()
+            renderer.render(data)
+            reads.append((middle - start) * 1000)
+            renders.append((time.perf_counter() - middle) * 1000)
+        return statistics.median(reads), statistics.median(renders)
+
+    def seed(self, rng, rows):
+        # A single customer with a cart line per menu item and as many orders
+        user = User.objects.create_user(username=f'benchmark-{time.time_ns()}')
+        category = Category.objects.create(slug=f'benchmark-{time.time_ns()}', title=f'Benchmark {time.time_ns()}')
+        MenuItem.objects.bulk_create([
+            MenuItem(
+                title=f'{" ".join(rng.sample(WORDS, 3))} {i}', price=f'{rng.randint(2, 40)}.{rng.randint(0, 99):02}',
+                featured=i % 7 == 0, category=category,
+            )
+            for i in range(rows)
+        ], batch_size=5000)
+        Cart.objects.bulk_create([
+            Cart(user=user, menuitem=item, quantity=rng.randint(1, 5), unit_price=item.price, price=item.price)
+            for item in MenuItem.objects.filter(category=category)
+        ], batch_size=5000)
+        Order.objects.bulk_create([
+            Order(user=user, total=f'{rng.randint(5, 200)}.{rng.randint(0, 99):02}', status=i % 2 == 0)
+            for i in range(rows)
+        ], batch_size=5000)
+        return user
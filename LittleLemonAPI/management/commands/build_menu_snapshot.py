@@ -0,0 +1,17 @@
+import time
+from django.core.management.base import BaseCommand
+from LittleLemonAPI import snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Renders the menu snapshot of the current catalog version (LittleLemonAPI/snapshot.py) unless it is '
+        'already on disk, so the first request to /api/menu/ after a deploy does not have to.'
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        menu = snapshot.get_snapshot()
+        elapsed = time.perf_counter() - start
+        sizes = ', '.join(f'{encoding or "identity"} {len(body)} bytes' for encoding, body in menu.bodies.items())
+        self.stdout.write(f'Menu snapshot of catalog version {menu.version} ready in {elapsed:.2f} s ({sizes})')
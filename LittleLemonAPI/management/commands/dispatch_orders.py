@@ -0,0 +1,34 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from LittleLemonAPI import dispatch
+
+
+class Command(BaseCommand):
+    help = (
+        'Assigns the open orders without a delivery crew to the crew members with the fewest open orders, '
+        'oldest orders first, in batches (see LittleLemonAPI/dispatch.py).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'DISPATCH_BATCH_SIZE', 500),
+                            help='Orders assigned per transaction.')
+        parser.add_argument('--limit', type=int, help='Dispatch at most this many orders.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        if options['limit'] is not None and options['limit'] < 1:
+            raise CommandError('--limit must be positive.')
+
+        start = time.perf_counter()
+        loads, assigned = dispatch.dispatch(options['batch_size'], options['limit'])
+        elapsed = time.perf_counter() - start
+        if not loads:
+            raise CommandError('There is no delivery crew to dispatch to.')
+
+        total = sum(assigned.values())
+        self.stdout.write(f'Dispatched {total} orders to {len(loads)} crew members in {elapsed:.2f} s')
+        if options['verbosity'] > 1:
+            for crew_id in sorted(loads):
+                self.stdout.write(f'  crew {crew_id}: {loads[crew_id]} -> {loads[crew_id] + assigned[crew_id]} open orders')
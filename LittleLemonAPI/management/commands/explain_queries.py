@@ -0,0 +1,60 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+from LittleLemonAPI import views
+from LittleLemonAPI.roles import MANAGER, DELIVERY_CREW, set_roles
+
+# (label, view, url, role) for the list endpoints, roughly what clients send
+SCENARIOS = [
+    ('menu items', views.MenuItemView, '/api/menu-items/', None),
+    ('menu items by price', views.MenuItemView, '/api/menu-items/?ordering=price', None),
+    ('menu items filtered', views.MenuItemView, '/api/menu-items/?featured=true&from_price=5&to_price=20&ordering=price', None),
+    ('menu items by category', views.MenuItemView, '/api/menu-items/?category=mains', None),
+    ('menu items by category and price', views.MenuItemView, '/api/menu-items/?category=mains&from_price=5&ordering=price', None),
+    ('menu items search', views.MenuItemView, '/api/menu-items/?search=pasta', None),
+    ('menu items full-text search', views.MenuItemView, '/api/menu-items/?q=pasta', None),
+    ('cart', views.CartView, '/api/cart/menu-items/', ''),
+    ('orders (customer)', views.OrderView, '/api/orders/', ''),
+    ('orders (customer) by total', views.OrderView, '/api/orders/?ordering=-total', ''),
+    ('orders (delivery crew)', views.OrderView, '/api/orders/', DELIVERY_CREW),
+    ('orders (delivery crew) open', views.OrderView, '/api/orders/?status=false', DELIVERY_CREW),
+    ('orders (manager)', views.OrderView, '/api/orders/', MANAGER),
+    ('orders (manager) open', views.OrderView, '/api/orders/?status=false', MANAGER),
+    ('orders (manager) delivered, newest first', views.OrderView, '/api/orders/?status=true&ordering=-date', MANAGER),
+]
+
+
+class Command(BaseCommand):
+    help = "Prints the query plan of every list view's page query, to check which indexes they use."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sql', action='store_true', help='Print the SQL as well.')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        for label, view_class, url, role in SCENARIOS:
+            request = factory.get(url)
+            if role is not None:
+                # An unsaved user with pinned roles, nothing is read from or written to the database
+                user = set_roles(User(pk=1, username='explain'), [role] if role else [])
+                force_authenticate(request, user)
+
+            view = view_class()
+            view.setup(request)
+            view.request = view.initialize_request(request)
+            view.format_kwarg = None
+            queryset = view.filter_queryset(view.get_queryset())
+
+            # The query the paginator runs for the first page
+            paginator = view.paginator
+            if paginator is not None and hasattr(paginator, 'get_keyset_ordering'):
+                queryset = queryset.order_by(*paginator.get_keyset_ordering(queryset))
+                queryset = queryset[:paginator.get_page_size(view.request) + 1]
+            elif paginator is not None:
+                queryset = queryset[:paginator.get_page_size(view.request)]
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{label}: GET {url}'))
+            if options['sql']:
+                self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain())
+            self.stdout.write('')
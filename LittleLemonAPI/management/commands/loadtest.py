@@ -0,0 +1,600 @@
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timezone
+import django
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from rest_framework.authtoken.models import Token
+from LittleLemonAPI import sales
+from LittleLemonAPI.benchmarks import WORDS, summarize, unthrottled
+from LittleLemonAPI.models import Category, MenuItem, Cart, Order, OrderItem, CheckoutJob
+from LittleLemonAPI.roles import MANAGER, DELIVERY_CREW
+
+PASSWORD = 'lemon@123'
+
+
+class Dataset:
+    # Users, menu and orders the scenarios draw their requests from, every
+    # name carries the run's prefix so a run can share a database with others
+    def __init__(self, rng, options):
+        self.rng = rng
+        self.prefix = f'loadtest-{time.time_ns():x}'
+        self.requests = options['requests']
+
+        password = make_password(PASSWORD)
+        manager_group, _ = Group.objects.get_or_create(name=MANAGER)
+        crew_group, _ = Group.objects.get_or_create(name=DELIVERY_CREW)
+
+        def create_users(kind, count, group=None):
+            users = User.objects.bulk_create([
+                User(username=f'{self.prefix}-{kind}-{i}', password=password) for i in range(count)
+            ])
+            if group is not None:
+                User.groups.through.objects.bulk_create([
+                    User.groups.through(user_id=user.pk, group_id=group.pk) for user in users
+                ])
+            return users
+
+        self.customers = create_users('customer', options['customers'])
+        self.managers = create_users('manager', 2, manager_group)
+        self.crew = create_users('crew', options['crew'], crew_group)
+        # Promoted and demoted by the group scenarios, one set per group
+        self.spare = create_users('spare', 2 * self.requests)
+        self.groups = {MANAGER: manager_group, DELIVERY_CREW: crew_group}
+
+        users = self.customers + self.managers + self.crew + self.spare
+        tokens = Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in users])
+        self.tokens = {token.user_id: token.key for token in tokens}
+
+        self.categories = Category.objects.bulk_create([
+            Category(slug=f'{self.prefix}-{i}', title=f'{word.title()} {self.prefix}')
+            for i, word in enumerate(WORDS[:8])
+        ])
+        self.items = MenuItem.objects.bulk_create([
+            MenuItem(
+                title=f'{" ".join(rng.sample(WORDS, 3))} {self.prefix} {i}',
+                price=rng.randint(2, 40),
+                featured=rng.random() < 0.1,
+                category=rng.choice(self.categories),
+            )
+            for i in range(options['menu_items'])
+        ])
+
+        orders = Order.objects.bulk_create([
+            Order(
+                user=customer,
+                total=0,
+                status=rng.random() < 0.7,
+                delivery_crew=rng.choice(self.crew) if rng.random() < 0.8 else None,
+            )
+            for customer in self.customers
+            for _ in range(options['orders'])
+        ])
+        lines = []
+        for order in orders:
+            for item in rng.sample(self.items, 3):
+                lines.append(OrderItem(order=order, menuitem=item, quantity=1, unit_price=item.price, price=item.price))
+                order.total += item.price
+        OrderItem.objects.bulk_create(lines)
+        Order.objects.bulk_update(orders, ['total'])
+        self.orders = orders
+        # Bulk created, the orders only reach the sales rollups through a rebuild
+        sales.rebuild(start=date.today())
+
+    def pick(self, users, i):
+        return users[i % len(users)]
+
+    def token(self, user):
+        return self.tokens[user.pk]
+
+    def fill_carts(self, count, lines):
+        # The first `count` customers get a cart with the first `lines` menu items
+        customers = self.customers[:count]
+        Cart.objects.filter(user__in=customers).delete()
+        Cart.objects.bulk_create([
+            Cart(user=customer, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+            for customer in customers
+            for item in self.items[:lines]
+        ])
+
+    def disposable_items(self, count):
+        # Menu items nothing refers to, for the delete scenarios
+        return MenuItem.objects.bulk_create([
+            MenuItem(title=f'Disposable {self.prefix} {i}', price=5, featured=False, category=self.categories[0])
+            for i in range(count)
+        ])
+
+
+# Every scenario: (name, method, route, build, setup). build(data, i) returns the
+# (user, url, body) of the i-th request, setup(data) runs before the timed phase
+# and before the requests are built.
+
+def no_setup(data):
+    pass
+
+
+def anonymous(url, body=None):
+    return None, url, body
+
+
+def menu_list(data, i):
+    return anonymous('/api/menu-items/')
+
+
+def menu_filtered(data, i):
+    category = data.pick(data.categories, i)
+    low = data.rng.randint(2, 20)
+    return anonymous(f'/api/menu-items/?category={category.title}&from_price={low}&to_price={low + 10}&ordering=price')
+
+
+def menu_featured(data, i):
+    return anonymous('/api/menu-items/?featured=true&ordering=-price')
+
+
+def menu_search(data, i):
+    return anonymous(f'/api/menu-items/?search={data.pick(WORDS, i)}')
+
+
+def menu_full_text(data, i):
+    return anonymous(f'/api/menu-items/?q={data.pick(WORDS, i)[:4]}')
+
+
+def menu_item(data, i):
+    return anonymous(f'/api/menu-items/{data.rng.choice(data.items).pk}')
+
+
+def menu_snapshot(data, i):
+    return anonymous('/api/menu/')
+
+
+def menu_create(data, i):
+    body = {'title': f'New {data.prefix} {i}', 'price': '9.50', 'featured': False, 'category_id': data.pick(data.categories, i).pk}
+    return data.pick(data.managers, i), '/api/menu-items/', body
+
+
+def menu_update(data, i):
+    return data.pick(data.managers, i), f'/api/menu-items/{data.pick(data.items, i).pk}', {'price': str(data.rng.randint(2, 40))}
+
+
+def menu_bulk_create(data, i):
+    category = data.pick(data.categories, i).pk
+    body = [
+        {'title': f'Bulk {data.prefix} {i} {j}', 'price': '7.00', 'featured': False, 'category_id': category}
+        for j in range(10)
+    ]
+    return data.pick(data.managers, i), '/api/menu-items/bulk/', body
+
+
+def menu_bulk_update(data, i):
+    body = [{'id': item.pk, 'price': str(data.rng.randint(2, 40))} for item in data.items[i * 10 % len(data.items):][:10]]
+    return data.pick(data.managers, i), '/api/menu-items/bulk/', body
+
+
+def setup_menu_bulk_delete(data):
+    data.deletable = [item.pk for item in data.disposable_items(10 * data.requests)]
+
+
+def menu_bulk_delete(data, i):
+    return data.pick(data.managers, i), '/api/menu-items/bulk/', data.deletable[i * 10:(i + 1) * 10]
+
+
+def token_login(data, i):
+    return anonymous('/api/api-token-auth/', {'username': data.pick(data.customers, i).username, 'password': PASSWORD})
+
+
+def group_users(route):
+    def build(data, i):
+        return data.pick(data.managers, i), route, None
+    return build
+
+
+def spares(data, group):
+    # Spare users of a group scenario, the first half for managers, the second for the crew
+    half = len(data.spare) // 2
+    return data.spare[:half] if group == MANAGER else data.spare[half:]
+
+
+def group_add(route, group):
+    def build(data, i):
+        return data.pick(data.managers, i), route, {'username': data.pick(spares(data, group), i).username}
+    return build
+
+
+def setup_group_remove(group):
+    def setup(data):
+        through = User.groups.through
+        through.objects.bulk_create(
+            [through(user_id=user.pk, group_id=data.groups[group].pk) for user in spares(data, group)],
+            ignore_conflicts=True,
+        )
+    return setup
+
+
+def group_remove(route, group):
+    def build(data, i):
+        return data.pick(data.managers, i), f'{route}{data.pick(spares(data, group), i).pk}', None
+    return build
+
+
+def cart_list(data, i):
+    return data.pick(data.customers, i), '/api/cart/menu-items/', None
+
+
+def setup_cart_add(data):
+    Cart.objects.filter(user__in=data.customers).delete()
+
+
+def cart_add(data, i):
+    # A different (customer, menu item) pair for every request
+    customer = data.pick(data.customers, i)
+    item = data.items[i // len(data.customers) % len(data.items)]
+    return customer, '/api/cart/menu-items/', {'menuitem_id': item.pk, 'quantity': 2}
+
+
+def setup_cart(data):
+    data.fill_carts(data.requests, 5)
+
+
+def cart_batch_add(data, i):
+    body = [{'menuitem_id': item.pk, 'quantity': 1 + i % 3} for item in data.items[:5]]
+    return data.pick(data.customers, i), '/api/cart/menu-items/batch/', body
+
+
+def cart_batch_update(data, i):
+    body = [{'menuitem_id': item.pk, 'quantity': 3} for item in data.items[:5]]
+    return data.pick(data.customers, i), '/api/cart/menu-items/batch/', body
+
+
+def cart_batch_remove(data, i):
+    return data.pick(data.customers, i), '/api/cart/menu-items/batch/', [item.pk for item in data.items[:2]]
+
+
+def cart_clear(data, i):
+    return data.pick(data.customers, i), '/api/cart/menu-items/', None
+
+
+def setup_checkout(data):
+    data.fill_carts(data.requests, 3)
+
+
+def checkout(data, i):
+    return data.pick(data.customers, i), '/api/orders/', None
+
+
+def setup_checkout_status(data):
+    # A processed checkout per customer, as polled after a queued checkout
+    data.checkout_jobs = CheckoutJob.objects.bulk_create([
+        CheckoutJob(user=customer, status=CheckoutJob.FAILED, error='No items in the Cart') for customer in data.customers
+    ])
+
+
+def checkout_status(data, i):
+    job = data.pick(data.checkout_jobs, i)
+    return job.user, f'/api/orders/checkouts/{job.pk}', None
+
+
+def orders(users, query=''):
+    def build(data, i):
+        return data.pick(getattr(data, users), i), f'/api/orders/{query}', None
+    return build
+
+
+def order_history(query=''):
+    def build(data, i):
+        return data.pick(data.managers, i), f'/api/orders/history/{query}', None
+    return build
+
+
+def order_detail(data, i):
+    order = data.pick(data.orders, i)
+    return order.user, f'/api/orders/{order.pk}', None
+
+
+def order_assign(data, i):
+    order = data.pick(data.orders, i)
+    return data.pick(data.managers, i), f'/api/orders/{order.pk}', {'delivery_crew': data.pick(data.crew, i).pk}
+
+
+def order_status(data, i):
+    order = data.pick(data.orders, i)
+    return data.pick(data.crew, i), f'/api/orders/{order.pk}', {'status': True}
+
+
+def order_bulk_assign(data, i):
+    # A dispatch of 25 orders between a few crew members, some marked delivered
+    orders = data.orders[i * 25 % len(data.orders):][:25]
+    body = [
+        {'id': order.pk, 'delivery_crew': data.pick(data.crew, i + j % 3).pk, 'status': j % 4 == 0}
+        for j, order in enumerate(orders)
+    ]
+    return data.pick(data.managers, i), '/api/orders/bulk/', body
+
+
+def setup_order_bulk_status(data):
+    # The orders each crew member has at that point, the assign scenarios move them around
+    data.crew_orders = {crew.pk: [] for crew in data.crew}
+    for pk, crew_id in Order.objects.filter(delivery_crew__in=data.crew).values_list('pk', 'delivery_crew'):
+        data.crew_orders[crew_id].append(pk)
+    # A crew member without orders would only send empty batches (400), give them some
+    spare = iter(Order.objects.filter(user__in=data.customers, delivery_crew=None).values_list('pk', flat=True))
+    for crew in data.crew:
+        if not data.crew_orders[crew.pk]:
+            ids = [pk for _, pk in zip(range(10), spare)]
+            Order.objects.filter(pk__in=ids).update(delivery_crew=crew)
+            data.crew_orders[crew.pk] = ids
+
+
+def order_bulk_status(data, i):
+    crew = data.pick(data.crew, i)
+    return crew, '/api/orders/bulk/', [{'id': pk, 'status': True} for pk in data.crew_orders[crew.pk][:10]]
+
+
+def setup_order_dispatch(data):
+    # Every request has a few pending orders to dispatch
+    Order.objects.bulk_create([
+        Order(user=data.pick(data.customers, i), total=10) for i in range(5 * data.requests)
+    ])
+
+
+def order_dispatch(data, i):
+    return data.pick(data.managers, i), '/api/orders/dispatch/', {'limit': 5}
+
+
+def order_events(data, i):
+    # Opening a stream, ORDER_EVENTS_MAX_AGE=0 ends it right after (see run)
+    return data.pick(data.customers, i), '/api/orders/events/', None
+
+
+def order_export(query=''):
+    def build(data, i):
+        return data.pick(data.managers, i), f'/api/orders/export/{query}', None
+    return build
+
+
+def sales_analytics(data, i):
+    return data.pick(data.managers, i), '/api/analytics/sales/?top=20', None
+
+
+def metrics(data, i):
+    return data.pick(data.managers, i), '/api/metrics/', None
+
+
+SCENARIOS = [
+    ('menu list', 'GET', 'menu-items/', menu_list, no_setup),
+    ('menu filtered', 'GET', 'menu-items/', menu_filtered, no_setup),
+    ('menu featured', 'GET', 'menu-items/', menu_featured, no_setup),
+    ('menu search', 'GET', 'menu-items/', menu_search, no_setup),
+    ('menu full-text search', 'GET', 'menu-items/', menu_full_text, no_setup),
+    ('menu item', 'GET', 'menu-items/<int:pk>', menu_item, no_setup),
+    ('menu snapshot', 'GET', 'menu/', menu_snapshot, no_setup),
+    ('menu create', 'POST', 'menu-items/', menu_create, no_setup),
+    ('menu update', 'PATCH', 'menu-items/<int:pk>', menu_update, no_setup),
+    ('menu bulk create', 'POST', 'menu-items/bulk/', menu_bulk_create, no_setup),
+    ('menu bulk update', 'PATCH', 'menu-items/bulk/', menu_bulk_update, no_setup),
+    ('menu bulk delete', 'DELETE', 'menu-items/bulk/', menu_bulk_delete, setup_menu_bulk_delete),
+    ('token login', 'POST', 'api-token-auth/', token_login, no_setup),
+    ('managers', 'GET', 'groups/manager/users/', group_users('/api/groups/manager/users/'), no_setup),
+    ('add manager', 'POST', 'groups/manager/users/', group_add('/api/groups/manager/users/', MANAGER), no_setup),
+    ('remove manager', 'DELETE', 'groups/manager/users/<int:pk>',
+        group_remove('/api/groups/manager/users/', MANAGER), setup_group_remove(MANAGER)),
+    ('delivery crew', 'GET', 'groups/delivery-crew/users/', group_users('/api/groups/delivery-crew/users/'), no_setup),
+    ('add delivery crew', 'POST', 'groups/delivery-crew/users/',
+        group_add('/api/groups/delivery-crew/users/', DELIVERY_CREW), no_setup),
+    ('remove delivery crew', 'DELETE', 'groups/delivery-crew/users/<int:pk>',
+        group_remove('/api/groups/delivery-crew/users/', DELIVERY_CREW), setup_group_remove(DELIVERY_CREW)),
+    ('cart', 'GET', 'cart/menu-items/', cart_list, setup_cart),
+    ('cart add', 'POST', 'cart/menu-items/', cart_add, setup_cart_add),
+    ('cart clear', 'DELETE', 'cart/menu-items/', cart_clear, setup_cart),
+    ('cart batch add', 'POST', 'cart/menu-items/batch/', cart_batch_add, no_setup),
+    ('cart batch update', 'PATCH', 'cart/menu-items/batch/', cart_batch_update, setup_cart),
+    ('cart batch remove', 'DELETE', 'cart/menu-items/batch/', cart_batch_remove, setup_cart),
+    ('checkout', 'POST', 'orders/', checkout, setup_checkout),
+    ('checkout status', 'GET', 'orders/checkouts/<int:pk>', checkout_status, setup_checkout_status),
+    ('orders (customer)', 'GET', 'orders/', orders('customers'), no_setup),
+    ('orders (delivery crew)', 'GET', 'orders/', orders('crew'), no_setup),
+    ('orders (manager)', 'GET', 'orders/', orders('managers'), no_setup),
+    ('open orders (manager)', 'GET', 'orders/', orders('managers', '?status=false'), no_setup),
+    ('order', 'GET', 'orders/<int:pk>', order_detail, no_setup),
+    ('assign order', 'PATCH', 'orders/<int:pk>', order_assign, no_setup),
+    ('order status', 'PATCH', 'orders/<int:pk>', order_status, no_setup),
+    ('bulk assign orders', 'PATCH', 'orders/bulk/', order_bulk_assign, no_setup),
+    ('bulk order status', 'PATCH', 'orders/bulk/', order_bulk_status, setup_order_bulk_status),
+    ('order events', 'GET', 'orders/events/', order_events, no_setup),
+    ('dispatch orders', 'POST', 'orders/dispatch/', order_dispatch, setup_order_dispatch),
+    ('order history', 'GET', 'orders/history/', order_history(), no_setup),
+    ('order history by total', 'GET', 'orders/history/', order_history('?ordering=-total'), no_setup),
+    ('order export (csv)', 'GET', 'orders/export/', order_export(), no_setup),
+    ('order export (ndjson)', 'GET', 'orders/export/', order_export('?format=ndjson&status=false'), no_setup),
+    ('sales analytics', 'GET', 'analytics/sales/', sales_analytics, no_setup),
+    ('metrics', 'GET', 'metrics/', metrics, no_setup),
+]
+
+
+async def aconsume(response):
+    # The streams of the async views (the order events)
+    async for chunk in response.streaming_content:
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a dataset and drives every API route through the test client with concurrent workers, '
+        'then writes throughput, latency percentiles and queries per request of every endpoint to a JSON file. '
+        'Runs on a throwaway test database unless --in-place is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Worker threads sending the requests.')
+        parser.add_argument('--menu-items', type=int, default=1000)
+        parser.add_argument('--customers', type=int, default=200)
+        parser.add_argument('--crew', type=int, default=10)
+        parser.add_argument('--orders', type=int, default=5, help='Orders per customer.')
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='Run the scenarios whose name contains one of these.')
+        parser.add_argument('--output', default='loadtest.json')
+        parser.add_argument('--compare', metavar='FILE', help='A previous report to compare this run with.')
+        parser.add_argument('--in-place', action='store_true', help='Use the configured database, the seeded data is kept.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        scenarios = [
+            scenario for scenario in SCENARIOS
+            if not options['only'] or any(part in scenario[0] for part in options['only'])
+        ]
+        if not scenarios:
+            raise CommandError('No scenario matches --only.')
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                previous = json.load(file)
+
+        old_name = None
+        if not options['in_place']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # The test client's host, rates that never run out, and order event
+            # streams that end once open since the test client reads to the end
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], ORDER_EVENTS_MAX_AGE=0), \
+                    unthrottled():
+                report = self.run(scenarios, options)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, indent=2)
+        self.stdout.write(f'Report written to {options["output"]}')
+        if previous is not None:
+            self.compare(previous, report)
+
+    def run(self, scenarios, options):
+        rng = random.Random(options['seed'])
+        self.stdout.write('Seeding...')
+        data = Dataset(rng, options)
+
+        endpoints = {}
+        self.stdout.write(f'{"scenario":<24} {"req/s":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"queries":>8} {"errors":>7}')
+        for name, method, route, build, setup in scenarios:
+            setup(data)
+            requests = []
+            for i in range(options['requests']):
+                user, url, body = build(data, i)
+                requests.append((data.token(user) if user is not None else None, url, body))
+            elapsed, results = self.run_phase(method, requests, options['concurrency'])
+            timings = [result[1] for result in results]
+            queries = [result[2] for result in results]
+            statuses = Counter(result[0] for result in results)
+            endpoints[name] = {
+                'method': method,
+                'route': f'/api/{route}',
+                'requests': len(results),
+                'errors': sum(count for status, count in statuses.items() if status >= 400),
+                'statuses': {str(status): count for status, count in sorted(statuses.items())},
+                'throughput': round(len(results) / elapsed, 2),
+                'latency_ms': summarize(timings),
+                'queries': {'mean': round(sum(queries) / len(queries), 2), 'max': max(queries)},
+            }
+            self.print_endpoint(name, endpoints[name])
+
+        return {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': self.get_revision(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'options': {
+                key: options[key]
+                for key in ('requests', 'concurrency', 'menu_items', 'customers', 'crew', 'orders', 'seed')
+            },
+            'endpoints': endpoints,
+        }
+
+    def run_phase(self, method, requests, concurrency):
+        results = []
+
+        def worker(share):
+            client = Client(raise_request_exception=False)
+            try:
+                for token, url, body in share:
+                    results.append(self.send(client, method, url, body, token))
+            finally:
+                # Every thread has its own database connection
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(requests[i::concurrency],)) for i in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, results
+
+    def send(self, client, method, url, body, token):
+        headers = {}
+        if token is not None:
+            headers['HTTP_AUTHORIZATION'] = f'Token {token}'
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        data = json.dumps(body) if body is not None else ''
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            response = client.generic(method, url, data, content_type='application/json', **headers)
+            if response.streaming:
+                # The export is only done once the whole body has been read
+                if response.is_async:
+                    async_to_sync(aconsume)(response)
+                else:
+                    b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - start) * 1000
+        return response.status_code, elapsed, queries
+
+    def print_endpoint(self, name, endpoint):
+        latency = endpoint['latency_ms']
+        self.stdout.write(
+            f'{name:<24} {endpoint["throughput"]:>8.1f} {latency["p50"]:>8.2f} {latency["p95"]:>8.2f} '
+            f'{latency["p99"]:>8.2f} {endpoint["queries"]["mean"]:>8.2f} {endpoint["errors"]:>7}'
+        )
+
+    def compare(self, previous, report):
+        self.stdout.write(f'\nCompared with {previous.get("revision") or previous.get("created")}:')
+        self.stdout.write(f'{"scenario":<24} {"req/s":>18} {"p95 ms":>20} {"queries":>14}')
+        for name, endpoint in report['endpoints'].items():
+            before = previous.get('endpoints', {}).get(name)
+            if before is None:
+                self.stdout.write(f'{name:<24} new')
+                continue
+            self.stdout.write(
+                f'{name:<24} '
+                f'{self.change(before["throughput"], endpoint["throughput"]):>18} '
+                f'{self.change(before["latency_ms"]["p95"], endpoint["latency_ms"]["p95"]):>20} '
+                f'{before["queries"]["mean"]:>6.1f} -> {endpoint["queries"]["mean"]:<5.1f}'
+            )
+
+    def change(self, before, after):
+        if not before:
+            return f'{before} -> {after}'
+        return f'{before:.1f} -> {after:.1f} ({(after - before) / before:+.0%})'
+
+    def get_revision(self):
+        try:
+            result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR)
+        except OSError:
+            return None
+        return result.stdout.strip() or None
@@ -0,0 +1,74 @@
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from LittleLemonAPI import checkout
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates the orders of the queued checkouts (settings.QUEUED_CHECKOUT), a batch of jobs per transaction '
+        '(see LittleLemonAPI/checkout.py). Runs until interrupted, or until the queue is empty with --drain.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'CHECKOUT_BATCH_SIZE', 100),
+                            help='Jobs processed per transaction.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker threads. On SQLite their batches take turns, on PostgreSQL they run side by side.')
+        parser.add_argument('--poll', type=float, default=0.5, help='Seconds a worker waits when the queue is empty.')
+        parser.add_argument('--drain', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        if options['workers'] < 1:
+            raise CommandError('--workers must be positive.')
+
+        stop = threading.Event()
+        processed = [0] * options['workers']
+        errors = []
+
+        def work(index):
+            try:
+                while not stop.is_set():
+                    count = checkout.process_batch(options['batch_size'])
+                    processed[index] += count
+                    if not count:
+                        if options['drain']:
+                            break
+                        stop.wait(options['poll'])
+            except Exception as error:
+                errors.append(error)
+                stop.set()
+
+        def work_in_thread(index):
+            try:
+                work(index)
+            finally:
+                # Every thread has its own connection
+                connection.close()
+
+        start = time.perf_counter()
+        try:
+            if options['workers'] == 1:
+                work(0)
+            else:
+                workers = [threading.Thread(target=work_in_thread, args=(index,)) for index in range(options['workers'])]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    while worker.is_alive():
+                        worker.join(0.5)
+        except KeyboardInterrupt:
+            # The batches in progress finish, nothing new is started
+            stop.set()
+            if options['workers'] > 1:
+                for worker in workers:
+                    worker.join()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f'Processed {sum(processed)} checkouts with {options["workers"]} workers in {elapsed:.2f} s')
+        if errors:
+            raise CommandError(f'A worker stopped: {errors[0]}')
@@ -0,0 +1,25 @@
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+from . import timing
+
+
+@sync_and_async_middleware
+def server_timing_middleware(get_response):
+    # First in MIDDLEWARE so the total covers the other middlewares, see timing.py
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            timings, token = timing.start()
+            try:
+                response = await get_response(request)
+            finally:
+                timing.finish(token)
+            return timing.report(request, response, timings)
+    else:
+        def middleware(request):
+            timings, token = timing.start()
+            try:
+                response = get_response(request)
+            finally:
+                timing.finish(token)
+            return timing.report(request, response, timings)
+    return middleware
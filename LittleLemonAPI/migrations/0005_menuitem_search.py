@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:38
+
+import LittleLemonAPI.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    from LittleLemonAPI.search import ensure_search_index
+    ensure_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from LittleLemonAPI.search import drop_search_index
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0004_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuItemSearch',
+            fields=[
+                ('menuitem', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='LittleLemonAPI.menuitem')),
+                ('title', models.TextField()),
+                ('category_title', models.TextField()),
+                ('document', LittleLemonAPI.models.FullTextField(db_column='menuitem_search')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'menuitem_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
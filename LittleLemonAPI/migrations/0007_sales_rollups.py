@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def insert_rows(model, rows, batch_size=5000):
+    batch = []
+    for row in rows:
+        batch.append(model(**row))
+        if len(batch) == batch_size:
+            model.objects.bulk_create(batch)
+            batch = []
+    model.objects.bulk_create(batch)
+
+
+def build_rollups(apps, schema_editor):
+    # The orders placed before the rollups existed. Historical models only,
+    # sales.rebuild follows the current ones.
+    Order = apps.get_model('LittleLemonAPI', 'Order')
+    OrderItem = apps.get_model('LittleLemonAPI', 'OrderItem')
+    DailySales = apps.get_model('LittleLemonAPI', 'DailySales')
+    DailyItemSales = apps.get_model('LittleLemonAPI', 'DailyItemSales')
+    insert_rows(
+        DailySales,
+        Order.objects.values('date').annotate(orders=Count('pk'), revenue=Sum('total')).order_by('date').iterator(),
+    )
+    insert_rows(
+        DailyItemSales,
+        OrderItem.objects.values('menuitem_id', date=F('order__date'))
+        .annotate(orders=Count('pk'), quantity=Sum('quantity'), revenue=Sum('price'))
+        .order_by('date', 'menuitem_id')
+        .iterator(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0006_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyItemSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('menuitem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='LittleLemonAPI.menuitem')),
+            ],
+            options={
+                'unique_together': {('date', 'menuitem')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
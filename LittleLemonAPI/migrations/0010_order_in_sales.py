@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+def mark_counted(apps, schema_editor):
+    # 0007 counted the orders placed before the rollups, checkout the ones since.
+    # Any created otherwise meanwhile are marked as well, rebuild_sales counts them.
+    Order = apps.get_model('LittleLemonAPI', 'Order')
+    Order.objects.update(in_sales=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0009_order_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='in_sales',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_counted, migrations.RunPython.noop),
+    ]
@@ -6,6 +6,7 @@ from django.contrib.auth.models import User
 class Category(models.Model):
     slug = models.SlugField()
     title = models.CharField(max_length=255, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self) -> str:
         return self.title
@@ -17,11 +18,50 @@ class MenuItem(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2, db_index=True)
     featured = models.BooleanField(db_index=True)
     category = models.ForeignKey(Category, on_delete=models.PROTECT)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # ?featured=true by price, SQLite compiles boolean filters to `featured` / `NOT featured`
+            # which can only use a partial index
+            models.Index(fields=['price'], condition=models.Q(featured=True), name='menuitem_featured_price_idx'),
+        ]
     
     def __str__(self) -> str:
         return self.title
     
 
+# Text field of the full-text index, supports `__match` (FTS5 MATCH)
+class FullTextField(models.TextField):
+    pass
+
+
+@FullTextField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+    
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+# MenuItemSearch Model, the SQLite FTS5 table maintained by search.py (not by migrations)
+class MenuItemSearch(models.Model):
+    menuitem = models.OneToOneField(
+        MenuItem, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', related_name='search_index'
+    )
+    title = models.TextField()
+    category_title = models.TextField()
+    # FTS5 hidden columns: the one named after the table is matched against, rank is the bm25 score
+    document = FullTextField(db_column='menuitem_search')
+    rank = models.FloatField()
+    
+    class Meta:
+        managed = False
+        db_table = 'menuitem_search'
+    
+
 # Cart Model
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -42,6 +82,22 @@ class Order(models.Model):
     status = models.BooleanField(db_index=True, default=0)
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True, auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Counted in the sales rollups (checkout, rebuild_sales), see sales.py
+    in_sales = models.BooleanField(default=False)
+    
+    class Meta:
+        indexes = [
+            # A customer's orders by date (OrderView for customers)
+            models.Index(fields=['user', 'date'], name='order_user_date_idx'),
+            # A crew member's orders by date (OrderView for the delivery crew)
+            models.Index(fields=['delivery_crew', 'date'], name='order_crew_date_idx'),
+            # Open orders (?status=false) by date, per crew member and overall. Boolean filters
+            # compile to `NOT status` so a status column in a composite index is never used,
+            # partial indexes are
+            models.Index(fields=['delivery_crew', 'date'], condition=models.Q(status=False), name='order_open_crew_date_idx'),
+            models.Index(fields=['date'], condition=models.Q(status=False), name='order_open_date_idx'),
+        ]
 
     
 # OrderItem Model
@@ -55,3 +111,81 @@ class OrderItem(models.Model):
     class Meta:
         unique_together = ['order', 'menuitem']
 
+
+
+# Sales rollups, kept up to date by checkout and by order deletion (see sales.py)
+# and rebuilt from the orders, archived or not, by the rebuild_sales command
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+
+# One row per day and menu item
+class DailyItemSales(models.Model):
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['date', 'menuitem']
+
+
+# A queued checkout (settings.QUEUED_CHECKOUT), turned into an order by the
+# process_checkouts workers, see checkout.py
+class CheckoutJob(models.Model):
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    order = models.OneToOneField(Order, on_delete=models.SET_NULL, null=True)
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # The queue, oldest first
+            models.Index(fields=['id'], condition=models.Q(status='pending'), name='checkout_job_pending_idx'),
+        ]
+        constraints = [
+            # Checking out again while a checkout waits returns the waiting one
+            models.UniqueConstraint(fields=['user'], condition=models.Q(status='pending'), name='checkout_job_one_pending'),
+        ]
+
+
+# Delivered orders moved out of Order/OrderItem by the archive_orders command
+# (see archive.py), with their ids. OrderView only reads the hot tables, the
+# order history endpoint reads both.
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='archived_deliveries', null=True)
+    status = models.BooleanField(default=True)
+    total = models.DecimalField(max_digits=6, decimal_places=2)
+    date = models.DateField(db_index=True)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A customer's history by date (?user= on the history endpoint)
+            models.Index(fields=['user', 'date'], name='archived_order_user_date_idx'),
+        ]
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE)
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    quantity = models.SmallIntegerField()
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2)
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+
+    class Meta:
+        unique_together = ['order', 'menuitem']
@@ -0,0 +1,192 @@
+import json
+from base64 import b64decode, b64encode
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    # Cursor pagination over the full ordering plus the primary key, every page
+    # is a single indexed range query: no COUNT(*) and no OFFSET however deep the
+    # client pages. The ordering comes from OrderingFilter (?ordering=...) or the
+    # view's `ordering`, the primary key is appended to break ties.
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'MAX_PAGE_SIZE', 100)
+    ordering = 'pk'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # Same as paginate_queryset, for the async views
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page([row async for row in queryset])
+
+    def paginate_querysets(self, querysets, request, view=None):
+        # One page over several querysets with the same columns and distinct
+        # primary keys (the order history: the orders and the archived orders).
+        # Each one is read with its own range query and the rows are merged, so
+        # a page still costs one indexed query per table.
+        pages = [self.get_page_queryset(queryset, request) for queryset in querysets]
+        if pages[0] is None:
+            return None
+        rows = [row for page in pages for row in page]
+        ordering = [self.flip(name) for name in self.ordering] if self.reverse else self.ordering
+        # Sorted on the last column first, each sort is stable
+        for name, field in reversed(list(zip(ordering, self.fields))):
+            attname = field.attname if field is not None else name.lstrip('-')
+            rows.sort(key=lambda row: getattr(row, attname), reverse=name.startswith('-'))
+        return self.set_page(rows[:self.page_size + 1])
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_keyset_ordering(queryset)
+        self.fields = [self.get_field(queryset, name) for name in self.ordering]
+
+        self.cursor = self.decode_cursor(request)
+        self.reverse = self.cursor is not None and self.cursor['reverse']
+        ordering = [self.flip(name) for name in self.ordering] if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self.after(ordering, self.cursor['position']))
+
+        # One extra row tells us whether there is a page after this one
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_previous = has_more
+            self.has_next = True
+        else:
+            self.has_previous = self.cursor is not None
+            self.has_next = has_more
+
+        self.display_page_controls = self.has_previous or self.has_next
+        return self.page
+
+    def get_keyset_ordering(self, queryset):
+        ordering = [name for name in queryset.query.order_by if isinstance(name, str) and name != '?']
+        if not ordering:
+            ordering = [self.ordering] if isinstance(self.ordering, str) else list(self.ordering)
+        pk_name = queryset.model._meta.pk.name
+        if not any(name.lstrip('-') in ('pk', pk_name) for name in ordering):
+            # Follow the direction of the last field so a single index can serve the query
+            ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+        return ordering
+
+    def get_field(self, queryset, name):
+        # Annotations (e.g. the search relevance) have no model field, their values are used as is
+        name = name.lstrip('-')
+        if name in queryset.query.annotations:
+            return None
+        try:
+            return queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise NotFound(self.invalid_cursor_message)
+
+    def flip(self, name):
+        return name[1:] if name.startswith('-') else f'-{name}'
+
+    def after(self, ordering, position):
+        # (a, b, c) > (x, y, z) written out for the ORM, each column in its own direction:
+        # a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        condition = Q()
+        equal = Q()
+        for name, value in zip(ordering, position):
+            column = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{column}__{lookup}': value})
+            equal &= Q(**{column: value})
+        return condition
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor({'reverse': False, 'position': self.position(self.page[-1])})
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # Paged past the end, the previous page is the last one
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor({'reverse': True, 'position': self.position(self.page[0])})
+
+    def position(self, instance):
+        return [
+            getattr(instance, name.lstrip('-')) if field is None else field.value_to_string(instance)
+            for name, field in zip(self.ordering, self.fields)
+        ]
+
+    def encode_cursor(self, cursor):
+        data = {'o': self.ordering, 'r': cursor['reverse'], 'p': cursor['position']}
+        encoded = b64encode(json.dumps(data, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_value(self, field, value):
+        if field is not None:
+            return field.to_python(value)
+        if not isinstance(value, (int, float, str)):
+            raise ValueError
+        return value
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            data = json.loads(b64decode(encoded.encode(), validate=True).decode())
+            # A cursor is only valid for the ordering it was issued for
+            if data['o'] != self.ordering or len(data['p']) != len(self.fields):
+                raise ValueError
+            position = [self.decode_value(field, value) for field, value in zip(self.fields, data['p'])]
+            return {'reverse': bool(data['r']), 'position': position}
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    # PageNumberPagination that the async views can use, the count and the page
+    # are read with the async ORM. The sync path is DRF's.
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator.count is a cached_property, filled in here it is never queried again
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+
+        self.page.object_list = [row async for row in self.page.object_list]
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return list(self.page)
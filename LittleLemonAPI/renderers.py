@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import renderers
+from rest_framework_xml.renderers import XMLRenderer as BaseXMLRenderer
+from .timing import timed
+
+# The renderers of DEFAULT_RENDERER_CLASSES with their time counted as 'render', see timing.py
+
+
+class TimedRendererMixin:
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('render'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class JSONRenderer(TimedRendererMixin, renderers.JSONRenderer):
+    pass
+
+
+class BrowsableAPIRenderer(TimedRendererMixin, renderers.BrowsableAPIRenderer):
+    pass
+
+
+class XMLRenderer(TimedRendererMixin, BaseXMLRenderer):
+    pass
+
+
+# Row formats of the order export. The export streams its rows through
+# encode_rows() (see export.py), render() only has the error responses to write.
+
+def _records(data):
+    # An error body is a dict or a list of messages
+    if data is None:
+        return []
+    if not isinstance(data, list):
+        data = [data]
+    return [record if isinstance(record, dict) else {'detail': record} for record in data]
+
+
+# A spreadsheet takes a cell starting with one of these for a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _escape(value):
+    # Text only, numbers (a negative total) stay numbers
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class CSVRenderer(TimedRendererMixin, renderers.BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def encode_rows(self, columns, rows, header=False):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow(columns)
+        writer.writerows([_escape(value) for value in row] for row in rows)
+        return buffer.getvalue().encode(self.charset)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        records = _records(data)
+        columns = list(records[0]) if records else []
+        return self.encode_rows(columns, [[record.get(column) for column in columns] for record in records], header=True)
+
+
+class NDJSONRenderer(TimedRendererMixin, renderers.BaseRenderer):
+    # One JSON object per line, decimals as strings like the serializers
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def encode_rows(self, columns, rows, header=False):
+        return ''.join(
+            json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n' for row in rows
+        ).encode(self.charset)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(json.dumps(record, cls=DjangoJSONEncoder) + '\n' for record in _records(data)).encode(self.charset)
+
+
+class EventStreamRenderer(TimedRendererMixin, renderers.BaseRenderer):
+    # Server-Sent Events, the order stream writes its events itself (events.py),
+    # render() only has the error responses to write
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f'event: error\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'.encode(self.charset)
@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core.cache import cache
+from .timing import timed
+
+MANAGER = 'Manager'
+DELIVERY_CREW = 'Delivery Crew'
+
+# Name of the attribute used to keep the resolved roles on the user object,
+# request.user is the same instance for the whole request so this makes the
+# lookup happen once per request.
+_ROLES_ATTR = '_littlelemon_roles'
+
+
+def _cache_key(user_id):
+    return f'littlelemon:roles:{user_id}'
+
+
+def get_roles(user):
+    # Anonymous users don't belong to any group
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, _ROLES_ATTR, None)
+    if roles is not None:
+        return roles
+
+    key = _cache_key(user.pk)
+    with timed('roles'):
+        roles = cache.get(key)
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(key, roles, getattr(settings, 'ROLE_CACHE_TIMEOUT', 300))
+
+    setattr(user, _ROLES_ATTR, roles)
+    return roles
+
+
+async def aget_roles(user):
+    # get_roles for the async views, a later get_roles in the same request is then free
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, _ROLES_ATTR, None)
+    if roles is not None:
+        return roles
+
+    key = _cache_key(user.pk)
+    with timed('roles'):
+        roles = await cache.aget(key)
+        if roles is None:
+            roles = frozenset([name async for name in user.groups.values_list('name', flat=True)])
+            await cache.aset(key, roles, getattr(settings, 'ROLE_CACHE_TIMEOUT', 300))
+
+    setattr(user, _ROLES_ATTR, roles)
+    return roles
+
+
+def set_roles(user, names):
+    # Pins the roles of a user object without a database lookup (tooling and tests)
+    setattr(user, _ROLES_ATTR, frozenset(names))
+    return user
+
+
+def invalidate_roles(*user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def forget_roles(user):
+    # Drop the per-request copy too, used right after changing membership
+    if hasattr(user, _ROLES_ATTR):
+        delattr(user, _ROLES_ATTR)
+    invalidate_roles(user.pk)
+
+
+def is_manager(user):
+    return MANAGER in get_roles(user)
+
+
+def is_delivery_crew(user):
+    return DELIVERY_CREW in get_roles(user)
+
+
+def is_customer(user):
+    # A customer is any signed in user that is neither a manager nor in the delivery crew
+    if user is None or not user.is_authenticated:
+        return False
+    roles = get_roles(user)
+    return MANAGER not in roles and DELIVERY_CREW not in roles
@@ -0,0 +1,143 @@
+from django.db import connection, transaction
+from django.db.models import F
+from .models import ArchivedOrder, ArchivedOrderItem, DailySales, DailyItemSales, Order, OrderItem
+
+# Daily sales rollups for the analytics endpoint. Checkout adds every order with
+# two upserts whatever the size of the cart (record_order), deleting an order
+# takes it back out (forget_order, from a pre_delete signal). Orders created
+# any other way (admin, bulk imports) are only counted after rebuild(), the
+# rebuild_sales command. Order.in_sales tells the counted orders apart, only
+# those are taken back out.
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _columns(model, *names):
+    return [_quote(model._meta.get_field(name).column) for name in names]
+
+
+def record_order(order):
+    # INSERT ... ON CONFLICT DO UPDATE adds to the rows of the day (SQLite, PostgreSQL),
+    # the order items go through INSERT ... SELECT like the checkout itself. The
+    # order is created with in_sales set, in the same transaction.
+    date = connection.ops.adapt_datefield_value(order.date)
+    days = _quote(DailySales._meta.db_table)
+    day, orders, revenue = _columns(DailySales, 'date', 'orders', 'revenue')
+    items = _quote(DailyItemSales._meta.db_table)
+    item_day, menuitem, item_orders, quantity, item_revenue = _columns(
+        DailyItemSales, 'date', 'menuitem', 'orders', 'quantity', 'revenue'
+    )
+    line_menuitem, line_quantity, line_price, line_order = _columns(OrderItem, 'menuitem', 'quantity', 'price', 'order')
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {days} ({day}, {orders}, {revenue}) VALUES (%s, 1, %s) '
+            f'ON CONFLICT ({day}) DO UPDATE SET '
+            f'{orders} = {days}.{orders} + 1, {revenue} = {days}.{revenue} + excluded.{revenue}',
+            [date, connection.ops.adapt_decimalfield_value(order.total)],
+        )
+        cursor.execute(
+            f'INSERT INTO {items} ({item_day}, {menuitem}, {item_orders}, {quantity}, {item_revenue}) '
+            f'SELECT %s, {line_menuitem}, 1, {line_quantity}, {line_price} '
+            f'FROM {_quote(OrderItem._meta.db_table)} WHERE {line_order} = %s '
+            f'ON CONFLICT ({item_day}, {menuitem}) DO UPDATE SET '
+            f'{item_orders} = {items}.{item_orders} + excluded.{item_orders}, '
+            f'{quantity} = {items}.{quantity} + excluded.{quantity}, '
+            f'{item_revenue} = {items}.{item_revenue} + excluded.{item_revenue}',
+            [date, order.pk],
+        )
+
+
+def forget_order(order):
+    # The reverse of record_order, called while the order items still exist
+    if not order.in_sales:
+        return
+    DailySales.objects.filter(date=order.date).update(orders=F('orders') - 1, revenue=F('revenue') - order.total)
+    lines = OrderItem.objects.filter(order=order).values_list('menuitem_id', 'quantity', 'price')
+    for menuitem_id, quantity, price in lines:
+        DailyItemSales.objects.filter(date=order.date, menuitem_id=menuitem_id).update(
+            orders=F('orders') - 1, quantity=F('quantity') - quantity, revenue=F('revenue') - price,
+        )
+    DailySales.objects.filter(date=order.date, orders__lte=0).delete()
+    DailyItemSales.objects.filter(date=order.date, orders__lte=0).delete()
+
+
+def get_sources():
+    # (orders, order items) of the hot and the archive tables (see archive.py)
+    return [
+        (Order.objects.all(), OrderItem.objects.all()),
+        (ArchivedOrder.objects.all(), ArchivedOrderItem.objects.all()),
+    ]
+
+
+def _union(querysets):
+    # SQL and params of the querysets' UNION ALL, an order is in one table only
+    first, *others = querysets
+    return first.union(*others, all=True).query.sql_with_params()
+
+
+def rebuild(start=None, end=None, batch_size=5000):
+    # Recomputes the rollups of the days from start to end (every day by default)
+    # with one GROUP BY query per rollup over the UNION ALL of the tables of
+    # get_sources(), streamed and inserted batch_size rows at a time. In a single
+    # transaction, the endpoint keeps reading the old rollups until it commits.
+    # The orders of those days are then all counted (in_sales).
+    days = DailySales.objects.all()
+    items = DailyItemSales.objects.all()
+    uncounted = Order.objects.filter(in_sales=False)
+    if start is not None:
+        days, items, uncounted = (queryset.filter(date__gte=start) for queryset in (days, items, uncounted))
+    if end is not None:
+        days, items, uncounted = (queryset.filter(date__lte=end) for queryset in (days, items, uncounted))
+
+    day_sources = []
+    item_sources = []
+    for orders, lines in get_sources():
+        if start is not None:
+            orders, lines = orders.filter(date__gte=start), lines.filter(order__date__gte=start)
+        if end is not None:
+            orders, lines = orders.filter(date__lte=end), lines.filter(order__date__lte=end)
+        # Every column is an annotation, older Django names plain fields of a
+        # UNION col1, col2... and puts them before the annotations
+        day_sources.append(orders.values(day=F('date'), amount=F('total')).order_by())
+        item_sources.append(lines.values(
+            day=F('order__date'), item=F('menuitem_id'), units=F('quantity'), amount=F('price')
+        ).order_by())
+
+    day, item, units, amount = map(_quote, ['day', 'item', 'units', 'amount'])
+    with transaction.atomic():
+        days.delete()
+        items.delete()
+        day_count = _insert(
+            DailySales, ['date', 'orders', 'revenue'],
+            f'SELECT {day}, COUNT(*), SUM({amount}) FROM ({{}}) source GROUP BY {day} ORDER BY {day}',
+            _union(day_sources), batch_size,
+        )
+        item_count = _insert(
+            DailyItemSales, ['date', 'menuitem_id', 'orders', 'quantity', 'revenue'],
+            f'SELECT {day}, {item}, COUNT(*), SUM({units}), SUM({amount}) FROM ({{}}) source '
+            f'GROUP BY {day}, {item} ORDER BY {day}, {item}',
+            _union(item_sources), batch_size,
+        )
+        uncounted.update(in_sales=True)
+    return day_count, item_count
+
+
+def _insert(model, names, query, source, batch_size):
+    # Runs query around the source SQL and inserts its rows, the rows are read
+    # batch_size at a time (a server-side cursor on PostgreSQL)
+    sql, params = source
+    fields = [model._meta.get_field(name) for name in names]
+    count = 0
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(query.format(sql), params)
+        while rows := cursor.fetchmany(batch_size):
+            # Raw rows: dates may come back as text and sums as floats on SQLite
+            model.objects.bulk_create([
+                model(**{field.attname: field.to_python(value) for field, value in zip(fields, row)})
+                for row in rows
+            ])
+            count += len(rows)
+    return count
@@ -0,0 +1,103 @@
+from asgiref.sync import sync_to_async
+from django.db import connections
+from .models import Category, MenuItem
+
+# Full-text index of the menu on SQLite: an FTS5 table holding the menu item and
+# category titles, keyed by the menu item id (rowid) and kept in sync by triggers
+# so bulk_create/bulk_update, the admin and raw SQL writes are all covered.
+# Other backends (or SQLite builds without FTS5) keep using LIKE searches.
+TABLE = 'menuitem_search'
+
+_available = {}
+
+
+def _sql():
+    menuitem_table = MenuItem._meta.db_table
+    category_table = Category._meta.db_table
+    category_title = f'(SELECT title FROM "{category_table}" WHERE id = new.category_id)'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} "
+        f"USING fts5(title, category_title, tokenize = 'unicode61 remove_diacritics 2')",
+
+        f'CREATE TRIGGER IF NOT EXISTS {TABLE}_menuitem_insert AFTER INSERT ON "{menuitem_table}" BEGIN '
+        f'INSERT INTO {TABLE} (rowid, title, category_title) VALUES (new.id, new.title, {category_title}); END',
+
+        f'CREATE TRIGGER IF NOT EXISTS {TABLE}_menuitem_update AFTER UPDATE OF title, category_id ON "{menuitem_table}" BEGIN '
+        f'UPDATE {TABLE} SET title = new.title, category_title = {category_title} WHERE rowid = old.id; END',
+
+        f'CREATE TRIGGER IF NOT EXISTS {TABLE}_menuitem_delete AFTER DELETE ON "{menuitem_table}" BEGIN '
+        f'DELETE FROM {TABLE} WHERE rowid = old.id; END',
+
+        f'CREATE TRIGGER IF NOT EXISTS {TABLE}_category_update AFTER UPDATE OF title ON "{category_table}" BEGIN '
+        f'UPDATE {TABLE} SET category_title = new.title '
+        f'WHERE rowid IN (SELECT id FROM "{menuitem_table}" WHERE category_id = new.id); END',
+    ]
+
+
+def supports_fts5(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def ensure_search_index(connection):
+    # Idempotent, also run after the migrations once the index exists because
+    # SQLite table rebuilds may drop the triggers (see signals.py)
+    _available.pop(connection.alias, None)
+    if not supports_fts5(connection):
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s", [f'{TABLE}_%'])
+        had_triggers = cursor.fetchone()[0] == 4
+        for statement in _sql():
+            cursor.execute(statement)
+
+    if not had_triggers:
+        # Writes made while the triggers were missing aren't in the index
+        rebuild_search_index(connection)
+    return True
+
+
+def rebuild_search_index(connection):
+    menuitem_table = MenuItem._meta.db_table
+    category_table = Category._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, title, category_title) '
+            f'SELECT m.id, m.title, c.title FROM "{menuitem_table}" m JOIN "{category_table}" c ON c.id = m.category_id'
+        )
+
+
+def drop_search_index(connection):
+    _available.pop(connection.alias, None)
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in ('menuitem_insert', 'menuitem_update', 'menuitem_delete', 'category_update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {TABLE}_{name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+def is_available(alias='default'):
+    if alias not in _available:
+        connection = connections[alias]
+        available = connection.vendor == 'sqlite' and TABLE in connection.introspection.table_names()
+        _available[alias] = available
+    return _available[alias]
+
+
+async def ais_available(alias='default'):
+    # Only the first call per process reads the schema
+    if alias not in _available:
+        await sync_to_async(is_available)(alias)
+    return _available[alias]
+
+
+def build_query(terms):
+    # Every term is quoted (so FTS5 operators typed by users are plain text) and
+    # matched as a prefix, the terms are ANDed together
+    return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
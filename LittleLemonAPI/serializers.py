@@ -1,19 +1,28 @@
 from datetime import timezone
 import datetime
 from rest_framework import serializers
-from .models import Category, MenuItem, Cart, Order, OrderItem
+from .models import Category, MenuItem, Cart, Order, OrderItem, DailySales, CheckoutJob
 from django.contrib.auth.models import User
 from rest_framework.validators import UniqueValidator, UniqueTogetherValidator
+from .timing import timed
 
-class UserSerializer(serializers.ModelSerializer):
+# Output time counts as 'serialize' in the Server-Timing header, a nested serializer
+# or the items of a list add to the same measurement (see timing.py)
+class TimedModelSerializer(serializers.ModelSerializer):
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+class UserSerializer(TimedModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'first_name', 'last_name', 'email']
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedModelSerializer):
     class Meta:
         model = Category
-        fields = '__all__'              
+        fields = ['id', 'slug', 'title']
                  
         extra_kwargs = {
             'slug' : {
@@ -25,7 +34,7 @@ class CategorySerializer(serializers.ModelSerializer):
             },
         }
         
-class MenuItemSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(TimedModelSerializer):
     title = serializers.CharField(
         max_length=255, 
         validators = [UniqueValidator(queryset = MenuItem.objects.all())]
@@ -41,7 +50,17 @@ class MenuItemSerializer(serializers.ModelSerializer):
             'price' : {'min_value' : 1.0}
         }
         
-class CartSerializer(serializers.ModelSerializer):
+
+# Used by the bulk endpoint, titles and categories are checked for the whole batch in one query each
+class MenuItemBulkSerializer(MenuItemSerializer):
+    title = serializers.CharField(max_length=255)
+    
+    
+class MenuItemBulkUpdateSerializer(MenuItemBulkSerializer):
+    id = serializers.IntegerField(min_value=1)
+    
+    
+class CartSerializer(TimedModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     menuitem = MenuItemSerializer(read_only=True)
     menuitem_id = serializers.IntegerField(write_only=True, min_value=1)
@@ -74,7 +93,13 @@ class CartSerializer(serializers.ModelSerializer):
         return unit_price * quantity
         
         
-class OrderSerializer(serializers.ModelSerializer):
+# One line of a batch cart request, the prices are filled from the menu by the view
+class CartLineSerializer(serializers.Serializer):
+    menuitem_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+    
+    
+class OrderSerializer(TimedModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     user_id = serializers.IntegerField(write_only=True, min_value=1)
     delivery_crew = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -86,20 +111,46 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'user_id', 'delivery_crew', 'status', 'total', 'date']
         
 
-class OrderSerializerforStatusandDelivery(serializers.ModelSerializer):
+class OrderSerializerforStatusandDelivery(TimedModelSerializer):
     class Meta:
         model = Order
         fields = ['status', 'delivery_crew']
         
         
-class OrderSerializerforStatus(serializers.ModelSerializer):
+class OrderSerializerforStatus(TimedModelSerializer):
     class Meta:
         model = Order
         fields = ['status']
         
+        
+class OrderBulkUpdateSerializer(serializers.Serializer):
+    # A row of the bulk order update, delivery_crew is a user id (null unassigns)
+    id = serializers.IntegerField(min_value=1)
+    status = serializers.BooleanField(required=False)
+    delivery_crew = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    
+    def validate(self, attrs):
+        if 'status' not in attrs and 'delivery_crew' not in attrs:
+            raise serializers.ValidationError("Expected a status or a delivery_crew.")
+        return attrs
+        
+
+
+class DispatchSerializer(serializers.Serializer):
+    # At most `limit` pending orders are dispatched, all of them by default
+    limit = serializers.IntegerField(min_value=1, required=False)
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class CheckoutJobSerializer(TimedModelSerializer):
+    # A queued checkout, `order` is set once it is done
+    order = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta:
+        model = CheckoutJob
+        fields = ['id', 'status', 'order', 'error', 'created_at', 'processed_at']
+
+
+class OrderItemSerializer(TimedModelSerializer):
     order = serializers.PrimaryKeyRelatedField(read_only=True)
     order_id = serializers.IntegerField(write_only=True)
     menuitem = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -120,4 +171,24 @@ class OrderItemSerializer(serializers.ModelSerializer):
         }
         
     def calculate_price(self, item:OrderItem):
-        return item.unit_price * item.quantity 
\ No newline at end of file
+        return item.unit_price * item.quantity 
+
+
+# Sales analytics, read from the daily rollups
+class DailySalesSerializer(TimedModelSerializer):
+    class Meta:
+        model = DailySales
+        fields = ['date', 'orders', 'revenue']
+
+
+class SalesTotalSerializer(serializers.Serializer):
+    orders = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class TopMenuItemSerializer(serializers.Serializer):
+    menuitem = serializers.IntegerField(source='menuitem_id')
+    title = serializers.CharField(source='menuitem__title')
+    orders = serializers.IntegerField()
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
@@ -0,0 +1,88 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from . import catalog, events, sales, search
+from .models import Category, MenuItem, Order
+from .authentication import invalidate_user_tokens, token_cache
+from .roles import invalidate_roles
+from .timing import record_query
+
+
+# Keep the cached roles in sync with group membership, this covers ManagerView,
+# DelieveryCrewView, their Single* counterparts and the admin.
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+
+    if not reverse:
+        # user.groups.add(...) / remove(...) / clear()
+        invalidate_roles(instance.pk)
+    elif pk_set:
+        # group.user_set.add(...) / remove(...)
+        invalidate_roles(*pk_set)
+    elif action == 'pre_clear':
+        # group.user_set.clear(), pk_set is empty so collect the members first
+        invalidate_roles(*instance.user_set.values_list('pk', flat=True))
+
+
+# Any write to the menu, through the API or the admin, drops the cached pages.
+# The bump waits for the commit so a reader can't cache the old rows under the new version.
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(catalog.bump_version)
+
+
+# Cached tokens: djoser's /auth/token/logout/ deletes the user's tokens and sends
+# user_logged_out, deactivating or otherwise saving a user goes through post_save
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.discard(instance.key)
+    invalidate_user_tokens(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(user_logged_out)
+def user_changed(sender, **kwargs):
+    user = kwargs.get('instance') or kwargs.get('user')
+    if user is not None and user.pk is not None:
+        invalidate_user_tokens(user.pk)
+
+
+# Deleted orders leave the sales rollups, pre_delete runs while their items still exist
+@receiver(pre_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    sales.forget_order(instance)
+
+
+# Status and crew changes through SingleOrderView, new orders from the checkout and
+# the admin go to the order event streams. QuerySet.update() sends no signal, the
+# bulk endpoint and the dispatch publish their changes themselves.
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, **kwargs):
+    events.order_changed(instance.pk, instance.user_id, instance.delivery_crew_id, instance.status)
+
+
+# Rebuilding a table on SQLite (some AlterField/AddField migrations) drops its
+# triggers, LittleLemon.db puts them back but the plain sqlite3 backend doesn't:
+# restore the full-text index triggers after every migrate. Only where 0005
+# created the index, not before it was applied or after it was unapplied.
+def restore_search_index(sender, using, **kwargs):
+    connection = connections[using]
+    if search.TABLE in connection.introspection.table_names():
+        search.ensure_search_index(connection)
+
+
+# Query count and time of every request for the Server-Timing header, see timing.py.
+# First in the list, execute_wrapper() blocks opened before a reconnect pop their own.
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
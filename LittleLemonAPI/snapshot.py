@@ -0,0 +1,166 @@
+import gzip
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from django.conf import settings
+from . import catalog
+from .models import Category, MenuItem
+from .renderers import JSONRenderer
+from .serializers import MenuItemSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# The whole menu grouped by category as files on disk: menu-<digest>.json and
+# its .gz (and .br with the brotli package) variants, named after a digest of
+# the content. views.menu_snapshot serves them from memory maps, a request costs
+# one cache read for the catalog version, nothing else is computed. When the
+# version changes, or MENU_SNAPSHOT_MAX_AGE seconds after the process last
+# looked, the menu is rendered again (see get_snapshot): the same content maps
+# the files already there, only a new one is compressed and written. Named
+# after their content, the files are the same for every process whatever
+# catalog version it sees, and a process that missed a version bump (a cache
+# not shared by the workers) catches up within MENU_SNAPSHOT_MAX_AGE.
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = {'br': '.br', 'gzip': '.gz'} if brotli is not None else {'gzip': '.gz'}
+
+
+def get_directory():
+    return Path(getattr(settings, 'MENU_SNAPSHOT_DIR', settings.BASE_DIR / 'menu_snapshot'))
+
+
+def get_menu():
+    # The price goes through the serializer's field, rendered like /api/menu-items/
+    price = MenuItemSerializer().fields['price']
+    categories = {
+        pk: {'id': pk, 'slug': slug, 'title': title, 'items': []}
+        for pk, slug, title in Category.objects.order_by('title', 'pk').values_list('pk', 'slug', 'title')
+    }
+    items = MenuItem.objects.order_by('title', 'pk').values_list('pk', 'title', 'price', 'featured', 'category_id')
+    for pk, title, value, featured, category_id in items:
+        categories[category_id]['items'].append(
+            {'id': pk, 'title': title, 'price': price.to_representation(value), 'featured': featured}
+        )
+    return {'categories': list(categories.values())}
+
+
+def encode(body):
+    variants = {None: body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=11)
+    return variants
+
+
+def _write(path, content):
+    # Readers only ever see complete files
+    handle, temporary = tempfile.mkstemp(dir=path.parent, prefix='.menu-')
+    with os.fdopen(handle, 'wb') as file:
+        file.write(content)
+    os.replace(temporary, path)
+
+
+def get_max_age():
+    return getattr(settings, 'MENU_SNAPSHOT_MAX_AGE', 60)
+
+
+def build(path, variants):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # The plain file last, _map() takes it as the sign the snapshot is complete
+    for encoding, suffix in ENCODINGS.items():
+        _write(path.with_name(path.name + suffix), variants[encoding])
+    _write(path, variants[None])
+
+
+def _map(path):
+    # Encoding -> memory map of its file, None without the plain file
+    bodies = {}
+    for encoding, suffix in [(None, ''), *ENCODINGS.items()]:
+        try:
+            with open(path.with_name(path.name + suffix), 'rb') as file:
+                bodies[encoding] = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        except FileNotFoundError:
+            if encoding is None:
+                return None
+    return bodies
+
+
+class Snapshot:
+    def __init__(self, version, digest, bodies):
+        self.version = version
+        self.digest = digest
+        self.bodies = bodies
+        self.expires = time.monotonic() + get_max_age()
+        # Strong ETags of the content, one per encoding. A version bump that
+        # leaves the menu as it was keeps the clients' copies valid.
+        self.etags = {encoding: f'"{digest}{"-" + encoding if encoding else ""}"' for encoding in self.bodies}
+
+    def is_current(self, version):
+        return self.version == version and time.monotonic() < self.expires
+
+    def negotiate(self, accept_encoding):
+        # The smallest variant the client accepts, q=0 refuses one
+        accepted = set()
+        for part in accept_encoding.split(','):
+            name, _, params = part.strip().partition(';')
+            if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                accepted.add(name.strip().lower())
+        for encoding in ENCODINGS:
+            if encoding in self.bodies and (encoding in accepted or '*' in accepted):
+                return encoding
+        return None
+
+
+_current = None
+_lock = threading.Lock()
+
+
+def get_snapshot():
+    # The snapshot of the current catalog version. The version is read before
+    # the menu, a change committed meanwhile bumps it again and the next request
+    # renders the menu again.
+    global _current
+    version = catalog.get_version()
+    snapshot = _current
+    if snapshot is not None and snapshot.is_current(version):
+        return snapshot
+
+    with _lock:
+        if _current is None or not _current.is_current(version):
+            _current = load(version, _current)
+        return _current
+
+
+def load(version, previous=None):
+    body = JSONRenderer().render(get_menu())
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    if previous is not None and previous.digest == digest:
+        # Unchanged, the maps in use stay
+        return Snapshot(version, digest, previous.bodies)
+
+    path = get_directory() / f'menu-{digest}.json'
+    bodies = _map(path)
+    if bodies is None:
+        variants = encode(body)
+        build(path, variants)
+        remove_stale(path)
+        # Another process may have removed them in between, served from memory then
+        bodies = _map(path) or {encoding: memoryview(content) for encoding, content in variants.items()}
+    return Snapshot(version, digest, bodies)
+
+
+def remove_stale(path):
+    # Files of the other contents, another process may still serve them from
+    # its maps, which outlive the files
+    for other in path.parent.glob('menu-*.json*'):
+        if not other.name.startswith(path.name):
+            try:
+                other.unlink()
+            except OSError:
+                pass
@@ -1,3 +1,2226 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import datetime
+import io
+import json
+from decimal import Decimal
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.core.management import call_command
+from django.db import DatabaseError, close_old_connections, connection, connections, models, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIClient
+from .models import Category, MenuItem, Cart, Order, OrderItem, DailySales, DailyItemSales, CheckoutJob, \
+    ArchivedOrder, ArchivedOrderItem
+from . import archive, authentication, carts, catalog, checkout, dispatch, events, export, sales, search, signals, \
+    snapshot
+from .authentication import token_cache
+from .checkout import place_order
+from .checks import LOCMEM, check_shared_caches
+from .pagination import KeysetPagination
+from .renderers import CSVRenderer
+from .roles import get_roles, is_manager, is_delivery_crew, is_customer
+from .throttling import BucketStore, clear_throttles, get_store
+from .timing import metrics
+from .urls import ASYNC_ROUTES, get_api_urlconf, get_urlpatterns
+
+
+def clear_caches():
+    # The menu pages, the roles, the cached tokens and the throttle buckets
+    cache.clear()
+    token_cache.clear()
+    clear_throttles()
+
+
+# The throttle buckets of the test run live in a file of their own, clear_caches()
+# would otherwise empty the buckets of a server running from this checkout
+_throttle_directory = None
+_throttle_settings = None
+
+
+def setUpModule():
+    global _throttle_directory, _throttle_settings
+    _throttle_directory = tempfile.TemporaryDirectory()
+    _throttle_settings = override_settings(THROTTLE_DATABASE=os.path.join(_throttle_directory.name, 'throttle.sqlite3'))
+    _throttle_settings.enable()
+
+
+def tearDownModule():
+    _throttle_settings.disable()
+    _throttle_directory.cleanup()
+
+
+SYNC_URLCONF = get_api_urlconf([])
+ASYNC_URLCONF = get_api_urlconf(ASYNC_ROUTES)
+
 
 # Create your tests here.
+class RoleResolutionTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager_group = Group.objects.create(name='Manager')
+        self.crew_group = Group.objects.create(name='Delivery Crew')
+        self.user = User.objects.create_user(username='john', password='lemon@123')
+
+    def test_roles_are_resolved_once_per_request(self):
+        with self.assertNumQueries(1):
+            is_manager(self.user)
+            is_delivery_crew(self.user)
+            is_customer(self.user)
+        self.assertTrue(is_customer(self.user))
+
+    def test_roles_are_cached_between_requests(self):
+        get_roles(self.user)
+        fresh_user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_roles(fresh_user), frozenset())
+
+    def test_group_changes_invalidate_the_cache(self):
+        self.assertFalse(is_manager(User.objects.get(pk=self.user.pk)))
+        self.user.groups.add(self.manager_group)
+        self.assertTrue(is_manager(User.objects.get(pk=self.user.pk)))
+
+        self.crew_group.user_set.add(self.user)
+        self.assertTrue(is_delivery_crew(User.objects.get(pk=self.user.pk)))
+
+        self.manager_group.user_set.clear()
+        self.assertFalse(is_manager(User.objects.get(pk=self.user.pk)))
+
+    def test_deploy_check_wants_a_shared_cache(self):
+        self.assertEqual([warning.id for warning in check_shared_caches(None)], ['LittleLemonAPI.W001'])
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir()}
+        with override_settings(CACHES={'default': shared}):
+            self.assertEqual(check_shared_caches(None), [])
+        with override_settings(CACHES={'default': shared, 'pages': {'BACKEND': LOCMEM}}, MENU_CACHE_ALIAS='pages'):
+            warnings = check_shared_caches(None)
+        self.assertEqual(len(warnings), 1)
+        self.assertIn("'pages' cache", warnings[0].msg)
+
+    def test_manager_endpoint_promotes_user(self):
+        manager = User.objects.create_user(username='boss', password='lemon@123')
+        manager.groups.add(self.manager_group)
+        client = APIClient()
+        client.force_authenticate(manager)
+
+        response = client.post('/api/groups/manager/users/', {'username': 'john'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(is_manager(User.objects.get(pk=self.user.pk)))
+
+    def test_only_managers_can_remove_delivery_crew(self):
+        self.user.groups.add(self.crew_group)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.delete(f'/api/groups/delivery-crew/users/{self.user.pk}')
+        self.assertEqual(response.status_code, 403)
+
+
+# Query budget tests, every endpoint must run the same number of queries
+# no matter how many rows it returns.
+@mock.patch.object(PageNumberPagination, 'page_size', 2000)
+@mock.patch.object(KeysetPagination, 'page_size', 2000)
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager_group = Group.objects.create(name='Manager')
+        Group.objects.create(name='Delivery Crew')
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(self.manager_group)
+        self.customer = User.objects.create_user(username='john', password='lemon@123')
+        self.category = Category.objects.create(slug='mains', title='Mains')
+
+    def seed_menu(self, count):
+        MenuItem.objects.all().delete()
+        categories = [Category.objects.create(slug=f'c{i}', title=f'Category {i}') for i in range(5)]
+        MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=5 + i % 20, featured=i % 2 == 0, category=categories[i % 5])
+            for i in range(count)
+        ])
+        Category.objects.exclude(pk__in=[category.pk for category in categories]).exclude(pk=self.category.pk).delete()
+
+    def seed_cart(self, count):
+        Cart.objects.filter(user=self.customer).delete()
+        items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Cart item {count}-{i}', price=10, featured=False, category=self.category)
+            for i in range(count)
+        ])
+        Cart.objects.bulk_create([
+            Cart(user=self.customer, menuitem=item, quantity=2, unit_price=10, price=20)
+            for item in items
+        ])
+
+    def count_queries(self, method, url, user=None):
+        # Throttling keeps its history in the cache, start every request fresh
+        clear_caches()
+        client = APIClient()
+        if user is not None:
+            # A fresh instance, like the one the authentication class would load
+            client.force_authenticate(User.objects.get(pk=user.pk))
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(client, method)(url)
+        self.assertLess(response.status_code, 300, response.content)
+        return len(context.captured_queries)
+
+    def test_menu_items_list(self):
+        self.seed_menu(10)
+        small = self.count_queries('get', '/api/menu-items/')
+        self.seed_menu(1000)
+        large = self.count_queries('get', '/api/menu-items/')
+        self.assertEqual(small, large)
+
+    def test_menu_items_filtered_list(self):
+        self.seed_menu(10)
+        small = self.count_queries('get', '/api/menu-items/?category=category&ordering=price&search=item')
+        self.seed_menu(1000)
+        large = self.count_queries('get', '/api/menu-items/?category=category&ordering=price&search=item')
+        self.assertEqual(small, large)
+
+    def test_cart_list(self):
+        self.seed_cart(2)
+        small = self.count_queries('get', '/api/cart/menu-items/', self.customer)
+        self.seed_cart(50)
+        large = self.count_queries('get', '/api/cart/menu-items/', self.customer)
+        self.assertEqual(small, large)
+
+    def test_orders_list(self):
+        Order.objects.bulk_create([Order(user=self.customer, total=10) for _ in range(10)])
+        small = self.count_queries('get', '/api/orders/', self.manager)
+        Order.objects.bulk_create([Order(user=self.customer, total=10) for _ in range(1000)])
+        large = self.count_queries('get', '/api/orders/', self.manager)
+        self.assertEqual(small, large)
+
+    def test_checkout(self):
+        self.seed_cart(2)
+        small = self.count_queries('post', '/api/orders/', self.customer)
+        self.seed_cart(50)
+        large = self.count_queries('post', '/api/orders/', self.customer)
+        self.assertEqual(small, large)
+
+
+class MenuCacheTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        catalog.get_cache().clear()
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        self.category = Category.objects.create(slug='mains', title='Mains')
+        self.item = MenuItem.objects.create(title='Pasta', price=10, featured=False, category=self.category)
+
+    def get_menu(self, query=''):
+        # Reset the anonymous throttle history, the menu cache is what is under test
+        clear_throttles()
+        return APIClient().get(f'/api/menu-items/{query}')
+
+    def test_second_read_is_served_from_cache(self):
+        first = self.get_menu('?ordering=price&search=pasta')
+        with self.assertNumQueries(0):
+            second = self.get_menu('?search=pasta&ordering=price')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(catalog.get_stats()['hits'], 1)
+        self.assertEqual(catalog.get_stats()['misses'], 1)
+
+    def test_menu_writes_invalidate_the_cache(self):
+        self.get_menu()
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch(f'/api/menu-items/{self.item.pk}', {'price': 12})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.get_menu()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['price'], '12.00')
+
+    def test_category_writes_invalidate_the_cache(self):
+        self.get_menu()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.title = 'Main dishes'
+            self.category.save()
+        response = self.get_menu()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['category'], {'id': self.category.pk, 'slug': 'mains', 'title': 'Main dishes'})
+
+    def test_file_based_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'menu': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+            }
+            with override_settings(CACHES=caches, MENU_CACHE_ALIAS='menu'):
+                self.assertEqual(self.get_menu()['X-Cache'], 'MISS')
+                self.assertEqual(self.get_menu()['X-Cache'], 'HIT')
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.item.delete()
+                response = self.get_menu()
+                self.assertEqual(response['X-Cache'], 'MISS')
+                self.assertEqual(response.data['results'], [])
+
+
+class ConditionalRequestTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        self.customer = User.objects.create_user(username='john', password='lemon@123')
+        self.category = Category.objects.create(slug='mains', title='Mains')
+        self.item = MenuItem.objects.create(title='Pasta', price=10, featured=False, category=self.category)
+        self.order = Order.objects.create(user=self.customer, total=10)
+        OrderItem.objects.create(order=self.order, menuitem=self.item, quantity=1, unit_price=10, price=10)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        return client
+
+    def test_menu_list_not_modified(self):
+        client = self.client_for(self.customer)
+        etag = client.get('/api/menu-items/')['ETag']
+        with self.assertNumQueries(0):
+            response = client.get('/api/menu-items/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.create(title='Soup', price=5, featured=True, category=self.category)
+        clear_throttles()
+        response = client.get('/api/menu-items/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_menu_item_not_modified(self):
+        client = self.client_for(self.customer)
+        response = client.get(f'/api/menu-items/{self.item.pk}')
+        self.assertEqual(response.status_code, 200)
+
+        response = client.get(f'/api/menu-items/{self.item.pk}', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = client.get(f'/api/menu-items/{self.item.pk}', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_menu_item_conditional_update(self):
+        client = self.client_for(self.manager)
+        etag = client.get(f'/api/menu-items/{self.item.pk}')['ETag']
+
+        response = client.patch(f'/api/menu-items/{self.item.pk}', {'price': 12}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # The first write changed the item, a second write with the old ETag is rejected
+        response = client.patch(f'/api/menu-items/{self.item.pk}', {'price': 14}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.price, 12)
+
+    def test_order_not_modified(self):
+        client = self.client_for(self.customer)
+        etag = client.get(f'/api/orders/{self.order.pk}')['ETag']
+        response = client.get(f'/api/orders/{self.order.pk}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.order.status = True
+        self.order.save()
+        response = client.get(f'/api/orders/{self.order.pk}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_order_etag_is_not_leaked(self):
+        other = User.objects.create_user(username='jane', password='lemon@123')
+        response = self.client_for(other).get(f'/api/orders/{self.order.pk}', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 403)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        self.customer = User.objects.create_user(username='john', password='lemon@123')
+        category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=5 + i % 4, featured=False, category=category)
+            for i in range(25)
+        ])
+        Order.objects.bulk_create([Order(user=self.customer, total=10 + i % 3) for i in range(25)])
+
+    def walk(self, client, url):
+        # Follow the next links to the end, then the previous links back to the start
+        pages = []
+        while url:
+            clear_caches()
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data['next']
+            previous = response.data['previous']
+
+        backwards = []
+        url = previous
+        while url:
+            clear_caches()
+            response = client.get(url)
+            backwards.insert(0, [row['id'] for row in response.data['results']])
+            url = response.data['previous']
+        self.assertEqual(backwards, pages[:-1])
+        return [pk for page in pages for pk in page]
+
+    def test_menu_items_by_price(self):
+        ids = self.walk(APIClient(), '/api/menu-items/?ordering=-price&page_size=4')
+        expected = list(MenuItem.objects.order_by('-price', '-pk').values_list('pk', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_orders_by_total(self):
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        ids = self.walk(client, '/api/orders/?ordering=total&page_size=7')
+        expected = list(Order.objects.order_by('total', 'pk').values_list('pk', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(KeysetPagination, 'max_page_size', 10):
+            response = APIClient().get('/api/menu-items/?page_size=1000')
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_cursor_must_match_the_ordering(self):
+        response = APIClient().get('/api/menu-items/?ordering=price')
+        response = APIClient().get(response.data['next'].replace('ordering=price', 'ordering=-price'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_query_has_no_count_or_offset(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.manager.pk))
+        next_url = client.get('/api/orders/?page_size=5').data['next']
+        with CaptureQueriesContext(connection) as context:
+            client.get(next_url)
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+
+class MenuSnapshotTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(MENU_SNAPSHOT_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        drinks = Category.objects.create(slug='drinks', title='Drinks')
+        mains = Category.objects.create(slug='mains', title='Mains')
+        Category.objects.create(slug='sides', title='Sides')
+        self.pasta = MenuItem.objects.create(title='Pasta', price=10, featured=True, category=mains)
+        MenuItem.objects.create(title='Lemonade', price='3.50', featured=False, category=drinks)
+        MenuItem.objects.create(title='Burger', price=12, featured=False, category=mains)
+
+    def test_menu_grouped_by_category(self):
+        response = self.client.get('/api/menu/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json(), {'categories': [
+            {'id': Category.objects.get(slug='drinks').pk, 'slug': 'drinks', 'title': 'Drinks', 'items': [
+                {'id': MenuItem.objects.get(title='Lemonade').pk, 'title': 'Lemonade', 'price': '3.50', 'featured': False},
+            ]},
+            {'id': self.pasta.category_id, 'slug': 'mains', 'title': 'Mains', 'items': [
+                {'id': MenuItem.objects.get(title='Burger').pk, 'title': 'Burger', 'price': '12.00', 'featured': False},
+                {'id': self.pasta.pk, 'title': 'Pasta', 'price': '10.00', 'featured': True},
+            ]},
+            {'id': Category.objects.get(slug='sides').pk, 'slug': 'sides', 'title': 'Sides', 'items': []},
+        ]})
+
+        # Served from the files, without the database, for anyone and any number of requests
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                self.assertEqual(self.client.get('/api/menu/').content, response.content)
+        self.assertEqual(self.client.post('/api/menu/').status_code, 405)
+
+    def test_compressed_variants_and_etags(self):
+        plain = self.client.get('/api/menu/')
+        compressed = self.client.get('/api/menu/', headers={'Accept-Encoding': 'br;q=0, gzip, deflate'})
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(compressed['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotEqual(compressed['ETag'], plain['ETag'])
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(self.client.get('/api/menu/', headers={'Accept-Encoding': 'gzip;q=0'}).content, plain.content)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/menu/', headers={'If-None-Match': plain['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], plain['ETag'])
+        response = self.client.get('/api/menu/', headers={'If-None-Match': plain['ETag'], 'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+
+        # A version bump without a change renders the same bytes under the same ETags
+        catalog.bump_version()
+        self.assertEqual(self.client.get('/api/menu/')['ETag'], plain['ETag'])
+
+    def test_menu_changes_render_a_new_snapshot(self):
+        before = self.client.get('/api/menu/')
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.patch(f'/api/menu-items/{self.pasta.pk}', {'price': 11}).status_code, 200)
+
+        after = self.client.get('/api/menu/')
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        self.assertIn(b'"price":"11.00"', after.content)
+        # The files of the previous content are gone
+        digest = snapshot.get_snapshot().digest
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            sorted(f'menu-{digest}.json{suffix}' for suffix in ['', *snapshot.ENCODINGS.values()]),
+        )
+        self.assertEqual(self.client.get('/api/menu/', headers={'If-None-Match': before['ETag']}).status_code, 200)
+
+    def test_missed_version_bump_is_caught_up(self):
+        before = self.client.get('/api/menu/')
+        # A write this process didn't see, as with a catalog version kept per process
+        MenuItem.objects.filter(pk=self.pasta.pk).update(price=11)
+        self.assertEqual(self.client.get('/api/menu/').content, before.content)
+        with mock.patch('time.monotonic', return_value=time.monotonic() + snapshot.get_max_age()):
+            after = self.client.get('/api/menu/')
+        self.assertIn(b'"price":"11.00"', after.content)
+
+    def test_files_removed_by_another_process(self):
+        self.client.get('/api/menu/')
+        MenuItem.objects.filter(pk=self.pasta.pk).update(price=11)
+        catalog.bump_version()
+
+        def remove_all(path):
+            for name in os.listdir(self.directory):
+                os.unlink(os.path.join(self.directory, name))
+
+        # Between the write and the maps, then before the next process maps them
+        with mock.patch.object(snapshot, 'remove_stale', remove_all):
+            response = self.client.get('/api/menu/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'"price":"11.00"', response.content)
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertEqual(snapshot.load(catalog.get_version()).etags, snapshot.get_snapshot().etags)
+        self.assertEqual(len(os.listdir(self.directory)), 1 + len(snapshot.ENCODINGS))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('build_menu_snapshot', stdout=out)
+        self.assertIn(f'catalog version {catalog.get_version()} ready', out.getvalue())
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/menu/').status_code, 200)
+
+
+class MenuItemBulkTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        self.category = Category.objects.create(slug='mains', title='Mains')
+        self.item = MenuItem.objects.create(title='Pasta', price=10, featured=False, category=self.category)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+
+    def test_bulk_create(self):
+        rows = [
+            {'title': f'Dish {i}', 'price': '9.50', 'featured': False, 'category_id': self.category.pk}
+            for i in range(100)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            # Roles, titles, categories, the insert and the savepoint pair
+            with self.assertNumQueries(6):
+                response = self.client.post('/api/menu-items/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(MenuItem.objects.count(), 101)
+        self.assertEqual(response.data['results'][0]['data']['category']['title'], 'Mains')
+
+    def test_bulk_create_reports_per_item_errors(self):
+        rows = [
+            {'title': 'Soup', 'price': '4.00', 'featured': True, 'category_id': self.category.pk},
+            {'title': 'Pasta', 'price': '4.00', 'featured': True, 'category_id': self.category.pk},
+            {'title': 'Soup', 'price': '4.00', 'featured': True, 'category_id': self.category.pk},
+            {'title': 'Salad', 'price': '4.00', 'featured': True, 'category_id': 999},
+            {'title': 'Cake', 'featured': True, 'category_id': self.category.pk},
+        ]
+        response = self.client.post('/api/menu-items/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 400, 400, 400, 400])
+        self.assertIn('title', response.data['results'][1]['errors'])
+        self.assertIn('category_id', response.data['results'][3]['errors'])
+        self.assertIn('price', response.data['results'][4]['errors'])
+        self.assertEqual(MenuItem.objects.count(), 2)
+
+    def test_bulk_update(self):
+        other = MenuItem.objects.create(title='Soup', price=5, featured=False, category=self.category)
+        rows = [
+            {'id': self.item.pk, 'title': 'Soup'},
+            {'id': other.pk, 'title': 'Pasta', 'price': '6.00'},
+            {'id': 999, 'price': '1.00'},
+        ]
+        response = self.client.patch('/api/menu-items/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], [200, 200, 404])
+        self.item.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.item.title, other.title, other.price), ('Soup', 'Pasta', 6))
+
+    def test_bulk_update_rejects_taken_title(self):
+        MenuItem.objects.create(title='Soup', price=5, featured=False, category=self.category)
+        response = self.client.patch('/api/menu-items/bulk/', [{'id': self.item.pk, 'title': 'Soup'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.title, 'Pasta')
+
+    def test_failed_rename_keeps_its_title(self):
+        # Pasta's rename fails on its category, so Soup can't take the title Pasta
+        other = MenuItem.objects.create(title='Soup', price=5, featured=False, category=self.category)
+        rows = [
+            {'id': self.item.pk, 'title': 'Penne', 'category_id': 999},
+            {'id': other.pk, 'title': 'Pasta'},
+        ]
+        response = self.client.patch('/api/menu-items/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['results'][0]['errors'], {'category_id': ["Category does not exist."]})
+        self.assertEqual(response.data['results'][1]['errors'], {'title': ["This field must be unique."]})
+        self.assertEqual(sorted(MenuItem.objects.values_list('title', flat=True)), ['Pasta', 'Soup'])
+
+    def test_bulk_delete(self):
+        response = self.client.delete('/api/menu-items/bulk/', [self.item.pk, 999], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertFalse(MenuItem.objects.exists())
+
+    def test_malformed_ids_fail_their_row(self):
+        response = self.client.delete('/api/menu-items/bulk/', [{'id': self.item.pk}, True, [1], 0], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['status'] for result in response.data['results']], [400] * 4)
+        self.assertTrue(MenuItem.objects.exists())
+
+        rows = [{'id': [self.item.pk], 'price': '1.00'}, {'id': True, 'price': '1.00'}, [self.item.pk], 'x', {'price': '1.00'}]
+        response = self.client.patch('/api/menu-items/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], [400] * 5)
+        self.assertEqual([list(result['errors']) for result in results], [['id'], ['id'], ['non_field_errors'], ['non_field_errors'], ['id']])
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.price, 10)
+
+    def test_only_managers(self):
+        customer = User.objects.create_user(username='john', password='lemon@123')
+        client = APIClient()
+        client.force_authenticate(customer)
+        response = client.post('/api/menu-items/bulk/', [{'title': 'Soup'}], format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class CartBatchTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.customer = User.objects.create_user(username='john', password='lemon@123')
+        category = Category.objects.create(slug='mains', title='Mains')
+        self.items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=2 + i, featured=False, category=category)
+            for i in range(12)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+
+    def lines(self):
+        return {
+            cart.menuitem_id: (cart.quantity, cart.unit_price, cart.price)
+            for cart in Cart.objects.filter(user=self.customer)
+        }
+
+    def test_add_many_lines_at_once(self):
+        rows = [{'menuitem_id': item.pk, 'quantity': 2} for item in self.items]
+        # Roles, prices, the upsert, the savepoint pair and the cart that is returned
+        with self.assertNumQueries(6):
+            response = self.client.post('/api/cart/menu-items/batch/', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 12)
+        self.assertEqual(self.lines()[self.items[3].pk], (2, 5, 10))
+
+    def test_add_overwrites_existing_lines(self):
+        Cart.objects.create(user=self.customer, menuitem=self.items[0], quantity=5, unit_price=2, price=10)
+        rows = [{'menuitem_id': self.items[0].pk, 'quantity': 1}, {'menuitem_id': self.items[1].pk, 'quantity': 3}]
+        self.client.post('/api/cart/menu-items/batch/', rows, format='json')
+        self.assertEqual(self.lines(), {self.items[0].pk: (1, 2, 2), self.items[1].pk: (3, 3, 9)})
+
+    def test_update_quantities(self):
+        self.client.post('/api/cart/menu-items/batch/', [{'menuitem_id': self.items[2].pk, 'quantity': 1}], format='json')
+        response = self.client.patch('/api/cart/menu-items/batch/', [{'menuitem_id': self.items[2].pk, 'quantity': 4}], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lines(), {self.items[2].pk: (4, 4, 16)})
+
+        response = self.client.patch('/api/cart/menu-items/batch/', [{'menuitem_id': self.items[3].pk, 'quantity': 4}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_remove_some_lines(self):
+        rows = [{'menuitem_id': item.pk, 'quantity': 1} for item in self.items[:3]]
+        self.client.post('/api/cart/menu-items/batch/', rows, format='json')
+        response = self.client.delete('/api/cart/menu-items/batch/', [self.items[0].pk, self.items[1].pk], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.lines()), [self.items[2].pk])
+
+    def test_invalid_batch_changes_nothing(self):
+        rows = [{'menuitem_id': self.items[0].pk, 'quantity': 1}, {'menuitem_id': 999, 'quantity': 1}]
+        response = self.client.post('/api/cart/menu-items/batch/', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        rows = [{'menuitem_id': self.items[0].pk, 'quantity': 1}, {'menuitem_id': self.items[0].pk, 'quantity': 0}]
+        response = self.client.post('/api/cart/menu-items/batch/', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.lines(), {})
+
+
+@override_settings(CART_BACKEND='LittleLemonAPI.carts.CacheCart')
+class CacheCartTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.customer = User.objects.create_user(username='john', password='lemon@123')
+        category = Category.objects.create(slug='mains', title='Mains')
+        self.items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=2 + i, featured=False, category=category)
+            for i in range(6)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.customer.pk))
+
+    def get_cart(self, urlconf=SYNC_URLCONF):
+        with override_settings(ROOT_URLCONF=urlconf):
+            return self.client.get('/api/cart/menu-items/?page_size=10').json()
+
+    def test_same_output_as_the_cart_table(self):
+        rows = [{'menuitem_id': item.pk, 'quantity': 2} for item in self.items[:4]]
+        changes = [
+            ('post', rows),
+            ('patch', [{'menuitem_id': self.items[1].pk, 'quantity': 5}]),
+            ('delete', [self.items[0].pk]),
+        ]
+        outputs = {}
+        for backend in ('DatabaseCart', 'CacheCart'):
+            with override_settings(CART_BACKEND=f'LittleLemonAPI.carts.{backend}'):
+                responses = [
+                    getattr(self.client, method)('/api/cart/menu-items/batch/', body, format='json').json()
+                    for method, body in changes
+                ]
+                outputs[backend] = [*responses, self.get_cart(), self.get_cart(ASYNC_URLCONF)]
+                Cart.objects.all().delete()
+                clear_caches()
+
+        # The ids are the line numbers of the cache entry, not the Cart primary keys
+        for output in outputs.values():
+            for response in output:
+                lines = response['results'] if isinstance(response, dict) else response
+                for line in lines:
+                    line.pop('id')
+        self.assertEqual(outputs['CacheCart'], outputs['DatabaseCart'])
+
+    def test_same_prices_and_totals_as_the_cart_table(self):
+        outputs = {}
+        for backend in ('DatabaseCart', 'CacheCart'):
+            with override_settings(CART_BACKEND=f'LittleLemonAPI.carts.{backend}'):
+                line = self.client.post(
+                    '/api/cart/menu-items/', {'menuitem_id': self.items[3].pk, 'quantity': 2}, format='json'
+                ).json()
+                line.pop('id')
+                with self.captureOnCommitCallbacks(execute=True):
+                    order = self.client.post('/api/orders/').json()
+                outputs[backend] = (line, order['total'], list(OrderItem.objects.filter(order=order['id']).values_list(
+                    'quantity', 'unit_price', 'price'
+                )))
+        self.assertEqual(outputs['DatabaseCart'][0]['unit_price'], 5)
+        self.assertEqual(outputs['DatabaseCart'][1], '10.00')
+        self.assertEqual(outputs['CacheCart'], outputs['DatabaseCart'])
+
+    def test_cart_changes_do_not_write(self):
+        with self.assertNumQueries(2):
+            # Roles and the menu item, nothing is written
+            response = self.client.post(
+                '/api/cart/menu-items/', {'menuitem_id': self.items[2].pk, 'quantity': 3}, format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['id'], response.data['unit_price'], response.data['price']), (1, 4, 12))
+        self.assertEqual(response.data['menuitem']['title'], 'Item 2')
+
+        duplicate = self.client.post('/api/cart/menu-items/', {'menuitem_id': self.items[2].pk, 'quantity': 1}, format='json')
+        self.assertEqual(duplicate.status_code, 400)
+        missing = self.client.post('/api/cart/menu-items/', {'menuitem_id': 999, 'quantity': 1}, format='json')
+        self.assertEqual(missing.status_code, 400)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_concurrent_changes(self):
+        backend = carts.CacheCart()
+        get_entry = carts.CacheCart.get_entry
+
+        def slow_get_entry(cart, user):
+            # Widens the window between reading the entry and writing it back
+            entry = get_entry(cart, user)
+            time.sleep(0.01)
+            return entry
+
+        def add(item):
+            backend.set_quantities(self.customer, {item.pk: 1}, {item.pk: item.price})
+
+        with mock.patch.object(carts.CacheCart, 'get_entry', slow_get_entry):
+            threads = [threading.Thread(target=add, args=(item,)) for item in self.items]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        lines = backend.get_entry(self.customer)['lines']
+        self.assertEqual(sorted(lines), sorted(item.pk for item in self.items))
+        self.assertEqual(sorted(line_id for line_id, _, _ in lines.values()), list(range(1, 7)))
+        self.assertIsNone(backend.cache.get(f'{backend.get_key(self.customer.pk)}:lock'))
+
+    def test_clear(self):
+        self.client.post('/api/cart/menu-items/', {'menuitem_id': self.items[2].pk, 'quantity': 3}, format='json')
+        self.assertEqual(self.client.delete('/api/cart/menu-items/').status_code, 204)
+        self.assertEqual(self.client.delete('/api/cart/menu-items/').status_code, 404)
+        self.assertEqual(self.get_cart()['results'], [])
+
+    def test_deleted_menu_items_leave_the_cart(self):
+        rows = [{'menuitem_id': item.pk, 'quantity': 1} for item in self.items[:2]]
+        self.client.post('/api/cart/menu-items/batch/', rows, format='json')
+        self.items[0].delete()
+        self.assertEqual([line['menuitem']['id'] for line in self.get_cart()['results']], [self.items[1].pk])
+
+        response = self.client.post('/api/orders/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total'], '3.00')
+
+    def test_checkout_writes_the_cart(self):
+        rows = [{'menuitem_id': item.pk, 'quantity': 2} for item in self.items[:3]]
+        self.client.post('/api/cart/menu-items/batch/', rows, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/orders/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total'], '18.00')
+        self.assertEqual(
+            sorted(OrderItem.objects.values_list('quantity', 'unit_price', 'price')),
+            [(2, 2, 4), (2, 3, 6), (2, 4, 8)],
+        )
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(self.get_cart()['results'], [])
+        self.assertEqual(self.client.post('/api/orders/').status_code, 404)
+
+    def test_failed_checkout_keeps_the_cart(self):
+        self.client.post('/api/cart/menu-items/batch/', [{'menuitem_id': self.items[0].pk, 'quantity': 1}], format='json')
+        with mock.patch('LittleLemonAPI.checkout.copy_cart_to_order', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/api/orders/')
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(len(self.get_cart()['results']), 1)
+
+    @override_settings(QUEUED_CHECKOUT=True)
+    def test_queued_checkout(self):
+        self.client.post('/api/cart/menu-items/batch/', [{'menuitem_id': self.items[0].pk, 'quantity': 4}], format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/orders/')
+        self.assertEqual(response.status_code, 202)
+        # The cart is in the table for the worker, a second click finds the same job
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(self.client.post('/api/orders/').data['id'], response.data['id'])
+
+        checkout.process_batch()
+        self.assertEqual(Order.objects.get().total, 8)
+        self.assertFalse(Cart.objects.exists())
+
+    @override_settings(QUEUED_CHECKOUT=True)
+    def test_failed_queued_checkout_gives_the_cart_back(self):
+        rows = [{'menuitem_id': item.pk, 'quantity': 2} for item in self.items[:2]]
+        self.client.post('/api/cart/menu-items/batch/', rows, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/orders/').status_code, 202)
+        # Added while the job waits, the cached line stays as it is
+        self.client.post('/api/cart/menu-items/', {'menuitem_id': self.items[1].pk, 'quantity': 5}, format='json')
+
+        with mock.patch('LittleLemonAPI.checkout.copy_cart_to_order', side_effect=RuntimeError('kitchen closed')):
+            checkout.process_batch()
+        self.assertEqual(CheckoutJob.objects.get().status, CheckoutJob.FAILED)
+        self.assertFalse(Cart.objects.exists())
+        lines = self.get_cart()['results']
+        self.assertEqual(
+            sorted((line['menuitem']['id'], line['quantity'], line['price']) for line in lines),
+            [(self.items[0].pk, 2, 4), (self.items[1].pk, 5, 15)],
+        )
+        self.assertEqual(len({line['id'] for line in lines}), 2)
+
+        # The next checkout orders what the customer sees
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/orders/')
+        checkout.process_batch()
+        self.assertEqual(Order.objects.get().total, 19)
+
+
+class OrderBulkTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        crew_group = Group.objects.create(name='Delivery Crew')
+        self.crew = [User.objects.create_user(username=f'rider{i}', password='lemon@123') for i in range(3)]
+        for rider in self.crew:
+            rider.groups.add(crew_group)
+        self.customer = User.objects.create_user(username='customer', password='lemon@123')
+        self.orders = Order.objects.bulk_create([Order(user=self.customer, total=10) for _ in range(50)])
+        self.client = APIClient()
+
+    def test_manager_assigns_with_one_update_per_value(self):
+        self.client.force_authenticate(self.manager)
+        rows = [
+            {'id': order.pk, 'delivery_crew': self.crew[i % 3].pk, 'status': i % 2 == 0}
+            for i, order in enumerate(self.orders)
+        ]
+        before = Order.objects.get(pk=self.orders[0].pk).updated_at
+        # Roles, the crew check, the orders, 3 crew + 2 status updates and the savepoint pair
+        with self.assertNumQueries(10):
+            response = self.client.patch('/api/orders/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][1]['data'], {'id': self.orders[1].pk, 'status': False, 'delivery_crew': self.crew[1].pk})
+        self.assertEqual(
+            sorted(Order.objects.values_list('pk', 'delivery_crew', 'status')),
+            [(order.pk, self.crew[i % 3].pk, i % 2 == 0) for i, order in enumerate(self.orders)],
+        )
+        # The order ETags follow updated_at, update() doesn't set it by itself
+        self.assertGreater(Order.objects.get(pk=self.orders[0].pk).updated_at, before)
+
+        # Unassigning
+        response = self.client.patch('/api/orders/bulk/', [{'id': self.orders[0].pk, 'delivery_crew': None}], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(Order.objects.get(pk=self.orders[0].pk).delivery_crew_id)
+
+    def test_per_order_outcomes(self):
+        self.client.force_authenticate(self.manager)
+        rows = [
+            {'id': self.orders[0].pk, 'status': True},
+            {'id': self.orders[0].pk, 'status': False},
+            {'id': 99999, 'status': True},
+            {'id': self.orders[1].pk, 'delivery_crew': self.customer.pk},
+            {'id': self.orders[2].pk},
+            {'id': self.orders[3].pk, 'status': 'maybe'},
+        ]
+        response = self.client.patch('/api/orders/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], [200, 400, 404, 400, 400, 400])
+        self.assertIn('delivery_crew', response.data['results'][3]['errors'])
+        self.assertEqual(list(Order.objects.filter(status=True).values_list('pk', flat=True)), [self.orders[0].pk])
+        self.assertIsNone(Order.objects.get(pk=self.orders[1].pk).delivery_crew_id)
+
+        self.assertEqual(self.client.patch('/api/orders/bulk/', [], format='json').status_code, 400)
+        self.assertEqual(self.client.patch('/api/orders/bulk/', {'id': 1}, format='json').status_code, 400)
+
+    def test_crew_only_sets_the_status_of_their_orders(self):
+        Order.objects.filter(pk__in=[order.pk for order in self.orders[:2]]).update(delivery_crew=self.crew[0])
+        Order.objects.filter(pk=self.orders[2].pk).update(delivery_crew=self.crew[1])
+        self.client.force_authenticate(self.crew[0])
+        rows = [
+            {'id': self.orders[0].pk, 'status': True},
+            {'id': self.orders[1].pk, 'status': True, 'delivery_crew': self.crew[0].pk},
+            {'id': self.orders[2].pk, 'status': True},
+            {'id': self.orders[3].pk, 'status': True},
+        ]
+        response = self.client.patch('/api/orders/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], [200, 403, 403, 403])
+        self.assertEqual(list(Order.objects.filter(status=True).values_list('pk', flat=True)), [self.orders[0].pk])
+
+        self.client.force_authenticate(self.customer)
+        response = self.client.patch('/api/orders/bulk/', [{'id': self.orders[0].pk, 'status': False}], format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class DispatchTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        self.crew_group = Group.objects.create(name='Delivery Crew')
+        self.crew = [User.objects.create_user(username=f'rider{i}', password='lemon@123') for i in range(3)]
+        for rider in self.crew:
+            rider.groups.add(self.crew_group)
+        self.customer = User.objects.create_user(username='customer', password='lemon@123')
+
+    def open_orders(self):
+        return dict(
+            Order.objects.filter(status=False, delivery_crew__isnull=False)
+            .values_list('delivery_crew').annotate(count=Count('pk')).order_by()
+        )
+
+    def test_fairness_and_throughput_on_10k_pending_orders(self):
+        # Uneven loads to start with, delivered orders don't count
+        Order.objects.bulk_create(
+            [Order(user=self.customer, total=10, delivery_crew=self.crew[0]) for _ in range(500)]
+            + [Order(user=self.customer, total=10, delivery_crew=self.crew[1]) for _ in range(100)]
+            + [Order(user=self.customer, total=10, delivery_crew=self.crew[2], status=True) for _ in range(1000)]
+        )
+        # Not dispatched to: an inactive crew member and a customer
+        inactive = User.objects.create_user(username='retired', password='lemon@123', is_active=False)
+        inactive.groups.add(self.crew_group)
+        Order.objects.bulk_create([Order(user=self.customer, total=10) for _ in range(10_000)])
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('dispatch_orders', '--batch-size', '1000', stdout=out)
+        self.assertIn('Dispatched 10000 orders to 3 crew members', out.getvalue())
+        self.assertFalse(Order.objects.filter(delivery_crew__isnull=True).exists())
+
+        # The two least loaded members are levelled with the first before it gets any more
+        loads = self.open_orders()
+        self.assertEqual(sum(loads.values()), 10_600)
+        self.assertLessEqual(max(loads.values()) - min(loads.values()), 1)
+        self.assertNotIn(inactive.pk, loads)
+        # Crew and loads, then per batch the backlog, an UPDATE per member and the savepoint pair
+        self.assertLessEqual(len(queries), 2 + 10 * (1 + 3 + 2) + 1)
+
+    def test_oldest_orders_first(self):
+        orders = Order.objects.bulk_create([Order(user=self.customer, total=10) for _ in range(4)])
+        for order, day in zip(orders, ['2024-01-04', '2024-01-01', '2024-01-03', '2024-01-02']):
+            Order.objects.filter(pk=order.pk).update(date=day)
+        before = Order.objects.get(pk=orders[1].pk).updated_at
+
+        loads, assigned = dispatch.dispatch(batch_size=1, limit=2)
+        self.assertEqual(sum(assigned.values()), 2)
+        self.assertEqual(
+            set(Order.objects.filter(delivery_crew__isnull=False).values_list('pk', flat=True)),
+            {orders[1].pk, orders[3].pk},
+        )
+        self.assertGreater(Order.objects.get(pk=orders[1].pk).updated_at, before)
+
+    def test_endpoint(self):
+        Order.objects.bulk_create([Order(user=self.customer, total=10) for _ in range(7)])
+        Order.objects.create(user=self.customer, total=10, delivery_crew=self.crew[2])
+        client = APIClient()
+        client.force_authenticate(self.crew[0])
+        self.assertEqual(client.post('/api/orders/dispatch/').status_code, 403)
+
+        client.force_authenticate(self.manager)
+        self.assertEqual(client.post('/api/orders/dispatch/', {'limit': 0}, format='json').status_code, 400)
+        response = client.post('/api/orders/dispatch/', {'limit': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'assigned': 5, 'crew': [
+            {'delivery_crew': self.crew[0].pk, 'assigned': 2, 'open_orders': 2},
+            {'delivery_crew': self.crew[1].pk, 'assigned': 2, 'open_orders': 2},
+            {'delivery_crew': self.crew[2].pk, 'assigned': 1, 'open_orders': 2},
+        ]})
+        response = client.post('/api/orders/dispatch/')
+        self.assertEqual(response.data['assigned'], 2)
+
+        self.crew_group.user_set.clear()
+        response = client.post('/api/orders/dispatch/')
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderEventsTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        self.rider = User.objects.create_user(username='rider', password='lemon@123')
+        self.rider.groups.add(Group.objects.create(name='Delivery Crew'))
+        self.customers = [User.objects.create_user(username=f'customer{i}', password='lemon@123') for i in range(2)]
+        self.tokens = {user.pk: Token.objects.create(user=user).key for user in [self.manager, self.rider, *self.customers]}
+        self.order = Order.objects.create(user=self.customers[0], total=10)
+        self.other_order = Order.objects.create(user=self.customers[0], total=10)
+
+    async def open_stream(self, app, user, query=''):
+        # A raw ASGI request kept open until disconnect() is set, the test
+        # clients wait for the whole response
+        messages = asyncio.Queue()
+        disconnect = asyncio.Event()
+        received = []
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': '/api/orders/events/', 'raw_path': b'/api/orders/events/', 'query_string': query.encode(),
+            'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+            'headers': [
+                (b'host', b'testserver'), (b'accept', b'text/event-stream'),
+                (b'authorization', f'Token {self.tokens[user.pk]}'.encode()),
+            ],
+        }
+        task = asyncio.create_task(app(scope, receive, messages.put))
+        return task, disconnect, messages
+
+    async def read(self, messages, timeout=5):
+        message = await asyncio.wait_for(messages.get(), timeout)
+        return message.get('body', b'').decode() if message['type'] == 'http.response.body' else message
+
+    def change_order(self):
+        # Runs in the test's thread, where its transaction is
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.patch(f'/api/orders/{self.order.pk}', {'delivery_crew': self.rider.pk, 'status': True})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+    async def test_thousands_of_idle_subscribers(self):
+        # As the test clients do, the requests must not close the test's connection
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        app = ASGIHandler()
+        broker = events.get_broker()
+        counts = {self.manager.pk: 250, self.rider.pk: 250, self.customers[0].pk: 750, self.customers[1].pk: 750}
+        users = {user.pk: user for user in [self.manager, self.rider, *self.customers]}
+        streams = [(pk, await self.open_stream(app, users[pk])) for pk, count in counts.items() for _ in range(count)]
+        # A customer following one order only
+        watched = await self.open_stream(app, self.customers[0], f'order={self.other_order.pk}')
+
+        async def started(messages):
+            return await messages.get(), await self.read(messages)
+
+        # Opening them all goes through the middleware and the caches one request at a time
+        responses = await asyncio.wait_for(asyncio.gather(*[
+            started(messages) for pk, (task, disconnect, messages) in [*streams, (None, watched)]
+        ]), 120)
+        for start, body in responses:
+            self.assertEqual(start['status'], 200)
+            self.assertIn((b'Content-Type', b'text/event-stream; charset=utf-8'), start['headers'])
+            self.assertEqual(body, 'retry: 3000\n\n')
+        self.assertEqual(broker.count(), 2001)
+
+        await sync_to_async(self.change_order)()
+        event = f'event: order\ndata: {json.dumps({"id": self.order.pk, "user": self.customers[0].pk, "delivery_crew": self.rider.pk, "status": True})}\n\n'
+        for pk, (task, disconnect, messages) in streams:
+            if pk == self.customers[1].pk:
+                self.assertTrue(messages.empty())
+            else:
+                self.assertEqual(await self.read(messages), event)
+        self.assertTrue(watched[2].empty())
+
+        # Disconnected clients leave nothing behind
+        for pk, (task, disconnect, messages) in [*streams, (None, watched)]:
+            disconnect.set()
+        await asyncio.wait_for(asyncio.gather(*[task for pk, (task, disconnect, messages) in streams], watched[0]), 30)
+        self.assertEqual(broker.count(), 0)
+
+    async def test_keepalive_and_reconnect(self):
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        with override_settings(ROOT_URLCONF=ASYNC_URLCONF, ORDER_EVENTS_KEEPALIVE=0.05, ORDER_EVENTS_MAX_AGE=0.12):
+            task, disconnect, messages = await self.open_stream(ASGIHandler(), self.customers[1])
+            self.assertEqual((await self.read(messages))['status'], 200)
+            self.assertEqual(await self.read(messages), 'retry: 3000\n\n')
+            self.assertEqual(await self.read(messages), ': keepalive\n\n')
+            await asyncio.wait_for(task, 5)
+        self.assertEqual(events.get_broker().count(), 0)
+
+    def test_bulk_updates_and_dispatch_publish(self):
+        broker = events.get_broker()
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            dispatch.dispatch()
+        self.assertEqual(
+            sorted(call.args[1][1]['id'] for call in publish.call_args_list), [self.order.pk, self.other_order.pk]
+        )
+        self.assertEqual(publish.call_args_list[0].args[0], ['orders', f'user.{self.customers[0].pk}', f'crew.{self.rider.pk}'])
+
+        client = APIClient()
+        client.force_authenticate(self.rider)
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            client.patch('/api/orders/bulk/', [{'id': self.order.pk, 'status': True}], format='json')
+        publish.assert_called_once_with(
+            ['orders', f'user.{self.customers[0].pk}', f'crew.{self.rider.pk}'],
+            ('order', {'id': self.order.pk, 'user': self.customers[0].pk, 'delivery_crew': self.rider.pk, 'status': True}),
+        )
+
+    def test_long_poll_under_wsgi(self):
+        # The sync test client goes through the WSGI handler
+        client = APIClient()
+        client.force_authenticate(self.customers[1])
+        with override_settings(ORDER_EVENTS_WSGI_MAX_AGE=0.1):
+            response = client.get('/api/orders/events/')
+        # iter() consumes the stream the way the WSGI handler does
+        self.assertEqual(b''.join(response), b'retry: 0\n\n')
+
+        # Ends with the first event instead of waiting for the rest of the 5 seconds
+        stop = threading.Event()
+
+        def publish():
+            while not stop.wait(0.05):
+                events.publish_order(self.order.pk, self.customers[1].pk, None, True)
+
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        try:
+            start = time.monotonic()
+            body = b''.join(client.get('/api/orders/events/')).decode()
+        finally:
+            stop.set()
+            publisher.join()
+        self.assertLess(time.monotonic() - start, 4)
+        self.assertEqual(body.count('event: order\n'), 1)
+
+    def test_anonymous(self):
+        with override_settings(ROOT_URLCONF=ASYNC_URLCONF):
+            response = APIClient().get('/api/orders/events/')
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(response.content.startswith(b'event: error\n'))
+
+
+class CheckoutTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.customer = User.objects.create_user(username='john', password='lemon@123')
+        category = Category.objects.create(slug='mains', title='Mains')
+        items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=2 + i, featured=False, category=category)
+            for i in range(3)
+        ])
+        Cart.objects.bulk_create([
+            Cart(user=self.customer, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+            for item in items
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_checkout_moves_the_cart_into_an_order(self):
+        response = self.client.post('/api/orders/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total'], '18.00')
+
+        order = Order.objects.get()
+        self.assertEqual(order.total, 18)
+        self.assertEqual(
+            sorted(OrderItem.objects.filter(order=order).values_list('quantity', 'unit_price', 'price')),
+            [(2, 2, 4), (2, 3, 6), (2, 4, 8)],
+        )
+        self.assertFalse(Cart.objects.exists())
+
+    def test_empty_cart(self):
+        Cart.objects.all().delete()
+        response = self.client.post('/api/orders/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Order.objects.exists())
+
+    def test_failed_checkout_leaves_nothing_behind(self):
+        with mock.patch('LittleLemonAPI.checkout.copy_cart_to_order', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/api/orders/')
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.count(), 3)
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    def test_parallel_checkouts_create_one_order(self):
+        clear_caches()
+        customer = User.objects.create_user(username='john', password='lemon@123')
+        category = Category.objects.create(slug='mains', title='Mains')
+        items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=5, featured=False, category=category) for i in range(5)
+        ])
+        Cart.objects.bulk_create([
+            Cart(user=customer, menuitem=item, quantity=1, unit_price=5, price=5) for item in items
+        ])
+
+        barrier = threading.Barrier(8)
+        statuses = []
+
+        def checkout():
+            client = APIClient()
+            client.force_authenticate(customer)
+            try:
+                barrier.wait()
+                statuses.append(client.post('/api/orders/').status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=checkout) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [201] + [404] * 7)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 5)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_transactions_take_the_write_lock(self):
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            Category.objects.count()
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+
+@override_settings(QUEUED_CHECKOUT=True)
+class QueuedCheckoutTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.customer = User.objects.create_user(username='john', password='lemon@123')
+        category = Category.objects.create(slug='mains', title='Mains')
+        self.items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=2 + i, featured=False, category=category)
+            for i in range(3)
+        ])
+        self.fill_cart(self.customer)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def fill_cart(self, user):
+        Cart.objects.bulk_create([
+            Cart(user=user, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+            for item in self.items
+        ])
+
+    def test_checkout_is_queued(self):
+        response = self.client.post('/api/orders/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertIsNone(response.data['order'])
+        self.assertTrue(response['Location'].endswith(f'/api/orders/checkouts/{response.data["id"]}'))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.count(), 3)
+
+        # Checking out again while the job waits returns the same job
+        again = self.client.post('/api/orders/')
+        self.assertEqual(again.status_code, 202)
+        self.assertEqual(again.data['id'], response.data['id'])
+        self.assertEqual(CheckoutJob.objects.count(), 1)
+
+    def test_empty_cart_is_not_queued(self):
+        Cart.objects.all().delete()
+        response = self.client.post('/api/orders/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CheckoutJob.objects.exists())
+
+    def test_batch_creates_the_orders(self):
+        customers = [self.customer]
+        for i in range(4):
+            customer = User.objects.create_user(username=f'customer{i}', password='lemon@123')
+            self.fill_cart(customer)
+            customers.append(customer)
+        jobs = [checkout.enqueue(customer) for customer in customers]
+        # A cart emptied while its job waited
+        Cart.objects.filter(user=customers[-1]).delete()
+
+        broker = events.get_broker()
+        with mock.patch.object(broker, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(checkout.process_batch(10), 5)
+
+        self.assertEqual(Order.objects.count(), 4)
+        self.assertEqual(OrderItem.objects.count(), 12)
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(DailySales.objects.get().orders, 4)
+        for job in jobs[:4]:
+            job.refresh_from_db()
+            self.assertEqual(job.status, CheckoutJob.DONE)
+            self.assertEqual(job.order.user_id, job.user_id)
+            self.assertEqual(job.order.total, 18)
+            self.assertIsNotNone(job.processed_at)
+        jobs[4].refresh_from_db()
+        self.assertEqual((jobs[4].status, jobs[4].order, jobs[4].error), (CheckoutJob.FAILED, None, 'No items in the Cart'))
+
+        checkouts = [call.args for call in publish.call_args_list if call.args[1][0] == 'checkout']
+        self.assertEqual(len(checkouts), 5)
+        self.assertIn(
+            ([f'user.{self.customer.pk}'], ('checkout', {'id': jobs[0].pk, 'status': 'done', 'order': jobs[0].order_id, 'error': ''})),
+            checkouts,
+        )
+        self.assertEqual(checkout.process_batch(10), 0)
+
+    def test_failed_job_leaves_the_cart(self):
+        job = checkout.enqueue(self.customer)
+        with mock.patch('LittleLemonAPI.checkout.copy_cart_to_order', side_effect=DatabaseError('disk full')):
+            self.assertEqual(checkout.process_batch(10), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (CheckoutJob.FAILED, 'disk full'))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.count(), 3)
+
+        # The customer can check out again
+        self.assertEqual(self.client.post('/api/orders/').status_code, 202)
+
+    def test_job_status(self):
+        job_id = self.client.post('/api/orders/').data['id']
+        call_command('process_checkouts', '--drain', stdout=StringIO())
+
+        response = self.client.get(f'/api/orders/checkouts/{job_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['order'], Order.objects.get().pk)
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='jane', password='lemon@123'))
+        self.assertEqual(other.get(f'/api/orders/checkouts/{job_id}').status_code, 403)
+        self.assertEqual(self.client.get(f'/api/orders/checkouts/{job_id + 1}').status_code, 404)
+
+
+class FullTextSearchTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.mains = Category.objects.create(slug='mains', title='Mains')
+        self.desserts = Category.objects.create(slug='desserts', title='Desserts')
+        MenuItem.objects.create(title='Pasta Carbonara', price=12, featured=False, category=self.mains)
+        MenuItem.objects.create(title='Pasta Pasta Pomodoro', price=10, featured=True, category=self.mains)
+        MenuItem.objects.create(title='Lemon Cake', price=6, featured=False, category=self.desserts)
+
+    def titles(self, query):
+        clear_caches()
+        response = APIClient().get(f'/api/menu-items/{query}')
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.data['results']]
+
+    def test_index_is_available(self):
+        self.assertTrue(search.is_available())
+
+    def test_prefix_match_by_relevance(self):
+        self.assertEqual(self.titles('?q=past&page_size=10'), ['Pasta Pasta Pomodoro', 'Pasta Carbonara'])
+        self.assertEqual(self.titles('?q=past+carb'), ['Pasta Carbonara'])
+        self.assertEqual(self.titles('?q=dessert'), ['Lemon Cake'])
+
+    def test_index_follows_writes(self):
+        item = MenuItem.objects.get(title='Lemon Cake')
+        item.title = 'Lime Pie'
+        item.save()
+        MenuItem.objects.bulk_create([MenuItem(title='Lemon Tart', price=5, featured=False, category=self.mains)])
+        self.desserts.title = 'Sweets'
+        self.desserts.save()
+
+        self.assertEqual(self.titles('?q=lemon'), ['Lemon Tart'])
+        self.assertEqual(self.titles('?q=sweets'), ['Lime Pie'])
+        MenuItem.objects.filter(title='Lime Pie').delete()
+        self.assertEqual(self.titles('?q=sweets'), [])
+
+    def test_operators_are_plain_text(self):
+        self.assertEqual(self.titles('?q=%22pasta+OR+NEAR('), [])
+
+    def test_pages_follow_relevance(self):
+        clear_caches()
+        response = APIClient().get('/api/menu-items/?q=pasta&page_size=1')
+        first = response.data['results'][0]['title']
+        clear_caches()
+        response = APIClient().get(response.data['next'])
+        self.assertEqual([first, response.data['results'][0]['title']], ['Pasta Pasta Pomodoro', 'Pasta Carbonara'])
+        self.assertIsNone(response.data['next'])
+
+    def test_fallback_without_index(self):
+        with mock.patch.object(search, 'is_available', return_value=False):
+            self.assertEqual(sorted(self.titles('?q=asta&page_size=10')), ['Pasta Carbonara', 'Pasta Pasta Pomodoro'])
+
+
+class SearchIndexSchemaTest(TransactionTestCase):
+    # The SQLite schema editor can't run in the atomic block of a TestCase
+    def alter_field(self, model, name, field):
+        old = model._meta.get_field(name)
+        field.set_attributes_from_name(name)
+        field.model = model
+        with connection.schema_editor() as editor:
+            editor.alter_field(model, old, field)
+        return old, field
+
+    def test_table_rebuilds_keep_the_index(self):
+        category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.create(title='Pasta', price=5, featured=False, category=category)
+        # Both rebuild the table, the triggers read the one and are on the other
+        changes = [
+            (Category, 'slug', models.SlugField(max_length=100)),
+            (MenuItem, 'title', models.CharField(max_length=300, db_index=True)),
+        ]
+        altered = [(model, self.alter_field(model, name, field)) for model, name, field in changes]
+        try:
+            MenuItem.objects.create(title='Lemon Cake', price=5, featured=False, category=category)
+            Category.objects.filter(pk=category.pk).update(title='Sweets')
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT title, category_title FROM {search.TABLE} ORDER BY rowid')
+                self.assertEqual(cursor.fetchall(), [('Pasta', 'Sweets'), ('Lemon Cake', 'Sweets')])
+        finally:
+            for model, (old, new) in altered:
+                with connection.schema_editor() as editor:
+                    editor.alter_field(model, new, old)
+
+    def test_migrate_only_restores_an_existing_index(self):
+        search.drop_search_index(connection)
+        try:
+            # As after `migrate LittleLemonAPI 0004`
+            signals.restore_search_index(sender=None, using='default')
+            self.assertNotIn(search.TABLE, connection.introspection.table_names())
+        finally:
+            search.ensure_search_index(connection)
+        self.assertTrue(search.is_available())
+
+
+class ExplainQueriesTest(TestCase):
+    def test_list_queries_use_the_composite_indexes(self):
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        output = out.getvalue()
+        for index in ('order_user_date_idx', 'order_crew_date_idx', 'order_open_crew_date_idx',
+                      'order_open_date_idx', 'menuitem_featured_price_idx'):
+            self.assertIn(index, output)
+
+
+def take_tokens(path, count, results):
+    store = BucketStore(path)
+    results.put(sum(store.take('shared', 50, 0.001, 1000.0)[0] for _ in range(count)))
+
+
+class TokenBucketThrottleTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        Category.objects.create(slug='mains', title='Mains')
+
+    def test_tests_keep_off_the_configured_buckets(self):
+        self.assertTrue(get_store().path.startswith(_throttle_directory.name))
+
+    def test_burst_then_refill(self):
+        with mock.patch('rest_framework.throttling.SimpleRateThrottle.timer', return_value=1000.0):
+            statuses = [APIClient().get('/api/menu-items/').status_code for _ in range(3)]
+            self.assertEqual(statuses, [200, 200, 429])
+            response = APIClient().get('/api/menu-items/')
+        # 2/minute refills one token every 30 seconds
+        self.assertEqual(response['Retry-After'], '30')
+
+        with mock.patch('rest_framework.throttling.SimpleRateThrottle.timer', return_value=1030.0):
+            statuses = [APIClient().get('/api/menu-items/').status_code for _ in range(2)]
+        self.assertEqual(statuses, [200, 429])
+
+    def test_buckets_are_per_client(self):
+        user = User.objects.create_user(username='john', password='lemon@123')
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual([APIClient().get('/api/menu-items/').status_code for _ in range(3)], [200, 200, 429])
+        # The user throttle has its own bucket, the anonymous one doesn't apply
+        self.assertEqual([client.get('/api/menu-items/').status_code for _ in range(6)], [200] * 5 + [429])
+
+    def test_buckets_are_shared_between_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'throttle.sqlite3')
+            context = multiprocessing.get_context('fork')
+            results = context.Queue()
+            processes = [context.Process(target=take_tokens, args=(path, 40, results)) for _ in range(4)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            # 160 attempts on a bucket of 50 at the same instant, exactly 50 get through
+            self.assertEqual(sum(results.get() for _ in processes), 50)
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        catalog.get_cache().clear()
+        self.user = User.objects.create_user(username='john', password='lemon@123')
+        self.token = Token.objects.create(user=self.user)
+        Category.objects.create(slug='mains', title='Mains')
+
+    def get_client(self, key=None):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {key or self.token.key}')
+        return client
+
+    def test_warm_request_does_not_query_the_token(self):
+        self.assertEqual(self.get_client().get('/api/menu-items/').status_code, 200)
+        # Token, user and roles cached, the menu page too
+        with self.assertNumQueries(0):
+            response = self.get_client().get('/api/menu-items/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_request_user_is_not_shared(self):
+        self.get_client().get('/api/menu-items/')
+        response = self.get_client().get('/api/cart/menu-items/')
+        self.assertEqual(response.status_code, 200)
+        entry = token_cache.get(self.token.key)
+        self.assertFalse(hasattr(entry['token'].user, '_littlelemon_roles'))
+
+    def test_logout_revokes_the_cached_token(self):
+        self.assertEqual(self.get_client().get('/api/menu-items/').status_code, 200)
+        self.assertEqual(self.get_client().post('/auth/token/logout/').status_code, 204)
+        self.assertEqual(self.get_client().get('/api/menu-items/').status_code, 401)
+
+    def test_deactivation_revokes_the_cached_token(self):
+        self.assertEqual(self.get_client().get('/api/menu-items/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_client().get('/api/menu-items/').status_code, 401)
+
+    def test_evicted_generation_does_not_revive_revoked_entries(self):
+        self.assertEqual(self.get_client().get('/api/menu-items/').status_code, 200)
+        self.token.delete()
+        # The cache dropped the bumped generation, as LocMemCache culling does
+        authentication.get_cache().delete(authentication._generation_key(self.user.pk))
+        self.assertEqual(self.get_client().get('/api/menu-items/').status_code, 401)
+
+    def test_revocation_during_the_lookup(self):
+        lookup = TokenAuthentication.authenticate_credentials
+
+        def racing_lookup(auth, key):
+            # Logged out between the lookup and the cache write
+            result = lookup(auth, key)
+            Token.objects.filter(key=key).delete()
+            return result
+
+        with mock.patch.object(TokenAuthentication, 'authenticate_credentials', racing_lookup):
+            self.assertEqual(self.get_client().get('/api/menu-items/').status_code, 200)
+        self.assertEqual(self.get_client().get('/api/menu-items/').status_code, 401)
+
+    def test_auth_is_the_token(self):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        auth = authentication.CachedTokenAuthentication()
+        # Cold, warm, then warm for the async views
+        results = [auth.authenticate(request), auth.authenticate(request), async_to_sync(auth.aauthenticate)(request)]
+        for user, token in results:
+            self.assertIsInstance(token, Token)
+            self.assertEqual((token.key, token.user_id, user.pk), (self.token.key, self.user.pk, self.user.pk))
+            self.assertIs(token.user, user)
+        self.assertIsNot(results[1][0], results[2][0])
+
+    def test_unknown_token(self):
+        self.assertEqual(self.get_client('0' * 40).get('/api/menu-items/').status_code, 401)
+
+    def test_cache_is_bounded(self):
+        cache = type(token_cache)(2, 60)
+        for key in 'abc':
+            cache.set(key, self.user, 0)
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        catalog.get_cache().clear()
+        self.customer = User.objects.create_user(username='john', password='lemon@123')
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        self.token = Token.objects.create(user=self.customer)
+        category = Category.objects.create(slug='mains', title='Mains')
+        self.items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Pasta {i}', price=2 + i, featured=i % 2 == 0, category=category)
+            for i in range(5)
+        ])
+        Cart.objects.create(user=self.customer, menuitem=self.items[0], quantity=2, unit_price=2, price=4)
+        self.order = Order.objects.create(user=self.customer, total=4, date='2024-01-01')
+        OrderItem.objects.create(order=self.order, menuitem=self.items[0], quantity=2, unit_price=2, price=4)
+
+    def get(self, urlconf, url, user=None, **headers):
+        # Nothing cached between the sync and the async request, same catalog version for both
+        clear_caches()
+        catalog.get_cache().clear()
+        catalog.get_cache().set_many({catalog.VERSION_KEY: 1, catalog.MODIFIED_KEY: 1700000000}, None)
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(User.objects.get(pk=user.pk))
+        with override_settings(ROOT_URLCONF=urlconf):
+            return client.get(url, **headers)
+
+    def test_same_responses_as_the_sync_views(self):
+        requests = [
+            ('/api/menu-items/', None),
+            ('/api/menu-items/?page_size=2&ordering=-price', None),
+            ('/api/menu-items/?featured=true&q=pasta', None),
+            (f'/api/menu-items/{self.items[1].pk}', None),
+            ('/api/menu-items/999', None),
+            ('/api/cart/menu-items/', self.customer),
+            ('/api/cart/menu-items/', None),
+            ('/api/cart/menu-items/', self.manager),
+            ('/api/orders/', self.customer),
+            (f'/api/orders/?user={self.customer.pk}', self.manager),
+            ('/api/orders/?user=999', self.manager),
+            (f'/api/orders/{self.order.pk}', self.customer),
+            (f'/api/orders/{self.order.pk}', self.manager),
+        ]
+        for url, user in requests:
+            with self.subTest(url=url, user=user):
+                expected = self.get(SYNC_URLCONF, url, user)
+                response = self.get(ASYNC_URLCONF, url, user)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response.get('ETag'), expected.get('ETag'))
+
+    def test_token_authentication(self):
+        headers = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        self.assertEqual(self.get(ASYNC_URLCONF, '/api/cart/menu-items/', **headers).status_code, 200)
+        # Warm: token, roles and the cached menu page
+        self.get(ASYNC_URLCONF, '/api/menu-items/', **headers)
+        client = APIClient()
+        with override_settings(ROOT_URLCONF=ASYNC_URLCONF), self.assertNumQueries(0):
+            self.assertEqual(client.get('/api/menu-items/', **headers).status_code, 200)
+
+        headers = {'HTTP_AUTHORIZATION': 'Token nope'}
+        self.assertEqual(self.get(ASYNC_URLCONF, '/api/cart/menu-items/', **headers).status_code, 401)
+
+    def test_writes_use_the_sync_views(self):
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        with override_settings(ROOT_URLCONF=ASYNC_URLCONF):
+            response = client.patch(f'/api/menu-items/{self.items[0].pk}', {'price': 12})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(client.options('/api/menu-items/').status_code, 200)
+        self.items[0].refresh_from_db()
+        self.assertEqual(self.items[0].price, 12)
+
+    def test_browsable_api(self):
+        response = self.get(ASYNC_URLCONF, '/api/menu-items/', self.manager, HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Pasta 0', response.content)
+
+    @override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+    async def test_asgi(self):
+        response = await self.async_client.get(
+            '/api/orders/', headers={'Authorization': f'Token {self.token.key}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['id'], self.order.pk)
+
+
+class SalesRollupTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.customers = [User.objects.create_user(username=f'customer{i}', password='lemon@123') for i in range(2)]
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        category = Category.objects.create(slug='mains', title='Mains')
+        self.items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=f'{2 + i}.50', featured=False, category=category) for i in range(3)
+        ])
+
+    def checkout(self, customer, lines):
+        Cart.objects.bulk_create([
+            Cart(user=customer, menuitem=self.items[i], quantity=quantity, unit_price=self.items[i].price,
+                 price=Decimal(self.items[i].price) * quantity)
+            for i, quantity in lines
+        ])
+        client = APIClient()
+        client.force_authenticate(customer)
+        response = client.post('/api/orders/')
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.get(pk=response.data['id'])
+
+    def rollups(self):
+        return (
+            sorted(DailySales.objects.values_list('date', 'orders', 'revenue')),
+            sorted(DailyItemSales.objects.values_list('date', 'menuitem_id', 'orders', 'quantity', 'revenue')),
+        )
+
+    def test_checkout_and_delete_keep_the_rollups_up_to_date(self):
+        today = datetime.date.today()
+        first = self.checkout(self.customers[0], [(0, 2), (1, 1)])
+        self.checkout(self.customers[1], [(0, 1)])
+        self.assertEqual(self.rollups(), (
+            [(today, 2, Decimal('11.00'))],
+            [(today, self.items[0].pk, 2, 3, Decimal('7.50')), (today, self.items[1].pk, 1, 1, Decimal('3.50'))],
+        ))
+
+        # Same as a rebuild from the orders
+        expected = self.rollups()
+        sales.rebuild()
+        self.assertEqual(self.rollups(), expected)
+
+        first.delete()
+        self.assertEqual(self.rollups(), (
+            [(today, 1, Decimal('2.50'))],
+            [(today, self.items[0].pk, 1, 1, Decimal('2.50'))],
+        ))
+        Order.objects.all().delete()
+        self.assertEqual(self.rollups(), ([], []))
+
+    def test_deleting_an_uncounted_order(self):
+        today = datetime.date.today()
+        self.checkout(self.customers[0], [(0, 2)])
+        expected = self.rollups()
+        # As from the admin, never recorded
+        order = Order.objects.create(user=self.customers[1], total=7)
+        OrderItem.objects.create(order=order, menuitem=self.items[0], quantity=2, unit_price=2.5, price=5)
+        self.assertFalse(order.in_sales)
+        order.delete()
+        self.assertEqual(self.rollups(), expected)
+
+        # Counted once rebuilt, then taken back out
+        order = Order.objects.create(user=self.customers[1], total=7)
+        OrderItem.objects.create(order=order, menuitem=self.items[0], quantity=2, unit_price=2.5, price=5)
+        sales.rebuild(start=today)
+        order.refresh_from_db()
+        self.assertTrue(order.in_sales)
+        self.assertEqual(self.rollups()[0], [(today, 2, Decimal('12.00'))])
+        order.delete()
+        self.assertEqual(self.rollups(), expected)
+
+    def test_checkout_query_count_does_not_depend_on_the_cart(self):
+        for customer, size in zip(self.customers, (1, 3)):
+            Cart.objects.bulk_create([
+                Cart(user=customer, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+                for item in self.items[:size]
+            ])
+        counts = []
+        for customer in self.customers:
+            with CaptureQueriesContext(connection) as queries:
+                place_order(customer)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_rebuild_command(self):
+        orders = Order.objects.bulk_create([Order(user=self.customers[0], total=i + 1) for i in range(4)])
+        for order, day in zip(orders, ['2024-01-01', '2024-01-01', '2024-01-02', '2024-01-03']):
+            Order.objects.filter(pk=order.pk).update(date=day)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menuitem=item, quantity=2, unit_price=1, price=2)
+            for order in orders for item in self.items[:2]
+        ])
+        out = StringIO()
+        call_command('rebuild_sales', '--batch-size', '2', stdout=out)
+        self.assertIn('Rebuilt 3 days and 6 menu item days', out.getvalue())
+        self.assertEqual(
+            list(DailySales.objects.order_by('date').values_list('orders', 'revenue')),
+            [(2, Decimal('3.00')), (1, Decimal('3.00')), (1, Decimal('4.00'))],
+        )
+
+        # Only the days asked for are replaced
+        DailySales.objects.update(orders=0)
+        call_command('rebuild_sales', '--since', '2024-01-02', '--until', '2024-01-02', stdout=StringIO())
+        self.assertEqual(list(DailySales.objects.order_by('date').values_list('orders', flat=True)), [0, 1, 0])
+
+    def test_analytics_endpoint(self):
+        self.checkout(self.customers[0], [(0, 2), (1, 1)])
+        self.checkout(self.customers[1], [(2, 5)])
+        client = APIClient()
+        client.force_authenticate(self.customers[0])
+        self.assertEqual(client.get('/api/analytics/sales/').status_code, 403)
+
+        client.force_authenticate(self.manager)
+        response = client.get('/api/analytics/sales/?top=2')
+        self.assertEqual(response.status_code, 200)
+        today = datetime.date.today().isoformat()
+        self.assertEqual(response.data['days'], [{'date': today, 'orders': 2, 'revenue': '31.00'}])
+        self.assertEqual(response.data['total'], {'orders': 2, 'revenue': '31.00'})
+        self.assertEqual(
+            [(row['title'], row['quantity'], row['revenue']) for row in response.data['top_menu_items']],
+            [('Item 2', 5, '22.50'), ('Item 0', 2, '5.00')],
+        )
+
+        response = client.get('/api/analytics/sales/?date_before=2000-01-01')
+        self.assertEqual(response.data['days'], [])
+        self.assertEqual(response.data['total'], {'orders': 0, 'revenue': '0.00'})
+        self.assertEqual(response.data['top_menu_items'], [])
+        self.assertEqual(client.get('/api/analytics/sales/?top=1000').status_code, 400)
+        self.assertEqual(client.get('/api/analytics/sales/?date_after=soon').status_code, 400)
+
+
+class FastListSerializationTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.customer = User.objects.create_user(username='john', password='lemon@123')
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        crew = User.objects.create_user(username='rider', password='lemon@123')
+        categories = [Category.objects.create(slug=f'c{i}', title=f'Category {i}') for i in range(2)]
+        self.items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Lemon pasta {i}', price=['2.50', '12.99', '7', '0.10'][i % 4],
+                     featured=i % 3 == 0, category=categories[i % 2])
+            for i in range(9)
+        ])
+        for i, item in enumerate(self.items[:4]):
+            Cart.objects.create(user=self.customer, menuitem=item, quantity=i + 1, unit_price=item.price, price=1)
+        for i in range(5):
+            order = Order.objects.create(
+                user=self.customer, total=f'{i + 1}.25', status=i % 2 == 0, delivery_crew=crew if i % 2 else None,
+            )
+            Order.objects.filter(pk=order.pk).update(date=f'2024-01-0{5 - i % 3}')
+
+    def get_pages(self, url, user, fast, urlconf=SYNC_URLCONF, **headers):
+        # The first page and the ones after it through the next links
+        clear_caches()
+        catalog.get_cache().clear()
+        catalog.get_cache().set_many({catalog.VERSION_KEY: 1, catalog.MODIFIED_KEY: 1700000000}, None)
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        pages = []
+        with override_settings(FAST_LIST_SERIALIZATION=fast, ROOT_URLCONF=urlconf):
+            while url is not None and len(pages) < 5:
+                response = client.get(url, **headers)
+                pages.append((response.status_code, response.content))
+                url = response.data.get('next') if response.status_code == 200 and 'json' in response['Content-Type'] else None
+        return pages
+
+    def test_same_bytes_as_the_serializers(self):
+        requests = [
+            ('/api/menu-items/', None),
+            ('/api/menu-items/?page_size=4&ordering=-price', None),
+            ('/api/menu-items/?featured=true', None),
+            ('/api/menu-items/?q=lemon&page_size=2', None),
+            ('/api/menu-items/?search=Category%201', None),
+            ('/api/cart/menu-items/', self.customer),
+            ('/api/orders/', self.customer),
+            ('/api/orders/?ordering=-total&page_size=2', self.manager),
+            ('/api/orders/?status=false', self.manager),
+        ]
+        for url, user in requests:
+            for urlconf in (SYNC_URLCONF, ASYNC_URLCONF):
+                with self.subTest(url=url, urlconf=urlconf.__name__):
+                    expected = self.get_pages(url, user, False, urlconf)
+                    self.assertEqual(expected[0][0], 200)
+                    self.assertEqual(self.get_pages(url, user, True, urlconf), expected)
+
+    def test_same_xml(self):
+        expected = self.get_pages('/api/cart/menu-items/?format=xml', self.customer, False)
+        self.assertEqual(self.get_pages('/api/cart/menu-items/?format=xml', self.customer, True), expected)
+
+    def test_no_model_instances(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        with mock.patch.object(Cart, '__init__', side_effect=AssertionError), \
+                mock.patch.object(MenuItem, '__init__', side_effect=AssertionError):
+            response = client.get('/api/cart/menu-items/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][1]['price'], Decimal('25.98'))
+
+
+class OrderExportTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.customer = User.objects.create_user(username='john', password='lemon@123')
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        category = Category.objects.create(slug='mains', title='Mains')
+        self.items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Pasta, {i}', price=2 + i, featured=False, category=category) for i in range(3)
+        ])
+        self.orders = []
+        for day, delivered in [('2024-01-01', True), ('2024-02-01', False), ('2024-03-01', False)]:
+            order = Order.objects.create(user=self.customer, total=5, status=delivered)
+            Order.objects.filter(pk=order.pk).update(date=day)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+                for item in self.items[:2]
+            ])
+            self.orders.append(order)
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response = self.client.get('/api/orders/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders.csv"')
+        rows = list(csv.reader(io.StringIO(self.read(response))))
+        self.assertEqual(rows[0], export.COLUMNS)
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(
+            rows[1],
+            [str(self.orders[0].pk), str(self.customer.pk), '', 'True', '5.00', '2024-01-01',
+             str(self.items[0].pk), 'Pasta, 0', '1', '2.00', '2.00'],
+        )
+        self.assertEqual([int(row[0]) for row in rows[1:]], sorted(int(row[0]) for row in rows[1:]))
+
+    def test_ndjson_with_filters(self):
+        response = self.client.get('/api/orders/export/?format=ndjson&status=false&date_after=2024-02-01&date_before=2024-02-28')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        records = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(len(records), 2)
+        self.assertEqual({record['order_id'] for record in records}, {self.orders[1].pk})
+        self.assertEqual(records[0]['total'], '5.00')
+        self.assertEqual(records[0]['date'], '2024-02-01')
+        self.assertIs(records[0]['status'], False)
+
+    def test_managers_only(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.get('/api/orders/export/')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.content.decode().splitlines()[0], 'detail')
+
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(self.client.get('/api/orders/export/?date_after=yesterday').status_code, 400)
+
+    def test_csv_formulas_are_escaped(self):
+        MenuItem.objects.filter(pk=self.items[0].pk).update(title='=HYPERLINK("http://example.com")')
+        MenuItem.objects.filter(pk=self.items[1].pk).update(title='-2+3')
+        rows = list(csv.reader(io.StringIO(self.read(self.client.get('/api/orders/export/?status=true')))))
+        self.assertEqual([row[7] for row in rows[1:]], ['\'=HYPERLINK("http://example.com")', "'-2+3"])
+        self.assertEqual(CSVRenderer().encode_rows(['total'], [[Decimal('-1.00')], ['@SUM(A1)']]), b"-1.00\r\n'@SUM(A1)\r\n")
+
+    def test_rows_are_fetched_in_chunks_by_one_query(self):
+        renderer = CSVRenderer()
+        with self.assertNumQueries(1):
+            chunks = list(export.stream(renderer, export.get_rows(Order.objects.all()), chunk_size=4))
+        # The header, then 4 + 2 rows
+        self.assertEqual([chunk.count(b'\r\n') for chunk in chunks], [1, 4, 2])
+
+    async def test_async_stream_under_asgi(self):
+        await self.async_client.aforce_login(self.manager)
+        response = await self.async_client.get('/api/orders/export/', {'format': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).splitlines()
+        self.assertEqual(len(lines), 6)
+
+
+def parse_server_timing(header):
+    entries = {}
+    for entry in header.split(', '):
+        name, *params = entry.split(';')
+        entries[name] = dict(param.split('=', 1) for param in params)
+    return entries
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.customers = [User.objects.create_user(username=f'customer{i}', password='lemon@123') for i in range(2)]
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        category = Category.objects.create(slug='mains', title='Mains')
+        self.items = MenuItem.objects.bulk_create([
+            MenuItem(title=f'Item {i}', price=2 + i, featured=False, category=category) for i in range(2)
+        ])
+        today = datetime.date.today()
+        # (days ago, delivered), only the first four are archived after 90 days, a day
+        # 200 days ago then has orders in both tables
+        self.orders = []
+        for i, (age, delivered) in enumerate([(400, True), (300, True), (200, True), (100, True), (200, False), (10, True), (1, False)]):
+            order = Order.objects.create(user=self.customers[i % 2], total=10 + i, status=delivered)
+            Order.objects.filter(pk=order.pk).update(date=today - datetime.timedelta(days=age))
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+                for item in self.items
+            ])
+            self.orders.append(Order.objects.get(pk=order.pk))
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_archive_moves_old_delivered_orders(self):
+        sales.rebuild()
+        rollups = list(DailySales.objects.order_by('date').values_list('date', 'orders', 'revenue'))
+        job = CheckoutJob.objects.create(user=self.customers[0], status=CheckoutJob.DONE, order=self.orders[0])
+
+        # Two batches of two orders, then the empty read that ends the run
+        with self.assertNumQueries(2 * 8 + 3):
+            self.assertEqual(archive.archive(90, batch_size=2), 4)
+
+        archived = [order.pk for order in self.orders[:4]]
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('pk', flat=True)), archived)
+        self.assertEqual(ArchivedOrderItem.objects.count(), 8)
+        self.assertFalse(Order.objects.filter(pk__in=archived).exists())
+        self.assertFalse(OrderItem.objects.filter(order__in=archived).exists())
+        self.assertFalse(CheckoutJob.objects.filter(pk=job.pk).exists())
+
+        copy = ArchivedOrder.objects.get(pk=self.orders[1].pk)
+        self.assertEqual(
+            (copy.user_id, copy.status, copy.total, copy.date, copy.updated_at),
+            (self.orders[1].user_id, True, self.orders[1].total, self.orders[1].date, self.orders[1].updated_at),
+        )
+        self.assertIsNotNone(copy.archived_at)
+
+        # The rollups keep the archived orders, a rebuild finds them again
+        self.assertEqual(list(DailySales.objects.order_by('date').values_list('date', 'orders', 'revenue')), rollups)
+        # The rows are streamed, batch_size per INSERT
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(sales.rebuild(batch_size=2), (6, 12))
+        self.assertEqual(sum(query['sql'].startswith('INSERT') for query in queries.captured_queries), 3 + 6)
+        self.assertEqual(list(DailySales.objects.order_by('date').values_list('date', 'orders', 'revenue')), rollups)
+        self.assertEqual(DailySales.objects.get(date=self.orders[2].date).orders, 2)
+        self.assertEqual(DailyItemSales.objects.filter(menuitem=self.items[0]).count(), 6)
+
+        self.assertEqual(archive.archive(90), 0)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_orders', '--days', '250', '--limit', '1', stdout=out)
+        self.assertIn('Archived 1 orders', out.getvalue())
+        self.assertEqual(list(ArchivedOrder.objects.values_list('pk', flat=True)), [self.orders[0].pk])
+
+    def history(self, url):
+        ids = []
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [order['id'] for order in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_history_reads_both_tables(self):
+        archive.archive(90)
+        self.assertEqual(len(self.client.get('/api/orders/?page_size=10').data['results']), 3)
+
+        by_date = [order.pk for order in sorted(self.orders, key=lambda order: (order.date, order.pk))]
+        self.assertEqual(self.history('/api/orders/history/?page_size=2'), by_date)
+        by_total = [order.pk for order in sorted(self.orders, key=lambda order: -order.total)]
+        self.assertEqual(self.history('/api/orders/history/?page_size=3&ordering=-total'), by_total)
+        self.assertEqual(
+            self.history(f'/api/orders/history/?user={self.customers[1].pk}'),
+            [order.pk for order in sorted(self.orders, key=lambda order: (order.date, order.pk))
+             if order.user_id == self.customers[1].pk],
+        )
+
+        # Same rows as OrderView renders, and the previous page of the second one
+        first = self.client.get('/api/orders/history/?page_size=3')
+        self.assertEqual(first.data['results'][0], {
+            'id': self.orders[0].pk, 'user': self.customers[0].pk, 'delivery_crew': None,
+            'status': True, 'total': '10.00', 'date': self.orders[0].date.isoformat(),
+        })
+        second = self.client.get(first.data['next'])
+        previous = self.client.get(second.data['previous'])
+        self.assertEqual(previous.data['results'], first.data['results'])
+
+    def test_customers_keep_their_archived_orders(self):
+        archive.archive(90)
+        self.client.force_authenticate(User.objects.get(pk=self.customers[0].pk))
+        self.assertEqual(self.history('/api/orders/history/?page_size=10'), [self.orders[i].pk for i in (0, 2, 4, 6)])
+
+        archived = self.orders[0]
+        responses = []
+        for urlconf in (SYNC_URLCONF, ASYNC_URLCONF):
+            with override_settings(ROOT_URLCONF=urlconf):
+                responses.append(self.client.get(f'/api/orders/{archived.pk}'))
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertEqual(responses[0].content, responses[1].content)
+        self.assertEqual((responses[0].data['id'], responses[0].data['total']), (archived.pk, '10.00'))
+
+        # Someone else's
+        self.assertEqual(self.client.get(f'/api/orders/{self.orders[1].pk}').status_code, 403)
+
+    def test_export_includes_the_archive(self):
+        archive.archive(90)
+        response = self.client.get('/api/orders/export/?format=ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(records), 14)
+        self.assertEqual({record['order_id'] for record in records}, {order.pk for order in self.orders})
+
+        response = self.client.get('/api/orders/export/?format=ndjson&status=false')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual({record['order_id'] for record in records}, {self.orders[4].pk, self.orders[6].pk})
+
+
+@override_settings(SERVER_TIMING=True, REQUEST_METRICS=True)
+class ServerTimingTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        catalog.get_cache().clear()
+        metrics.clear()
+        self.customer = User.objects.create_user(username='john', password='lemon@123')
+        self.manager = User.objects.create_user(username='boss', password='lemon@123')
+        self.manager.groups.add(Group.objects.create(name='Manager'))
+        self.token = Token.objects.create(user=self.customer)
+        category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.bulk_create([
+            MenuItem(title=f'Pasta {i}', price=2 + i, featured=False, category=category) for i in range(5)
+        ])
+
+    def test_header_breaks_the_request_down(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/menu-items/')
+        self.assertEqual(response.status_code, 200)
+
+        timings = parse_server_timing(response['Server-Timing'])
+        self.assertEqual(timings['db']['desc'], f'"{len(queries)} queries"')
+        for phase in ['total', 'db', 'auth', 'serialize', 'render']:
+            self.assertGreaterEqual(float(timings[phase]['dur']), 0)
+        self.assertGreaterEqual(float(timings['total']['dur']), float(timings['render']['dur']))
+
+        # The same page from the cache is neither queried nor serialized again
+        response = client.get('/api/menu-items/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertNotIn('serialize', parse_server_timing(response['Server-Timing']))
+
+    def test_async_views_are_measured(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        with override_settings(ROOT_URLCONF=ASYNC_URLCONF), CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/cart/menu-items/')
+        self.assertEqual(response.status_code, 200)
+        timings = parse_server_timing(response['Server-Timing'])
+        self.assertEqual(timings['db']['desc'], f'"{len(queries)} queries"')
+        self.assertIn('auth', timings)
+        self.assertIn('roles', timings)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_header_can_be_turned_off(self):
+        self.assertNotIn('Server-Timing', APIClient().get('/api/menu-items/'))
+
+    def test_log_line_per_request(self):
+        with self.assertLogs('LittleLemonAPI.requests', 'INFO') as logs:
+            APIClient().get('/api/menu-items/?page_size=2')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'LittleLemonAPI.views.MenuItemView')
+        self.assertEqual(record['method'], 'GET')
+        self.assertEqual(record['path'], '/api/menu-items/')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertEqual(
+            set(record),
+            {'method', 'path', 'view', 'status', 'queries', 'total_ms', 'db_ms', 'auth_ms', 'roles_ms',
+             'throttle_ms', 'serialize_ms', 'render_ms'},
+        )
+
+    def test_metrics_are_for_managers_only(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        for _ in range(3):
+            client.get('/api/menu-items/')
+        client.get('/api/menu-items/999')
+        client.force_authenticate(None)
+
+        self.assertIn(client.get('/api/metrics/').status_code, (401, 403))
+        client.force_authenticate(self.customer)
+        self.assertEqual(client.get('/api/metrics/').status_code, 403)
+
+        client.force_authenticate(self.manager)
+        response = client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        views = response.data['views']
+        menu = views['LittleLemonAPI.views.MenuItemView']
+        self.assertEqual(menu['statuses'], {'2xx': 3})
+        self.assertEqual(menu['total_ms']['count'], 3)
+        self.assertEqual(menu['total_ms']['buckets']['+Inf'], 3)
+        self.assertEqual(views['LittleLemonAPI.views.SingleMenuItem']['statuses'], {'4xx': 1})
+
+        self.assertEqual(client.delete('/api/metrics/').status_code, 204)
+        # Only the DELETE itself is left
+        self.assertEqual(list(client.get('/api/metrics/').data['views']), ['LittleLemonAPI.views.MetricsView'])
+
+
+class LoadTestCommandTest(TransactionTestCase):
+    def test_every_route_is_covered(self):
+        clear_caches()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            with override_settings(MENU_SNAPSHOT_DIR=directory):
+                call_command(
+                    'loadtest', '--in-place', '--requests', '2', '--concurrency', '2', '--menu-items', '30',
+                    '--customers', '4', '--crew', '2', '--orders', '1', '--output', path, stdout=StringIO(),
+                )
+            with open(path) as file:
+                report = json.load(file)
+
+        endpoints = report['endpoints']
+        routes = {f'/api/{pattern.pattern}' for pattern in get_urlpatterns()}
+        self.assertEqual({endpoint['route'] for endpoint in endpoints.values()}, routes)
+        for name, endpoint in endpoints.items():
+            with self.subTest(name):
+                self.assertEqual(endpoint['requests'], 2)
+                self.assertEqual(endpoint['errors'], 0)
+                self.assertEqual(set(endpoint['latency_ms']), {'p50', 'p95', 'p99', 'max', 'mean'})
+        self.assertEqual(endpoints['menu item']['queries']['max'], 1)
@@ -0,0 +1,116 @@
+import os
+import random
+import sqlite3
+import threading
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle, AnonRateThrottle, UserRateThrottle, ScopedRateThrottle
+from .timing import timed
+
+# Token bucket throttling shared by every worker process through a small SQLite
+# file. Each request is a single INSERT ... ON CONFLICT DO UPDATE ... RETURNING
+# statement, so refilling and taking a token is atomic across processes and the
+# cost doesn't grow with the rate (DRF's throttles rewrite a list of timestamps
+# in the cache, read-modify-write, per request).
+
+# All the expressions of the UPDATE see the old row, `refill` is the bucket
+# content at :now before taking a token.
+_REFILL = 'MIN(:capacity, tokens + MAX(0, :now - updated) * :rate)'
+_TAKE_SQL = f'''
+    INSERT INTO bucket (key, tokens, updated, full_at, allowed)
+    VALUES (:key, :capacity - 1, :now, :now + 1 / :rate, 1)
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = {_REFILL} - ({_REFILL} >= 1),
+        allowed = {_REFILL} >= 1,
+        full_at = :now + (:capacity - ({_REFILL} - ({_REFILL} >= 1))) / :rate,
+        updated = :now
+    RETURNING tokens, allowed
+'''
+
+
+class BucketStore:
+    def __init__(self, path):
+        self.path = str(path)
+        self.local = threading.local()
+
+    def get_connection(self):
+        # One connection per thread, and a new one after a fork
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS bucket ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, '
+                'full_at REAL NOT NULL, allowed INTEGER NOT NULL) WITHOUT ROWID'
+            )
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def take(self, key, capacity, rate, now):
+        # Returns (allowed, tokens left)
+        connection = self.get_connection()
+        tokens, allowed = connection.execute(
+            _TAKE_SQL, {'key': key, 'capacity': capacity, 'rate': rate, 'now': now}
+        ).fetchone()
+        if random.random() < 0.001:
+            # A full bucket is the same as no bucket, drop them now and then
+            connection.execute('DELETE FROM bucket WHERE full_at < ?', [now])
+        return bool(allowed), tokens
+
+    def clear(self):
+        self.get_connection().execute('DELETE FROM bucket')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    path = str(getattr(settings, 'THROTTLE_DATABASE', settings.BASE_DIR / 'throttle.sqlite3'))
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = BucketStore(path)
+        return _stores[path]
+
+
+def clear_throttles():
+    get_store().clear()
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    # A rate of N/period is a bucket of N tokens refilled at N per period: bursts
+    # of up to N requests are allowed, then one request per period/N. Rejected
+    # requests carry a Retry-After header with the time until the next token.
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        refill_rate = self.num_requests / self.duration
+        with timed('throttle'):
+            allowed, tokens = get_store().take(self.key, self.num_requests, refill_rate, self.timer())
+        self.wait_time = None if allowed else (1 - tokens) / refill_rate
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+# Same keys and scopes as the DRF throttles they replace
+class AnonTokenBucketThrottle(AnonRateThrottle, TokenBucketThrottle):
+    pass
+
+
+class UserTokenBucketThrottle(UserRateThrottle, TokenBucketThrottle):
+    pass
+
+
+# Per endpoint rates: the view's `throttle_scope` picks the rate in DEFAULT_THROTTLE_RATES
+class ScopedTokenBucketThrottle(ScopedRateThrottle, TokenBucketThrottle):
+    pass
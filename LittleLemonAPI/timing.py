@@ -0,0 +1,206 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+# Per-request instrumentation. ServerTimingMiddleware (middleware.py) starts a
+# Timings for every request, then the phases add their time to it: 'db' from an
+# execute wrapper installed on every connection, 'auth' from the authentication
+# classes, 'roles' from the group lookups, 'throttle', 'serialize' from the
+# serializers and 'render' from the renderers. The timings live in a context
+# variable, the threads sync_to_async runs the async views' queries in see the
+# same one. Each request ends up in the Server-Timing header, a JSON log line on
+# the 'LittleLemonAPI.requests' logger and the per-view histograms of /api/metrics/.
+
+logger = logging.getLogger('LittleLemonAPI.requests')
+
+# The order of the Server-Timing entries and of the log fields
+PHASES = ['db', 'auth', 'roles', 'throttle', 'serialize', 'render']
+
+_current = contextvars.ContextVar('littlelemon_timings', default=None)
+
+
+class Timings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = None
+        self.queries = 0
+        self.durations = {}
+        # A phase nested in itself (a nested serializer, the browsable API
+        # rendering the JSON) is only counted once
+        self.running = set()
+
+    def add(self, phase, seconds):
+        self.durations[phase] = self.durations.get(phase, 0) + seconds
+
+    def stop(self):
+        self.total = time.perf_counter() - self.start
+        return self
+
+
+def start():
+    timings = Timings()
+    return timings, _current.set(timings)
+
+
+def finish(token):
+    timings = _current.get()
+    _current.reset(token)
+    return timings.stop()
+
+
+@contextmanager
+def timed(phase):
+    timings = _current.get()
+    if timings is None or phase in timings.running:
+        yield
+        return
+
+    timings.running.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.running.discard(phase)
+        timings.add(phase, time.perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every connection by signals.install_query_timer
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.add('db', time.perf_counter() - start)
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view_class = getattr(match.func, 'view_class', None)
+    if view_class is None:
+        return match.view_name
+    return f'{view_class.__module__}.{view_class.__qualname__}'
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def server_timing(timings):
+    entries = [f'total;dur={_ms(timings.total)}']
+    for phase in PHASES:
+        if phase == 'db':
+            entries.append(f'db;dur={_ms(timings.durations.get("db", 0))};desc="{timings.queries} queries"')
+        elif phase in timings.durations:
+            entries.append(f'{phase};dur={_ms(timings.durations[phase])}')
+    return ', '.join(entries)
+
+
+def log_record(request, response, view, timings):
+    record = {
+        'method': request.method,
+        'path': request.path,
+        'view': view,
+        'status': response.status_code,
+        'queries': timings.queries,
+        'total_ms': _ms(timings.total),
+    }
+    for phase in PHASES:
+        record[f'{phase}_ms'] = _ms(timings.durations.get(phase, 0))
+    return record
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # The last bucket is +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def as_dict(self):
+        # Cumulative buckets like Prometheus: the count of observations <= bound
+        buckets = {}
+        total = 0
+        for bound, count in zip([*map(str, self.bounds), '+Inf'], self.counts):
+            total += count
+            buckets[bound] = total
+        return {'count': total, 'sum': round(self.sum, 3), 'buckets': buckets}
+
+
+DURATION_BOUNDS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+QUERY_BOUNDS = [0, 1, 2, 5, 10, 20, 50, 100]
+
+
+class ViewMetrics:
+    # Per-view histograms of the request timings, per process: every worker
+    # reports the requests it served
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.since = time.time()
+
+    def record(self, view, status, timings):
+        with self.lock:
+            entry = self.views.get(view)
+            if entry is None:
+                entry = self.views[view] = {
+                    'statuses': {},
+                    'queries': Histogram(QUERY_BOUNDS),
+                    'total_ms': Histogram(DURATION_BOUNDS),
+                    **{f'{phase}_ms': Histogram(DURATION_BOUNDS) for phase in PHASES},
+                }
+            status_class = f'{status // 100}xx'
+            entry['statuses'][status_class] = entry['statuses'].get(status_class, 0) + 1
+            entry['queries'].observe(timings.queries)
+            entry['total_ms'].observe(timings.total * 1000)
+            for phase in PHASES:
+                entry[f'{phase}_ms'].observe(timings.durations.get(phase, 0) * 1000)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'pid': os.getpid(),
+                'since': self.since,
+                'views': {
+                    view: {
+                        name: dict(value) if name == 'statuses' else value.as_dict()
+                        for name, value in entry.items()
+                    }
+                    for view, entry in sorted(self.views.items())
+                },
+            }
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+            self.since = time.time()
+
+
+metrics = ViewMetrics()
+
+
+def report(request, response, timings):
+    view = get_view_name(request)
+    if getattr(settings, 'SERVER_TIMING', False):
+        response['Server-Timing'] = server_timing(timings)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(log_record(request, response, view, timings)))
+    if getattr(settings, 'REQUEST_METRICS', True):
+        metrics.record(view, response.status_code, timings)
+    return response
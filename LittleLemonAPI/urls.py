@@ -1,17 +1,48 @@
-from django.urls import path
-from . import views
+from types import ModuleType
+from django.conf import settings
+from django.urls import include, path
+from . import views, async_views
 from rest_framework.authtoken.views import obtain_auth_token
-urlpatterns = [
-    path('menu-items/', views.MenuItemView.as_view()),
-    path('menu-items/<int:pk>', views.SingleMenuItem.as_view()),
-    path('api-token-auth/', obtain_auth_token),
-    path('groups/manager/users/', views.ManagerView.as_view()),
-    path('groups/manager/users/<int:pk>', views.SingleManagerView.as_view()),
-    path('groups/delivery-crew/users/', views.DelieveryCrewView.as_view()),
-    path('groups/delivery-crew/users/<int:pk>', views.SingleDelieveryCrewView.as_view()),
-    path('cart/menu-items/', views.CartView.as_view()),
-    path('orders/', views.OrderView.as_view()),
-    path('orders/<int:pk>', views.SingleOrderView.as_view()),
-    #path('x/', views.x)
-]
 
+# The read routes that have an async view, see async_views.py
+ASYNC_ROUTES = ['menu-items', 'menu-item', 'cart', 'orders', 'order']
+
+
+def get_urlpatterns(async_routes=()):
+    def read_view(name, view_class, async_view_class):
+        return (async_view_class if name in async_routes else view_class).as_view()
+
+    return [
+        path('menu-items/', read_view('menu-items', views.MenuItemView, async_views.MenuItemView)),
+        path('menu-items/<int:pk>', read_view('menu-item', views.SingleMenuItem, async_views.SingleMenuItem)),
+        path('menu-items/bulk/', views.MenuItemBulkView.as_view()),
+        path('menu/', views.menu_snapshot),
+        path('api-token-auth/', obtain_auth_token),
+        path('groups/manager/users/', views.ManagerView.as_view()),
+        path('groups/manager/users/<int:pk>', views.SingleManagerView.as_view()),
+        path('groups/delivery-crew/users/', views.DelieveryCrewView.as_view()),
+        path('groups/delivery-crew/users/<int:pk>', views.SingleDelieveryCrewView.as_view()),
+        path('cart/menu-items/', read_view('cart', views.CartView, async_views.CartView)),
+        path('cart/menu-items/batch/', views.CartBatchView.as_view()),
+        path('orders/', read_view('orders', views.OrderView, async_views.OrderView)),
+        path('orders/<int:pk>', read_view('order', views.SingleOrderView, async_views.SingleOrderView)),
+        path('orders/events/', async_views.OrderEventsView.as_view()),
+        path('orders/checkouts/<int:pk>', views.CheckoutJobView.as_view()),
+        path('orders/bulk/', views.OrderBulkView.as_view()),
+        path('orders/dispatch/', views.OrderDispatchView.as_view()),
+        path('orders/history/', views.OrderHistoryView.as_view()),
+        path('orders/export/', views.OrderExportView.as_view()),
+        path('analytics/sales/', views.SalesAnalyticsView.as_view()),
+        path('metrics/', views.MetricsView.as_view()),
+        #path('x/', views.x)
+    ]
+
+
+urlpatterns = get_urlpatterns(getattr(settings, 'ASYNC_ROUTES', []))
+
+
+def get_api_urlconf(async_routes):
+    # A root URLconf with only the API under /api/, for ROOT_URLCONF in tests and benchmarks
+    urlconf = ModuleType(f'api_urlconf_{"async" if async_routes else "sync"}')
+    urlconf.urlpatterns = [path('api/', include(get_urlpatterns(async_routes)))]
+    return urlconf
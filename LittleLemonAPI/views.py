@@ -1,21 +1,60 @@
-from django.shortcuts import render
-from .models import User, MenuItem, Cart, Order, OrderItem
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from .models import User, Category, MenuItem, Order, OrderItem, DailySales, DailyItemSales, CheckoutJob, \
+    ArchivedOrder, ArchivedOrderItem
 from .serializers import UserSerializer, MenuItemSerializer, CartSerializer, OrderSerializer, \
-    OrderSerializerforStatusandDelivery, OrderSerializerforStatus
-from rest_framework import generics
+    OrderSerializerforStatusandDelivery, OrderSerializerforStatus, MenuItemBulkSerializer, \
+    MenuItemBulkUpdateSerializer, CartLineSerializer, OrderBulkUpdateSerializer, DispatchSerializer, \
+    DailySalesSerializer, SalesTotalSerializer, TopMenuItemSerializer, CheckoutJobSerializer
+from rest_framework import generics, serializers
+from rest_framework.fields import empty
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet, Sum
+from django.utils import timezone
 from django.contrib.auth.models import Group
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+from rest_framework.filters import OrderingFilter, SearchFilter
+from django_filters.rest_framework import DjangoFilterBackend
+from . import carts, catalog, dispatch, events, export, snapshot, timing
+from .checkout import enqueue, place_order
+from .fastpath import ValuesListMixin, MENU_ITEMS, CART, ORDERS
+from .conditional import make_etag, timestamp, check_preconditions, set_validators
+from .filters import FullTextSearchFilter, OrderExportFilter, ArchivedOrderExportFilter, SalesFilter
+from .pagination import KeysetPagination
+from .renderers import CSVRenderer, NDJSONRenderer
+from .permissions import IsManager, IsDeliveryCrew, IsCustomer
+from .roles import DELIVERY_CREW, is_manager, is_delivery_crew, is_customer
+from .throttling import AnonTokenBucketThrottle, UserTokenBucketThrottle
+
+
+def get_visible_orders(queryset, user):
+    # The orders (or archived orders) a user lists: every order for the managers,
+    # their deliveries for the delivery crew, their own for the customers
+    if is_manager(user):
+        return queryset
+    if is_delivery_crew(user):
+        return queryset.filter(delivery_crew=user)
+    return queryset.filter(user=user)
+
+
+def get_order_items(order):
+    items = ArchivedOrderItem if isinstance(order, ArchivedOrder) else OrderItem
+    return items.objects.filter(order=order)
 
 
 # Create your views here.
-class MenuItemView(generics.ListCreateAPIView):
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+class MenuItemView(ValuesListMixin, generics.ListCreateAPIView):
+    throttle_classes = [AnonTokenBucketThrottle, UserTokenBucketThrottle]
     serializer_class = MenuItemSerializer
+    values_serializer = MENU_ITEMS
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter, FullTextSearchFilter]
     ordering_fields = ['price']
     filterset_fields = ['price', 'featured']
     search_fields = ['title', 'category__title'] 
@@ -23,7 +62,7 @@ class MenuItemView(generics.ListCreateAPIView):
     
     # I didn't add category_title it to filterset_fields above to use 'category' in the url instead of 'category__tittle'
     def get_queryset(self):
-        queryset = MenuItem.objects.all()
+        queryset = MenuItem.objects.select_related('category')
         # queryset = super().get_queryset() # Get the initial queryset
         category_title = self.request.query_params.get('category')
         if category_title:
@@ -37,10 +76,30 @@ class MenuItemView(generics.ListCreateAPIView):
             
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        # The ETag only depends on the catalog version and the page asked for,
+        # so a 304 is answered without touching the database or the serializer
+        key = catalog.page_key(request)
+        etag = make_etag(key, request.accepted_media_type)
+        last_modified = catalog.get_last_modified()
+        not_modified = check_preconditions(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        # Read-through cache, the key carries the catalog version so menu writes invalidate it
+        data = catalog.get_page(key)
+        if data is not None:
+            response = Response(data, headers={'X-Cache': 'HIT'})
+        else:
+            response = super().list(request, *args, **kwargs)
+            catalog.set_page(key, response.data)
+            response['X-Cache'] = 'MISS'
+        return set_validators(response, etag, last_modified)
+    
     
     def post(self, request):
         #print(self.request.user.groups.filter(name="Manager").exists())
-        if not request.user.groups.filter(name="Manager").exists():
+        if not is_manager(request.user):
             return Response(
                 {"message" :"You don't have permission to create a menu item."}, 
                 status.HTTP_401_UNAUTHORIZED
@@ -54,55 +113,96 @@ class MenuItemView(generics.ListCreateAPIView):
         
     
     
+def menu_snapshot(request):
+    # The whole menu grouped by category, the same for everyone: the prerendered
+    # files of snapshot.py, without authentication, throttling or serializers.
+    # A plain Django view, DRF's request handling alone would cost more than the rest.
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+    menu = snapshot.get_snapshot()
+    encoding = menu.negotiate(request.headers.get('Accept-Encoding', ''))
+    etag = menu.etags[encoding]
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(menu.bodies[encoding], content_type='application/json')
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    # Clients and proxies keep it but check the ETag on every use
+    response['Cache-Control'] = 'public, no-cache'
+    return response
+
+
 class SingleMenuItem(generics.RetrieveUpdateDestroyAPIView):
-    queryset = MenuItem.objects.all()
+    queryset = MenuItem.objects.select_related('category')
     serializer_class = MenuItemSerializer
     
-    def put(self, request, pk=None):
-        if not request.user.groups.filter(name="Manager").exists():
-            return Response(
-                {"message" :"You don't have permission to update this item."},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-            
+    def get_validators(self, menu_item):
+        # The item and its nested category are all that the representation depends on
+        etag = make_etag(
+            'menuitem', menu_item.pk, menu_item.updated_at.isoformat(),
+            menu_item.category_id, menu_item.category.updated_at.isoformat(),
+            self.request.accepted_media_type,
+        )
+        return etag, timestamp(menu_item.updated_at, menu_item.category.updated_at)
+    
+    def retrieve(self, request, *args, **kwargs):
+        menu_item = self.get_object()
+        etag, last_modified = self.get_validators(menu_item)
+        not_modified = check_preconditions(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        
+        serialized_item = MenuItemSerializer(menu_item)
+        return set_validators(Response(serialized_item.data), etag, last_modified)
+    
+    def update_item(self, request, pk, partial):
         # Get the MenuItem object
-        menu_item = get_object_or_404(MenuItem, id=pk)
+        menu_item = get_object_or_404(self.get_queryset(), pk=pk)
+        
+        # If-Match / If-Unmodified-Since make the write conditional
+        etag, last_modified = self.get_validators(menu_item)
+        precondition_failed = check_preconditions(request, etag, last_modified)
+        if precondition_failed is not None:
+            return precondition_failed
 
         # Serialize the updated data
-        serialized_item = MenuItemSerializer(menu_item, data=request.data)
+        serialized_item = MenuItemSerializer(menu_item, data=request.data, partial=partial)
 
         # Validate and save the updated data
         if serialized_item.is_valid():
             serialized_item.save()
-            return Response(serialized_item.data, status=status.HTTP_200_OK)
+            etag, last_modified = self.get_validators(menu_item)
+            return set_validators(Response(serialized_item.data, status=status.HTTP_200_OK), etag, last_modified)
         else:
             return Response(serialized_item.errors, status=status.HTTP_400_BAD_REQUEST) 
+    
+    def put(self, request, pk=None):
+        if not is_manager(request.user):
+            return Response(
+                {"message" :"You don't have permission to update this item."},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+            
+        return self.update_item(request, pk, partial=False)
         
         
     def patch(self, request, pk=None):
         # Check if the user is in the 'Manager' group
-        if not self.request.user.groups.filter(name="Manager").exists():
+        if not is_manager(self.request.user):
             return Response(
                 {"message" :"You don't have permission to update this item."},
                 status=status.HTTP_401_UNAUTHORIZED
             )
         
-        # Get the MenuItem object
-        menu_item = get_object_or_404(MenuItem, pk=pk)
-
         # Serialize the updated data with partial=True
-        serialized_item = MenuItemSerializer(menu_item, data=request.data, partial=True)
-
-        # Validate and save the updated data
-        if serialized_item.is_valid():
-            serialized_item.save()
-            return Response(serialized_item.data, status=status.HTTP_200_OK)
-        else:
-            return Response(serialized_item.errors, status=status.HTTP_400_BAD_REQUEST)
+        return self.update_item(request, pk, partial=True)
         
     def delete(self, request, pk=None):
         # Check if the user is in the 'Manager' group
-        if not self.request.user.groups.filter(name="Manager").exists():
+        if not is_manager(self.request.user):
             return Response(
                 {"message": "You don't have permission to delete this item."},
                 status=status.HTTP_401_UNAUTHORIZED
@@ -116,6 +216,198 @@ class SingleMenuItem(generics.RetrieveUpdateDestroyAPIView):
 
         return Response({"message": "Menu item deleted successfully."})
 
+class BulkResultsMixin:
+    # Every row gets its own entry in the results, the valid ones are written
+    # together in one transaction and the invalid ones carry their errors.
+    bulk_name = 'rows'
+    
+    def get_rows(self, request):
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({"message": f"Expected a non empty list of {self.bulk_name}."})
+        
+        max_items = getattr(settings, 'BULK_MAX_ITEMS', 500)
+        if len(rows) > max_items:
+            raise ValidationError({"message": f"At most {max_items} {self.bulk_name} can be sent at once."})
+        return rows
+    
+    def get_response(self, results, success_status):
+        failed = sum(1 for result in results if result['status'] >= 400)
+        if not failed:
+            response_status = success_status
+        elif failed == len(results):
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response({"results": results}, status=response_status)
+
+
+class MenuItemBulkView(BulkResultsMixin, generics.GenericAPIView):
+    permission_classes = [IsManager]
+    serializer_class = MenuItemBulkSerializer
+    bulk_name = 'menu items'
+    
+    def check_batch(self, valid, results, items=None):
+        # One query for the titles and one for the categories, instead of one per item
+        categories = Category.objects.in_bulk({data['category_id'] for data in valid.values() if 'category_id' in data})
+        titles = {data['title'] for data in valid.values() if 'title' in data}
+        taken = dict(MenuItem.objects.filter(title__in=titles).values_list('title', 'id'))
+        
+        # Rows of this batch that are being renamed give their current title up,
+        # as long as the rename goes through: a row dropped for an error keeps its
+        # title, which can make another row fail, so this runs until no row fails
+        errors = {}
+        while True:
+            renamed = set()
+            if items is not None:
+                renamed = {
+                    data['id'] for index, data in valid.items()
+                    if index not in errors and 'title' in data and data['title'] != items[data['id']].title
+                }
+            failed = self.get_batch_errors(valid, errors, categories, taken, renamed)
+            if not failed:
+                break
+            errors.update(failed)
+
+        for index, row_errors in errors.items():
+            del valid[index]
+            results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': row_errors}
+        return categories
+
+    def get_batch_errors(self, valid, errors, categories, taken, renamed):
+        # The errors of the rows not already failed
+        failed = {}
+        seen = set()
+        for index, data in valid.items():
+            if index in errors:
+                continue
+            row_errors = {}
+            title = data.get('title')
+            if title is not None:
+                holder = taken.get(title)
+                if title in seen or (holder is not None and holder != data.get('id') and holder not in renamed):
+                    row_errors['title'] = ["This field must be unique."]
+                seen.add(title)
+            if 'category_id' in data and data['category_id'] not in categories:
+                row_errors['category_id'] = ["Category does not exist."]
+            if row_errors:
+                failed[index] = row_errors
+        return failed
+    
+    def post(self, request):
+        rows = self.get_rows(request)
+        results = [None] * len(rows)
+        valid = {}
+        for index, row in enumerate(rows):
+            serialized_item = MenuItemBulkSerializer(data=row)
+            if serialized_item.is_valid():
+                valid[index] = serialized_item.validated_data
+            else:
+                results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': serialized_item.errors}
+                
+        categories = self.check_batch(valid, results)
+        
+        menu_items = []
+        if valid:
+            with transaction.atomic():
+                menu_items = MenuItem.objects.bulk_create([MenuItem(**data) for data in valid.values()])
+                # bulk_create doesn't send post_save
+                transaction.on_commit(catalog.bump_version)
+            
+        for index, menu_item in zip(valid, menu_items):
+            menu_item.category = categories[menu_item.category_id]
+            results[index] = {'index': index, 'status': status.HTTP_201_CREATED, 'data': MenuItemSerializer(menu_item).data}
+            
+        return self.get_response(results, status.HTTP_201_CREATED)
+    
+    def get_ids(self, entries, results):
+        # The valid ids of entries (index -> id sent), validated like the ids of
+        # CartBatchView (no bools, lists...), the others are a 400 in the results
+        id_field = serializers.IntegerField(min_value=1)
+        ids = {}
+        for index, pk in entries.items():
+            try:
+                ids[index] = id_field.run_validation(pk)
+            except ValidationError as error:
+                results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': {'id': error.detail}}
+        return ids
+    
+    def patch(self, request):
+        rows = self.get_rows(request)
+        results = [None] * len(rows)
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                message = f"Invalid data. Expected a dictionary, but got {type(row).__name__}."
+                results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': {'non_field_errors': [message]}}
+        ids = self.get_ids({index: row.get('id', empty) for index, row in enumerate(rows) if isinstance(row, dict)}, results)
+        items = MenuItem.objects.select_related('category').in_bulk(set(ids.values()))
+        
+        valid = {}
+        seen = set()
+        for index, pk in ids.items():
+            row = rows[index]
+            if pk in seen:
+                results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': {'id': ["Duplicated in this request."]}}
+                continue
+            seen.add(pk)
+            
+            if pk not in items:
+                results[index] = {'index': index, 'status': status.HTTP_404_NOT_FOUND, 'errors': {'id': ["No MenuItem matches the given query."]}}
+                continue
+            
+            serialized_item = MenuItemBulkUpdateSerializer(items[pk], data=row, partial=True)
+            if serialized_item.is_valid():
+                valid[index] = serialized_item.validated_data
+            else:
+                results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': serialized_item.errors}
+                
+        categories = self.check_batch(valid, results, items)
+        
+        # Apply the changes in memory, then write them with a single bulk_update
+        now = timezone.now()
+        fields = {'updated_at'}
+        updated = []
+        for index, data in valid.items():
+            menu_item = items[data['id']]
+            for field, value in data.items():
+                if field != 'id':
+                    setattr(menu_item, field, value)
+                    fields.add(field)
+            if 'category_id' in data:
+                menu_item.category = categories[data['category_id']]
+            # bulk_update skips auto_now, the ETags depend on it
+            menu_item.updated_at = now
+            updated.append(menu_item)
+            
+        if updated:
+            with transaction.atomic():
+                MenuItem.objects.bulk_update(updated, sorted(fields))
+                transaction.on_commit(catalog.bump_version)
+            
+        for index, data in valid.items():
+            results[index] = {'index': index, 'status': status.HTTP_200_OK, 'data': MenuItemSerializer(items[data['id']]).data}
+            
+        return self.get_response(results, status.HTTP_200_OK)
+    
+    def delete(self, request):
+        rows = self.get_rows(request)
+        results = [None] * len(rows)
+        ids = self.get_ids(dict(enumerate(rows)), results)
+        
+        with transaction.atomic():
+            existing = set(MenuItem.objects.filter(pk__in=set(ids.values())).values_list('pk', flat=True))
+            MenuItem.objects.filter(pk__in=existing).delete()
+            
+        for index, pk in ids.items():
+            if pk in existing:
+                results[index] = {'index': index, 'status': status.HTTP_204_NO_CONTENT, 'id': pk}
+                # Report every id once
+                existing.discard(pk)
+            else:
+                results[index] = {'index': index, 'status': status.HTTP_404_NOT_FOUND, 'id': pk}
+        return self.get_response(results, status.HTTP_200_OK)
+
+
 class ManagerView(generics.ListCreateAPIView):
     queryset = User.objects.filter(groups__name='Manager')
     serializer_class = UserSerializer
@@ -123,7 +415,7 @@ class ManagerView(generics.ListCreateAPIView):
     search_fields =  ['first_name', 'last_name', 'username']
     
     def get_queryset(self):
-        if not self.request.user.groups.filter(name="Manager").exists():
+        if not is_manager(self.request.user):
             raise PermissionDenied("You don't have permission to access this resource.")
             
         queryset = super().get_queryset()  # Get the initial queryset
@@ -131,7 +423,7 @@ class ManagerView(generics.ListCreateAPIView):
     
     def post(self, request):
         #print(self.request.user.groups.filter(name="Manager").exists())
-        if not self.request.user.groups.filter(name="Manager").exists():
+        if not is_manager(self.request.user):
             return Response(
                 {"message" :"You don't have permission to do this action."}, 
                 status.HTTP_401_UNAUTHORIZED
@@ -162,7 +454,7 @@ class SingleManagerView(generics.DestroyAPIView):
     
     def delete(self, request, pk=None):
         # Check if the user is in the 'Manager' group
-        if not self.request.user.groups.filter(name="Manager").exists():
+        if not is_manager(self.request.user):
             return Response(
                 {"message": "You don't have permission to delete this item."},
                 status=status.HTTP_401_UNAUTHORIZED
@@ -181,7 +473,7 @@ class DelieveryCrewView(generics.ListCreateAPIView):
     serializer_class = UserSerializer
     
     def post(self, request):
-        if not self.request.user.groups.filter(name='Manager').exists():
+        if not is_manager(self.request.user):
             return Response(
                 {"message" : "you don't have permissions to perform this action."},
                 status=status.HTTP_401_UNAUTHORIZED
@@ -204,38 +496,47 @@ class DelieveryCrewView(generics.ListCreateAPIView):
 class SingleDelieveryCrewView(generics.DestroyAPIView):
     queryset = User.objects.filter(groups__name='Delivery Crew')
     serializer_class = UserSerializer
+    permission_classes = [IsManager]
     
     def delete(self, request, pk=None):
-        if not self.request.user.groups.filter(name='Manager'):
-            raise PermissionDenied("You don't have permission to access this resource.")
-            
         user = get_object_or_404(User, id=pk)
         delivery_crew = Group.objects.get(name='Delivery Crew')
         user.groups.remove(delivery_crew)
         return Response({"message": "Removed from delivry crew group."}, status=status.HTTP_204_NO_CONTENT)
         
     
-class CartView(generics.ListCreateAPIView, generics.DestroyAPIView):
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+class CartView(ValuesListMixin, generics.ListCreateAPIView, generics.DestroyAPIView):
+    throttle_classes = [AnonTokenBucketThrottle, UserTokenBucketThrottle]
     serializer_class = CartSerializer
+    values_serializer = CART
     permission_classes = [IsAuthenticated]
     
     #! Find How to check if it not manager or deelivery using id
     #* Better way founded
     
     def get_queryset(self):
-        if self.request.user.groups.filter(name='Manager').exists() or \
-            self.request.user.groups.filter(name='Delivery Crew').exists():
+        if not is_customer(self.request.user):
                 raise PermissionDenied("You don't have permission to access this resource.") 
                 
-        queryset = Cart.objects.filter(user=self.request.user)
-        return queryset
+        # A queryset with the Cart table, a list of lines with the cache (see carts.py)
+        return carts.get_backend().get_lines(self.request.user)
+    
+    def list(self, request, *args, **kwargs):
+        lines = self.get_queryset()
+        if isinstance(lines, QuerySet):
+            return super().list(request, *args, **kwargs)
+        return self.list_lines(lines)
+    
+    def list_lines(self, lines):
+        page = self.paginate_queryset(lines)
+        if page is not None:
+            return self.get_paginated_response(CartSerializer(page, many=True).data)
+        return Response(CartSerializer(lines, many=True).data)
         
     def post(self ,reqest):
         # print(self.request.user.groups.filter(name='Manager').exists())
         # print(self.request.user.groups.filter(name='Manager').exists())
-        if self.request.user.groups.filter(name='Manager').exists() or \
-            self.request.user.groups.filter(name='Delivery Crew').exists():
+        if not is_customer(self.request.user):
                 return Response(
                     {"message" : "you don't have permissions to perform this action."},
                     status=status.HTTP_401_UNAUTHORIZED
@@ -244,103 +545,203 @@ class CartView(generics.ListCreateAPIView, generics.DestroyAPIView):
         cart = self.request.data
         serialized_cart = CartSerializer(data=cart)
         serialized_cart.is_valid(raise_exception=True)
-        serialized_cart.save(user=self.request.user)
-        return Response(serialized_cart.data, status=status.HTTP_201_CREATED)   
+        line = carts.get_backend().add(
+            self.request.user, serialized_cart.validated_data['menuitem_id'], serialized_cart.validated_data['quantity']
+        )
+        return Response(CartSerializer(line).data, status=status.HTTP_201_CREATED)   
     
     def delete(self, request):
-        if self.request.user.groups.filter(name='Manager').exists() or \
-            self.request.user.groups.filter(name='Delivery Crew').exists():
+        if not is_customer(self.request.user):
                 return Response(
                     {"message" : "you don't have permissions to perform this action."},
                     status=status.HTTP_401_UNAUTHORIZED
                 )
         
-        user = request.user
-        # Retrieve all carts for the specified user
-        carts = Cart.objects.filter(user=user)
-
-
-        # Check if any carts exist
-        if carts.exists():
-            # Delete all carts for the specified user
-            carts.delete()
+        # Delete all the lines of the user's cart, if there are any
+        if carts.get_backend().clear(request.user):
             return Response({'message': 'Carts deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
         else:
             return Response({'message': 'No carts found for the specified user'}, status=status.HTTP_404_NOT_FOUND)
     
 
-class OrderView(generics.ListCreateAPIView):
+class CartBatchView(generics.GenericAPIView):
+    throttle_classes = [AnonTokenBucketThrottle, UserTokenBucketThrottle]
+    serializer_class = CartLineSerializer
+    permission_classes = [IsAuthenticated, IsCustomer]
+    
+    # The whole batch is validated first and applied in one transaction, a
+    # single bad line rejects the request and leaves the cart untouched.
+    
+    def get_lines(self, request):
+        serialized_lines = CartLineSerializer(data=request.data, many=True, allow_empty=False)
+        serialized_lines.is_valid(raise_exception=True)
+        
+        lines = {}
+        errors = [{} for _ in serialized_lines.validated_data]
+        for index, line in enumerate(serialized_lines.validated_data):
+            if line['menuitem_id'] in lines:
+                errors[index] = {'menuitem_id': ["Duplicated in this request."]}
+            lines[line['menuitem_id']] = line['quantity']
+        if any(errors):
+            raise ValidationError(errors)
+        return lines
+    
+    def get_ids(self, request):
+        serialized_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+        return set(serialized_ids.run_validation(request.data))
+    
+    def get_cart(self, request, response_status=status.HTTP_200_OK):
+        cart = carts.get_backend().get_lines(request.user)
+        return Response(CartSerializer(cart, many=True).data, status=response_status)
+    
+    def post(self, request):
+        lines = self.get_lines(request)
+        
+        # All the prices in one query
+        prices = dict(MenuItem.objects.filter(pk__in=lines).values_list('pk', 'price'))
+        missing = [pk for pk in lines if pk not in prices]
+        if missing:
+            raise ValidationError({'menuitem_id': [f"Menu item {pk} does not exist." for pk in missing]})
+        
+        carts.get_backend().set_quantities(request.user, lines, prices)
+        return self.get_cart(request, status.HTTP_201_CREATED)
+    
+    def patch(self, request):
+        lines = self.get_lines(request)
+        carts.get_backend().update_quantities(request.user, lines)
+        return self.get_cart(request)
+    
+    def delete(self, request):
+        ids = self.get_ids(request)
+        carts.get_backend().remove(request.user, ids)
+        return self.get_cart(request)
+    
+
+class OrderView(ValuesListMixin, generics.ListCreateAPIView):
     serializer_class = OrderSerializer
+    values_serializer = ORDERS
+    pagination_class = KeysetPagination
+    ordering = ['date']
     ordering_fields = ['total', 'date']
     filterset_fields = ['user', 'status']
     search_fields = ['user', 'delivery_crew'] 
     
 
     def get_queryset(self):
-        if self.request.user.groups.filter(name='Manager').exists():
-            queryset = Order.objects.all()
-        
-        elif self.request.user.groups.filter(name='Delivery Crew').exists():
-            delivery = self.request.user
-            queryset = Order.objects.filter(delivery_crew=delivery)
-        
-        else:
-            user = self.request.user
-            queryset = Order.objects.filter(user=user)
-            
-        return queryset
+        return get_visible_orders(Order.objects.all(), self.request.user)
     
     def post(self, request):
-        # Fetching cart items for the current user
-        cart_items = Cart.objects.filter(user=request.user)
-        # print(cart_items.exists())
-        
-        if cart_items.exists():
-            # Creating an order instance
-            order_instance = Order.objects.create(user=request.user, total=0)  # Assuming total will be updated later
-
-            # Creating order items from cart items
-            order_items_data = []
-            total_price = 0
-            for cart_item in cart_items:
-                order_item_data = {
-                    'order': order_instance,
-                    'menuitem': cart_item.menuitem,
-                    'quantity': cart_item.quantity,
-                    'unit_price': cart_item.unit_price,
-                    'price': cart_item.price
-                }
-                total_price += cart_item.price
-                order_items_data.append(order_item_data)
-
-            # Bulk create order items
-            OrderItem.objects.bulk_create([OrderItem(**data) for data in order_items_data])
+        if getattr(settings, 'QUEUED_CHECKOUT', False):
+            return self.enqueue_checkout(request)
 
-            # Update order total
-            order_instance.total = total_price
-            order_instance.save()
+        # One transaction with a fixed number of queries, see checkout.place_order
+        order_instance = carts.get_backend().checkout(request.user, place_order)
+        if order_instance is None:
+            return Response(
+                {"message":"No items in the Cart"},
+                status=status.HTTP_404_NOT_FOUND
+            )
 
-            # Clear the user's cart after placing the order
-            cart_items.delete()
+        # Serialize the order and return the response
+        serialized_order = OrderSerializer(order_instance)
+        return Response(serialized_order.data, status=status.HTTP_201_CREATED)
 
-            # Serialize the order and return the response
-            serialized_order = OrderSerializer(order_instance)
-            return Response(serialized_order.data, status=status.HTTP_201_CREATED)
-        
-        else:
+    def enqueue_checkout(self, request):
+        # The order is created by the process_checkouts command, the client polls
+        # the Location or waits for the 'checkout' event on /api/orders/events/
+        job = carts.get_backend().checkout(request.user, enqueue)
+        if job is None:
             return Response(
                 {"message":"No items in the Cart"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
+        serialized_job = CheckoutJobSerializer(job)
+        return Response(
+            serialized_job.data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': request.build_absolute_uri(f'{request.path}checkouts/{job.pk}')}
+        )
+
+
+class CheckoutJobView(generics.RetrieveAPIView):
+    # A queued checkout of the user, see checkout.enqueue
+    serializer_class = CheckoutJobSerializer
+
+    def get_object(self):
+        job = get_object_or_404(CheckoutJob, id=self.kwargs.get('pk'))
+        if job.user_id != self.request.user.pk:
+            raise PermissionDenied("You don't have permission to access this resource.")
+        return job
+
+
+class OrderHistoryView(ValuesListMixin, generics.ListAPIView):
+    # The orders of OrderView, the archived ones included (see archive.py), with
+    # the same filters, sorts and pagination
+    queryset = Order.objects.all()
+    serializer_class = OrderSerializer
+    values_serializer = ORDERS
+    pagination_class = KeysetPagination
+    ordering = ['date']
+    ordering_fields = ['total', 'date']
+    filterset_fields = ['user', 'status']
+
+    def list(self, request, *args, **kwargs):
+        querysets = [
+            self.filter_queryset(get_visible_orders(model.objects.all(), request.user))
+            for model in (Order, ArchivedOrder)
+        ]
+        if self.use_values():
+            querysets = [self.values_serializer.get_rows(queryset) for queryset in querysets]
+            serialize = self.values_serializer.to_representation
+        else:
+            serialize = lambda rows: self.get_serializer(rows, many=True).data
+        page = self.paginator.paginate_querysets(querysets, request, view=self)
+        return self.get_paginated_response(serialize(page))
+
+
+class OrderExportView(generics.GenericAPIView):
+    # The whole order history for accounting, streamed as CSV (default) or NDJSON
+    # (?format=ndjson or Accept: application/x-ndjson), see export.py
+    queryset = Order.objects.all()
+    permission_classes = [IsManager]
+    renderer_classes = [CSVRenderer, NDJSONRenderer]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = OrderExportFilter
+    pagination_class = None
+
+    def get(self, request):
+        orders = self.filter_queryset(self.get_queryset())
+        archived_orders = ArchivedOrderExportFilter(
+            request.query_params, queryset=ArchivedOrder.objects.all(), request=request
+        ).qs
+        renderer = request.accepted_renderer
+        rows = export.get_rows(orders, archived_orders)
+        if isinstance(request._request, ASGIRequest):
+            content = export.astream(renderer, rows)
+        else:
+            content = export.stream(renderer, rows)
+
+        response = StreamingHttpResponse(content, content_type=f'{renderer.media_type}; charset={renderer.charset}')
+        response['Content-Disposition'] = f'attachment; filename="orders.{renderer.format}"'
+        return response
+
+
 class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = OrderSerializer
     
+    def get_order(self):
+        # Fetched once per request, both get_queryset and retrieve need it. An
+        # archived order (see archive.py) is still there to read.
+        if not hasattr(self, '_order'):
+            order = Order.objects.filter(id=self.kwargs.get('pk')).first()
+            self._order = order or get_object_or_404(ArchivedOrder, id=self.kwargs.get('pk'))
+        return self._order
+    
     def get_queryset(self):
-        pk = self.kwargs.get('pk')
-        order = get_object_or_404(Order, id=pk)
-        if order.user == self.request.user:
-            querset = OrderItem.objects.filter(order=order)
+        order = self.get_order()
+        if order.user_id == self.request.user.pk:
+            querset = get_order_items(order)
             # print(querset.exists())
             if querset.exists():
                 return querset
@@ -349,12 +750,29 @@ class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
             
         else:
             raise PermissionDenied("You don't have permission to access this resource.") 
+    
+    def retrieve(self, request, *args, **kwargs):
+        order = self.get_order()
+        if order.user_id != request.user.pk:
+            raise PermissionDenied("You don't have permission to access this resource.")
+        
+        # Order items never change after checkout, the order row is enough to validate the cache
+        etag = make_etag('order', order.pk, order.updated_at.isoformat(), request.accepted_media_type)
+        last_modified = timestamp(order.updated_at)
+        not_modified = check_preconditions(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        
+        # get_queryset() holds the order items, the order itself is what OrderSerializer renders
+        self.get_queryset()
+        serialized_order = OrderSerializer(order)
+        return set_validators(Response(serialized_order.data), etag, last_modified)
            
     def put(self, request, pk):
         order = get_object_or_404(Order, id=pk)
         
         # Check if user belongs to 'Manager' group
-        if request.user.groups.filter(name='Manager').exists():
+        if is_manager(request.user):
             # Allow editing of 'status' and 'delivery_crew' attributes
             serialized_order = OrderSerializerforStatusandDelivery(order, data=request.data)
             if serialized_order.is_valid():
@@ -364,7 +782,7 @@ class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
                 return Response(serialized_order.errors, status=status.HTTP_400_BAD_REQUEST)
         
         # If user belongs to 'Delivery Crew' group, allow editing of 'status' only
-        elif request.user.groups.filter(name='Delivery Crew').exists():
+        elif is_delivery_crew(request.user):
             # Allow editing of 'status' attribute only
             serialized_order = OrderSerializerforStatus(order, data=request.data)
             if serialized_order.is_valid():
@@ -378,7 +796,7 @@ class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
         order = get_object_or_404(Order, id=pk)
         
         # Check if user belongs to 'Manager' group
-        if request.user.groups.filter(name='Manager').exists():
+        if is_manager(request.user):
             # Allow editing of 'status' and 'delivery_crew' attributes
             serialized_order = OrderSerializerforStatusandDelivery(order, data=request.data, partial=True)
             if serialized_order.is_valid():
@@ -388,7 +806,7 @@ class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
                 return Response(serialized_order.errors, status=status.HTTP_400_BAD_REQUEST)
         
         # If user belongs to 'Delivery Crew' group, allow editing of 'status' only
-        elif request.user.groups.filter(name='Delivery Crew').exists():
+        elif is_delivery_crew(request.user):
             # Allow editing of 'status' attribute only
             serialized_order = OrderSerializerforStatus(order, data=request.data, partial=True)
             if serialized_order.is_valid():
@@ -400,6 +818,152 @@ class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
     def delete(self, request, pk):
         order = get_object_or_404(Order, id=pk)
         order.delete()
+
+
+class OrderBulkView(BulkResultsMixin, generics.GenericAPIView):
+    permission_classes = [IsManager | IsDeliveryCrew]
+    serializer_class = OrderBulkUpdateSerializer
+    bulk_name = 'orders'
+    
+    # The rules of SingleOrderView for many orders at once: managers set the status
+    # and the delivery crew, a crew member only the status of the orders assigned
+    # to them. The changes are written with one UPDATE per distinct value of each
+    # field, whatever the number of orders.
+    
+    def patch(self, request):
+        rows = self.get_rows(request)
+        results = [None] * len(rows)
+        manager = is_manager(request.user)
         
+        valid = {}
+        seen = set()
+        for index, row in enumerate(rows):
+            serialized_row = OrderBulkUpdateSerializer(data=row)
+            if not serialized_row.is_valid():
+                results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': serialized_row.errors}
+                continue
+            data = serialized_row.validated_data
+            if data['id'] in seen:
+                results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': {'id': ["Duplicated in this request."]}}
+                continue
+            seen.add(data['id'])
+            if 'delivery_crew' in data and not manager:
+                results[index] = {'index': index, 'status': status.HTTP_403_FORBIDDEN, 'errors': {'delivery_crew': ["Only managers can assign the delivery crew."]}}
+                continue
+            valid[index] = data
             
+        # The assigned users must be delivery crew, one query for all of them
+        crew_ids = {data['delivery_crew'] for data in valid.values() if data.get('delivery_crew') is not None}
+        if crew_ids:
+            crew_ids = set(User.objects.filter(pk__in=crew_ids, groups__name=DELIVERY_CREW).values_list('pk', flat=True))
+        
+        with transaction.atomic():
+            orders = Order.objects.select_for_update().only('pk', 'user', 'status', 'delivery_crew').in_bulk(
+                [data['id'] for data in valid.values()]
+            )
+            updates = {}
+            for index, data in list(valid.items()):
+                order = orders.get(data['id'])
+                if order is None:
+                    results[index] = {'index': index, 'status': status.HTTP_404_NOT_FOUND, 'errors': {'id': ["No Order matches the given query."]}}
+                elif not manager and order.delivery_crew_id != request.user.pk:
+                    results[index] = {'index': index, 'status': status.HTTP_403_FORBIDDEN, 'errors': {'id': ["You don't have permission to access this resource."]}}
+                elif data.get('delivery_crew') is not None and data['delivery_crew'] not in crew_ids:
+                    results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': {'delivery_crew': ["User is not a delivery crew member."]}}
+                else:
+                    for field in ('status', 'delivery_crew'):
+                        if field in data:
+                            updates.setdefault((field, data[field]), []).append(order.pk)
+                    continue
+                del valid[index]
             
+            # QuerySet.update() skips auto_now, the order ETags depend on updated_at
+            now = timezone.now()
+            for (field, value), ids in updates.items():
+                Order.objects.filter(pk__in=ids).update(**{Order._meta.get_field(field).attname: value, 'updated_at': now})
+            
+            for data in valid.values():
+                order = orders[data['id']]
+                order.status = data.get('status', order.status)
+                if 'delivery_crew' in data:
+                    order.delivery_crew_id = data['delivery_crew']
+                events.order_changed(order.pk, order.user_id, order.delivery_crew_id, order.status)
+                
+        for index, data in valid.items():
+            order = orders[data['id']]
+            results[index] = {
+                'index': index,
+                'status': status.HTTP_200_OK,
+                'data': {'id': order.pk, 'status': order.status, 'delivery_crew': order.delivery_crew_id},
+            }
+        return self.get_response(results, status.HTTP_200_OK)
+
+
+class OrderDispatchView(generics.GenericAPIView):
+    # Assigns the pending orders to the least loaded delivery crew (see dispatch.py)
+    permission_classes = [IsManager]
+    serializer_class = DispatchSerializer
+
+    def post(self, request):
+        serialized_dispatch = DispatchSerializer(data=request.data)
+        serialized_dispatch.is_valid(raise_exception=True)
+        loads, assigned = dispatch.dispatch(
+            getattr(settings, 'DISPATCH_BATCH_SIZE', 500), serialized_dispatch.validated_data.get('limit')
+        )
+        if not loads:
+            raise ValidationError({"message": "There is no delivery crew to dispatch to."})
+
+        return Response({
+            'assigned': sum(assigned.values()),
+            'crew': [
+                {'delivery_crew': crew_id, 'assigned': assigned[crew_id], 'open_orders': loads[crew_id] + assigned[crew_id]}
+                for crew_id in sorted(loads)
+            ],
+        })
+
+
+class SalesAnalyticsView(generics.GenericAPIView):
+    # Revenue and orders per day, the totals and the best selling menu items
+    # (?top=, 10 by default) between ?date_after= and ?date_before=, read from
+    # the daily rollups (see sales.py)
+    queryset = DailySales.objects.order_by('date')
+    permission_classes = [IsManager]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = SalesFilter
+    pagination_class = None
+    max_top = 100
+
+    def get(self, request):
+        try:
+            top = int(request.query_params.get('top', 10))
+        except ValueError:
+            raise ValidationError({'top': 'A whole number is required.'})
+        if not 0 <= top <= self.max_top:
+            raise ValidationError({'top': f'Must be between 0 and {self.max_top}.'})
+
+        days = self.filter_queryset(self.get_queryset())
+        items = self.filter_queryset(DailyItemSales.objects.all())
+        totals = days.aggregate(orders=Sum('orders'), revenue=Sum('revenue'))
+        top_items = (
+            items.values('menuitem_id', 'menuitem__title')
+            .annotate(orders=Sum('orders'), quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .order_by('-quantity', '-revenue', 'menuitem_id')[:top]
+        )
+        return Response({
+            'days': DailySalesSerializer(days, many=True).data,
+            'total': SalesTotalSerializer({'orders': totals['orders'] or 0, 'revenue': totals['revenue'] or 0}).data,
+            'top_menu_items': TopMenuItemSerializer(top_items, many=True).data,
+        })
+
+
+class MetricsView(generics.GenericAPIView):
+    # Per-view histograms of the request timings of this worker process, see timing.py
+    permission_classes = [IsManager]
+    pagination_class = None
+
+    def get(self, request):
+        return Response(timing.metrics.snapshot())
+
+    def delete(self, request):
+        timing.metrics.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)